@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""Benchmark the OTP parsers on large synthetic exports.
+
+Exports are generated with ``generate_sample.write_large_sample`` (and kept in
+``--data-dir`` for the next run), then each one is parsed end to end in a fresh
+worker process, so the peak RSS reported is that of a single conversion. Every
+case is timed per phase by the parsers' own profiler (the ``profile`` setting,
+see ``ofxstatement_otp.profiling`` for the phases); ``load`` is only there
+with the openpyxl reader.
+
+Results are written as JSON. Pass an earlier result file as ``--baseline`` to
+flag cases that got slower or bigger than the tolerance allows.
+
+Usage:
+    python manual_test/benchmark.py --rows 10000 100000 -o bench.json
+    python manual_test/benchmark.py --rows 100000 --layout legacy \\
+        --baseline bench.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import generate_sample  # noqa: E402
+from ofxstatement import ofx  # noqa: E402
+
+from ofxstatement_otp import otp, otp_legacy  # noqa: E402
+from ofxstatement_otp.profiling import PHASES, peak_rss_mb  # noqa: E402
+
+READERS = (otp.READER_OPENPYXL, otp.READER_XML)
+
+# Keys identifying a case across result files.
+CASE_KEYS = ("layout", "reader", "rows", "accounts", "hidden_ratio", "pending_ratio")
+
+
+def sample_path(data_dir: str, case: Dict[str, Any]) -> str:
+    name = "{layout}-{rows}r-{accounts}a-h{hidden_ratio}-p{pending_ratio}.xlsx"
+    return os.path.join(data_dir, name.format(**case))
+
+
+def ensure_sample(data_dir: str, case: Dict[str, Any]) -> str:
+    """Generate the export for ``case`` unless it is already there."""
+    path = sample_path(data_dir, case)
+    if not os.path.exists(path):
+        os.makedirs(data_dir, exist_ok=True)
+        started = time.perf_counter()
+        tmp_path = path + ".tmp"
+        generate_sample.write_large_sample(
+            tmp_path,
+            case["rows"],
+            accounts=case["accounts"],
+            hidden_ratio=case["hidden_ratio"],
+            pending_ratio=case["pending_ratio"],
+            layout=case["layout"],
+        )
+        os.replace(tmp_path, path)
+        print(
+            "Generated %s in %.1fs" % (path, time.perf_counter() - started),
+            file=sys.stderr,
+        )
+    return path
+
+
+def run_case(path: str, layout: str, reader: str) -> Dict[str, Any]:
+    """Convert ``path`` once, returning the per-phase timings, the number of
+    statement lines and the peak RSS."""
+    # profiled: the report is logged on the OTP logger, unconfigured here
+    settings = {"profile": "yes"}
+    if layout == generate_sample.LAYOUT_CURRENT:
+        parser_class: Any = otp.OtpXlsxParser
+        settings["reader"] = reader
+    else:
+        parser_class = otp_legacy.OtpLegacyXlsxParser
+
+    started = time.perf_counter()
+    parser = parser_class(path, settings)
+    profiler = parser.profiler
+    with profiler.deferred():
+        statement = parser.parse()
+        with profiler.phase("ofx"):
+            with tempfile.TemporaryFile("w", encoding="utf-8") as out:
+                out.write(ofx.OfxWriter(statement).toxml(encoding="utf-8"))
+    total = time.perf_counter() - started
+
+    phases = profiler.to_json()["phases"]
+    return {
+        "lines": len(statement.lines),
+        "seconds": dict(
+            {
+                phase: phases[phase]["seconds"] if phase in phases else None
+                for phase in PHASES
+            },
+            total=total,
+        ),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_isolated(path: str, layout: str, reader: str) -> Dict[str, Any]:
+    """``run_case`` in a fresh process, so peak RSS is not inherited from
+    earlier cases (or from generating the sample)."""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+        return pool.submit(run_case, path, layout, reader).result()
+
+
+def cases(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    found = []
+    for layout in args.layout:
+        # The legacy parser has no reader choice.
+        readers = args.reader if layout == generate_sample.LAYOUT_CURRENT else ["-"]
+        for rows in args.rows:
+            for reader in readers:
+                found.append(
+                    {
+                        "layout": layout,
+                        "reader": reader,
+                        "rows": rows,
+                        "accounts": args.accounts,
+                        "hidden_ratio": args.hidden_ratio,
+                        "pending_ratio": args.pending_ratio,
+                    }
+                )
+    return found
+
+
+def environment() -> Dict[str, Any]:
+    from importlib.metadata import version
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "ofxstatement_otp": version("ofxstatement-otp"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def _case_key(result: Dict[str, Any]) -> tuple:
+    return tuple(result[key] for key in CASE_KEYS)
+
+
+def regressions(
+    results: List[Dict[str, Any]], baseline: Dict[str, Any], tolerance: float
+) -> List[str]:
+    """Describe the results whose total time or peak RSS exceed the matching
+    baseline case by more than ``tolerance`` (a fraction)."""
+    previous = {_case_key(result): result for result in baseline["results"]}
+    found = []
+    for result in results:
+        before = previous.get(_case_key(result))
+        if before is None:
+            continue
+        for label, now, then in (
+            ("time", result["seconds"]["total"], before["seconds"]["total"]),
+            ("peak RSS", result["peak_rss_mb"], before["peak_rss_mb"]),
+        ):
+            if now and then and now > then * (1 + tolerance):
+                found.append(
+                    "%s %s, %d rows: %s %.2f -> %.2f (+%.0f%%)"
+                    % (
+                        result["layout"],
+                        result["reader"],
+                        result["rows"],
+                        label,
+                        then,
+                        now,
+                        (now / then - 1) * 100,
+                    )
+                )
+    return found
+
+
+def format_result(result: Dict[str, Any]) -> str:
+    seconds = result["seconds"]
+    phases = " ".join(
+        "%s=%.2f" % (phase, seconds[phase])
+        for phase in PHASES
+        if seconds[phase] is not None
+    )
+    rss = result["peak_rss_mb"]
+    return "%-7s %-8s %8d rows  %7.2fs  %9.0f rows/s  %s MB  (%s)" % (
+        result["layout"],
+        result["reader"],
+        result["rows"],
+        seconds["total"],
+        result["rows_per_second"],
+        "%.0f" % rss if rss is not None else "?",
+        phases,
+    )
+
+
+def make_args_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[10000], help="rows per export"
+    )
+    parser.add_argument("--accounts", type=int, default=3)
+    parser.add_argument("--hidden-ratio", type=float, default=0.01)
+    parser.add_argument("--pending-ratio", type=float, default=0.01)
+    parser.add_argument(
+        "--layout",
+        nargs="+",
+        choices=(generate_sample.LAYOUT_CURRENT, generate_sample.LAYOUT_LEGACY),
+        default=[generate_sample.LAYOUT_CURRENT, generate_sample.LAYOUT_LEGACY],
+    )
+    parser.add_argument(
+        "--reader",
+        nargs="+",
+        choices=READERS,
+        default=list(READERS),
+        help="readers to benchmark the current layout with",
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=os.path.join(tempfile.gettempdir(), "ofxstatement-otp-benchmark"),
+        help="where generated exports are kept between runs",
+    )
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="earlier JSON results to compare against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="allowed slowdown/growth over the baseline (default 0.2 = 20%%)",
+    )
+    return parser
+
+
+def main(argv=None) -> int:
+    args = make_args_parser().parse_args(argv)
+    results = []
+    for case in cases(args):
+        path = ensure_sample(args.data_dir, case)
+        result = dict(case, **run_isolated(path, case["layout"], case["reader"]))
+        result["rows_per_second"] = case["rows"] / result["seconds"]["total"]
+        results.append(result)
+        print(format_result(result))
+
+    report = dict(environment(), results=results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        found = regressions(results, baseline, args.tolerance)
+        for line in found:
+            print("REGRESSION: " + line)
+        if found:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,7 +8,7 @@ export:
   * a metadata preamble (title + labelled cells for account numbers and the
     query start/end dates)
   * a transaction table header, followed by data rows
-  * 11 columns (A-K) in the order of the ``Transaction`` dataclass in
+  * 11 columns (A-K) in the order of the ``Transaction`` record in
     ``src/ofxstatement_otp/otp.py``
   * two distinct account numbers (so the ``account`` filter can be exercised),
     plus a hidden row and a no-booking-date row for the skip paths
@@ -16,11 +16,19 @@ export:
 It is NOT real bank data -- all account numbers, names and amounts are made up.
 It doubles as the committable, anonymized fixture the tests run against.
 
+``write_large_sample`` produces exports of any size for benchmarking (see
+``manual_test/benchmark.py``): N accounts, a share of hidden and pending rows,
+in the current or the legacy (pre-2026-June) layout.
+
 Usage:
     python manual_test/generate_sample.py [output.xlsx]
+    python manual_test/generate_sample.py --rows 100000 [--accounts 3]
+        [--hidden-ratio 0.01] [--pending-ratio 0.01] [--layout legacy] out.xlsx
 """
-import sys
-from datetime import datetime
+import argparse
+import random
+from datetime import datetime, timedelta
+from typing import Iterator, List, Tuple
 
 from openpyxl import Workbook
 
@@ -43,7 +51,7 @@ PREAMBLE = [
     (None, None),
 ]
 
-# Transaction table header (row order must match the Transaction dataclass).
+# Transaction table header (row order must match the Transaction record).
 HEADER = [
     "Számlaszám",
     "Ellenoldali számlaszám",
@@ -103,11 +111,170 @@ def build_workbook() -> Workbook:
     return wb
 
 
+LAYOUT_CURRENT = "current"
+LAYOUT_LEGACY = "legacy"
+
+# Legacy (pre-2026-June) table header, columns A-L.
+LEGACY_HEADER = [
+    "Tranzakció dátuma",
+    "Könyvelés dátuma",
+    "Megnevezés",
+    "Be/Ki",
+    "Partner neve",
+    "Partner számlaszáma",
+    "Kategória",
+    "Közlemény",
+    "Számla neve",
+    "Számlaszám",
+    "Összeg",
+    "Pénznem",
+]
+
+# (payee, description, category) to draw the large samples' rows from.
+MERCHANTS = [
+    (row[2], row[3], row[5]) for row in ROWS if row[0] == ACCOUNT_CHECKING
+] + [(row[2], row[3], row[5]) for row in ROWS if row[0] == ACCOUNT_CREDIT]
+
+
+def account_numbers(n: int) -> List[str]:
+    """``n`` fake account numbers, starting with the two of the small sample."""
+    accounts = [ACCOUNT_CHECKING, ACCOUNT_CREDIT][:n]
+    for i in range(len(accounts), n):
+        accounts.append(f"{55555555 + i:08d}-{66666666 + i:08d}")
+    return accounts
+
+
+def synthetic_rows(
+    rows: int,
+    accounts: int = 2,
+    hidden_ratio: float = 0.0,
+    pending_ratio: float = 0.0,
+    seed: int = 0,
+) -> Iterator[Tuple[list, bool]]:
+    """Yield ``(values, hidden)`` for ``rows`` made-up transactions, in the
+    current layout's column order. Pending rows have no booking date. The
+    first row is always a plain booked one. Deterministic for a given seed."""
+    rng = random.Random(seed)
+    numbers = account_numbers(accounts)
+    start = datetime(2024, 1, 1)
+    for i in range(rows):
+        payee, description, category = rng.choice(MERCHANTS)
+        when = start + timedelta(minutes=i * 7 + rng.randrange(7))
+        pending = i > 0 and rng.random() < pending_ratio
+        hidden = i > 0 and rng.random() < hidden_ratio
+        yield [
+            numbers[i % accounts],
+            "",
+            payee,
+            description,
+            f"{category} {i}",
+            category,
+            f"{when:%Y%m%d%H%M}{i:08d}",
+            when.strftime("%Y-%m-%d %H:%M:%S"),
+            None if pending else when.strftime("%Y-%m-%d"),
+            round(rng.uniform(-200000, 50000), 2),
+            "HUF",
+        ], hidden
+
+
+def to_legacy(values: list) -> list:
+    """Reorder a current-layout row into the legacy columns A-L."""
+    (
+        account_no,
+        partner_account,
+        partner_name,
+        description,
+        memo,
+        category,
+        _,
+        transaction_date,
+        booking_date,
+        amount,
+        currency,
+    ) = values
+    return [
+        transaction_date,
+        booking_date,
+        description,
+        "J" if amount > 0 else "K",
+        partner_name,
+        partner_account or None,
+        category,
+        memo,
+        "Lakossági számla",
+        account_no,
+        amount,
+        currency,
+    ]
+
+
+def write_large_sample(
+    path,
+    rows: int,
+    accounts: int = 2,
+    hidden_ratio: float = 0.0,
+    pending_ratio: float = 0.0,
+    layout: str = LAYOUT_CURRENT,
+    seed: int = 0,
+) -> None:
+    """Write a synthetic export of ``rows`` transactions to ``path``.
+
+    The workbook is streamed out in openpyxl's write-only mode, so even a
+    million rows take little memory to generate.
+    """
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(TRANSACTIONS_SHEET_NAME)
+    if layout == LAYOUT_CURRENT:
+        numbers = account_numbers(accounts)
+        for label, value in PREAMBLE:
+            if label == "Számlaszám":
+                value = "[" + ", ".join(numbers) + "]"
+            ws.append([label, value])
+        ws.append(HEADER)
+        row_no = len(PREAMBLE) + 1
+    elif layout == LAYOUT_LEGACY:
+        ws.append(LEGACY_HEADER)
+        row_no = 1
+    else:
+        raise ValueError(f"Unknown layout {layout!r}")
+
+    for values, hidden in synthetic_rows(
+        rows, accounts, hidden_ratio, pending_ratio, seed
+    ):
+        row_no += 1
+        if hidden:
+            # must be set before the row is streamed out
+            ws.row_dimensions[row_no].hidden = True
+        ws.append(values if layout == LAYOUT_CURRENT else to_legacy(values))
+    wb.save(path)
+
+
 def main() -> None:
-    out = sys.argv[1] if len(sys.argv) > 1 else "manual_test/sample.xlsx"
-    wb = build_workbook()
-    wb.save(out)
-    print(f"Wrote sample OTP export to {out}")
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("output", nargs="?", default="manual_test/sample.xlsx")
+    parser.add_argument(
+        "--rows", type=int, default=None, help="write a large synthetic export"
+    )
+    parser.add_argument("--accounts", type=int, default=2)
+    parser.add_argument("--hidden-ratio", type=float, default=0.0)
+    parser.add_argument("--pending-ratio", type=float, default=0.0)
+    parser.add_argument(
+        "--layout", choices=(LAYOUT_CURRENT, LAYOUT_LEGACY), default=LAYOUT_CURRENT
+    )
+    args = parser.parse_args()
+
+    if args.rows is None:
+        build_workbook().save(args.output)
+    else:
+        write_large_sample(
+            args.output,
+            args.rows,
+            accounts=args.accounts,
+            hidden_ratio=args.hidden_ratio,
+            pending_ratio=args.pending_ratio,
+            layout=args.layout,
+        )
+    print(f"Wrote sample OTP export to {args.output}")
 
 
 if __name__ == "__main__":
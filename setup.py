@@ -37,14 +37,18 @@ setup(
     packages=find_packages("src"),
     package_dir={"": "src"},
     entry_points={
+        "console_scripts": ["ofxstatement-otp = ofxstatement_otp.cli:run"],
         "ofxstatement": [
             "otp = ofxstatement_otp.otp:OtpPlugin",
             "otp_legacy = ofxstatement_otp.otp_legacy:OtpLegacyPlugin",
-        ]
+        ],
     },
     python_requires=">=3.9",
-    install_requires=["ofxstatement>=0.9.0", "openpyxl>=3.0"],
-    extras_require={"dev": ["pytest", "pytest-cov", "mypy", "black"]},
+    install_requires=["ofxstatement>=0.9.0", "openpyxl>=3.0", "platformdirs>=2.5"],
+    extras_require={
+        "dev": ["pytest", "pytest-cov", "mypy", "black"],
+        "parquet": ["pyarrow"],
+    },
     include_package_data=True,
     zip_safe=True,
 )
@@ -0,0 +1,167 @@
+"""Parsing exports from asyncio code without blocking the event loop.
+
+``get_parser(...).parse()`` reads the whole workbook before it returns, which
+on a large export stalls an event loop for seconds. ``LineStream`` runs the
+parser in an executor thread instead and hands its statement lines to the
+loop in batches, as they are produced::
+
+    stream = LineStream("statement.xlsx", {"account": "1177"})
+    async for lines in stream:
+        await store(stream.statement.account_id, lines)
+
+  * Backpressure: the parser gets at most ``max_batches`` batches ahead of
+    the consumer, then waits; a slow consumer holds at most
+    ``batch_size * max_batches`` lines in memory, however large the export.
+  * Cancellation: when the consuming task is cancelled, or the iteration is
+    closed early (``aclose``, or leaving an ``async with aclosing(...)``
+    block), the parser stops at its next batch and its thread is released.
+  * Errors raised by the parser are raised by the iteration.
+  * Incremental state (the ``incremental`` setting) is saved once the
+    iteration has run to its end, i.e. the consumer is done with the last
+    batch; a stream that fails or is closed early saves none.
+
+The parser is pure Python, so it still takes turns with the loop for the GIL;
+the loop stays responsive (it runs at least every ``sys.getswitchinterval()``)
+but coroutines run slower while a parse is in progress. Pass a dedicated
+``ThreadPoolExecutor`` to keep parses from taking up the loop's default one.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import Executor
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from ofxstatement.statement import Statement, StatementLine
+
+from ofxstatement_otp.detect import open_export
+from ofxstatement_otp.profiling import deferred
+
+# Statement lines per batch handed to the loop.
+BATCH_SIZE = 1000
+# Batches the parser may produce ahead of the consumer.
+MAX_BATCHES = 4
+
+# Marks the end of the lines.
+_END = object()
+
+
+class LineStream:
+    """The statement lines of one export (of either format), parsed in an
+    executor thread and iterated in batches.
+
+    ``plugin`` and ``statement`` (the statement without its lines: account,
+    currency, dates) are set once the export is opened, before the first
+    batch. A stream can be iterated once.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        settings: Optional[Dict] = None,
+        batch_size: int = BATCH_SIZE,
+        max_batches: int = MAX_BATCHES,
+        executor: Optional[Executor] = None,
+    ):
+        self.path = path
+        self.settings = dict(settings or {})
+        self.batch_size = batch_size
+        self.executor = executor
+        self.plugin: Optional[str] = None
+        self.statement: Optional[Statement] = None
+        self._slots = threading.Semaphore(max_batches)
+        self._stopped = threading.Event()
+        # whether the consumer got to the end of the lines
+        self._consumed = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: "Optional[asyncio.Queue[Any]]" = None
+
+    def __aiter__(self) -> AsyncIterator[List[StatementLine]]:
+        return self._batches()
+
+    async def _batches(self) -> AsyncIterator[List[StatementLine]]:
+        if self._loop is not None:
+            raise RuntimeError("A LineStream can only be iterated once")
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        producer = self._loop.run_in_executor(self.executor, self._produce)
+        try:
+            while True:
+                item = await self._queue.get()
+                if item is _END:
+                    self._consumed = True
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                self._slots.release()
+                yield item
+        finally:
+            self._stopped.set()
+            # wake the parser if it is waiting for a slot
+            self._slots.release()
+            await producer
+
+    def _send(self, item: Any) -> None:
+        assert self._loop is not None and self._queue is not None
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, item)
+
+    def _put(self, batch: List[StatementLine]) -> bool:
+        """Hand ``batch`` to the loop once there is room for it; return
+        whether to go on."""
+        self._slots.acquire()
+        if self._stopped.is_set():
+            return False
+        self._send(batch)
+        return True
+
+    def _produce(self) -> None:
+        # runs in the executor
+        state = None
+        try:
+            self.plugin, parser = open_export(self.path, self.settings)
+            self.statement = parser.statement
+            state = parser.state
+            with deferred(parser.profiler):
+                complete = self._produce_lines(parser)
+        except BaseException as e:
+            complete = False
+            self._send(e)
+        else:
+            if complete:
+                self._send(_END)
+        if state is not None:
+            # the consumer is done with the lines once the iteration ends
+            self._stopped.wait()
+            if complete and self._consumed:
+                state.commit()
+            else:
+                state.rollback()
+
+    def _produce_lines(self, parser) -> bool:
+        """Hand the lines of ``parser`` to the loop; return whether they all
+        went."""
+        batch: List[StatementLine] = []
+        for record in parser.split_records():
+            if self._stopped.is_set():
+                return False
+            line = parser.parse_record(record)
+            line.assert_valid()
+            batch.append(line)
+            if len(batch) >= self.batch_size:
+                if not self._put(batch):
+                    return False
+                batch = []
+        return not batch or self._put(batch)
+
+
+async def parse(
+    path: str, settings: Optional[Dict] = None, executor: Optional[Executor] = None
+) -> Statement:
+    """The statement of the export at ``path`` (of either format), like
+    ``parse()`` of its plugin's parser but without blocking the loop."""
+    stream = LineStream(path, settings, executor=executor)
+    lines: List[StatementLine] = []
+    async for batch in stream:
+        lines.extend(batch)
+    assert stream.statement is not None
+    stream.statement.lines = lines
+    return stream.statement
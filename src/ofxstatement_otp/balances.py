@@ -0,0 +1,131 @@
+"""Opening and closing balances from a known anchor balance.
+
+OTP exports carry no balances, so without help the statements have none and
+an importer has to sum an account's whole history to get one. Given the
+balance of an account before the export's transactions -- the ``balance``
+setting, which is that of the statement's account (the first in the export,
+unless the ``account`` filter picks one), or the balance saved by the previous
+incremental run -- the parser
+adds up the amounts as the records stream past and fills in the statement's
+``start_balance`` and ``end_balance``; no extra pass over the rows is made.
+
+With ``incremental`` on, the closing balance of each account is saved in its
+state file with the watermark, and becomes the opening balance of the next
+run. Since that run emits only the new transactions, every import costs the
+new rows only. The stored balance takes precedence over the setting, which
+only seeds accounts that have none yet. Without ``incremental`` nothing is
+saved: an export converted twice would otherwise be counted twice.
+"""
+
+import logging
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+from ofxstatement.statement import Statement
+
+from ofxstatement_otp.state import IncrementalState
+
+logger = logging.getLogger("OTP")
+
+
+def _balance_setting(settings) -> Optional[Decimal]:
+    value = str(settings.get("balance", "")).strip()
+    if not value:
+        return None
+    try:
+        return Decimal(value.replace(" ", ""))
+    except InvalidOperation:
+        raise ValueError(f"Invalid balance {value!r}; use a number like 1234.50")
+
+
+class RunningBalances:
+    """Per-account opening balances and running totals of one parse."""
+
+    def __init__(
+        self,
+        anchor: Optional[Decimal] = None,
+        state: Optional[IncrementalState] = None,
+    ):
+        self.anchor = anchor
+        self.state = state
+        # the account the anchor is the balance of: the first one read
+        self.anchor_account: Optional[str] = None
+        # account -> (opening, closing); None when the opening is unknown
+        self.accounts: Dict[str, Optional[Tuple[Decimal, Decimal]]] = {}
+        # set by callers that write one statement per account, each with its
+        # balances(): the statement passed to running() is then not an output
+        self.per_account = False
+
+    @classmethod
+    def from_settings(
+        cls, settings, state: Optional[IncrementalState] = None
+    ) -> Optional["RunningBalances"]:
+        """Return the balances configured by the ``balance`` setting and the
+        incremental ``state``, or ``None`` when neither is set."""
+        anchor = _balance_setting(settings)
+        if anchor is None and state is None:
+            return None
+        return cls(anchor, state)
+
+    def opening(self, account_id: str) -> Optional[Decimal]:
+        """The balance of ``account_id`` before the first record of this
+        parse: the stored one, or the ``balance`` setting for the first
+        account asked about."""
+        if self.anchor_account is None:
+            self.anchor_account = account_id
+        if self.state is not None:
+            stored = self.state.account(account_id).balance
+            if stored is not None:
+                return stored
+        if account_id == self.anchor_account:
+            return self.anchor
+        return None
+
+    def running(self, records: Iterable[Any], statement: Statement) -> Iterator[Any]:
+        """Pass the records (with ``account_no`` and ``amount``) through,
+        adding up the amounts per account; set the balances of ``statement``
+        once they have all been read."""
+        accounts = self.accounts
+        for record in records:
+            account_id = str(record.account_no)
+            if account_id not in accounts:
+                opening = self.opening(account_id)
+                accounts[account_id] = None if opening is None else (opening, opening)
+            balances = accounts[account_id]
+            if balances is not None and record.amount is not None:
+                opening, closing = balances
+                accounts[account_id] = (opening, closing + record.amount)
+                if self.state is not None:
+                    # saved with the watermark by IncrementalState.commit
+                    self.state.account(account_id).balance = closing + record.amount
+            yield record
+        self.fill(statement)
+
+    def balances(
+        self, account_id: Optional[str]
+    ) -> Tuple[Optional[Decimal], Optional[Decimal]]:
+        """``(start_balance, end_balance)`` of ``account_id`` once all the
+        records have been read."""
+        if account_id is None:
+            return None, None
+        if account_id not in self.accounts:
+            # no transactions: the balance did not move
+            opening = self.opening(account_id)
+            return opening, opening
+        return self.accounts[account_id] or (None, None)
+
+    def fill(self, statement: Statement) -> None:
+        """Set the balances of ``statement``, unless its lines came from
+        more than one account (their sum is no account's balance)."""
+        if len(self.accounts) > 1:
+            if self.anchor is not None and not self.per_account:
+                logger.warning(
+                    "Ignoring the balance setting: the statement has transactions "
+                    "of %d accounts; pick one with the account setting",
+                    len(self.accounts),
+                )
+            else:
+                logger.debug("Not setting balances of a statement of several accounts")
+            return
+        account_id = next(iter(self.accounts), statement.account_id)
+        statement.start_balance, statement.end_balance = self.balances(account_id)
@@ -0,0 +1,217 @@
+"""On-disk cache of parse results, keyed by the export's content.
+
+Reconverting an unchanged export gives the same transactions, so both parsers
+can store what they parsed and, on the next run, skip opening the workbook
+altogether. Enable it with the ``cache`` setting: ``yes`` for the default
+location under the user cache directory, or a directory path. ``cache_size``
+bounds the cache in megabytes (default 512); the least recently used entries
+are evicted first.
+
+An entry is keyed by the SHA-256 of the file, the parser, the package and cache
+format versions and the plugin settings (other than the ``profile`` ones), so a
+changed file, a new release or a different ``account`` filter never hits a
+stale entry. Entries are pickled,
+zlib-compressed tuples of the statement metadata and the parsed records; the
+cache directory is private to the user, like ofxstatement's own config.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import pickle
+import zlib
+from dataclasses import fields
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ofxstatement.statement import Statement
+
+from ofxstatement_otp import profiling
+from ofxstatement_otp.files import cache_directory, directory_setting, write_atomic
+
+logger = logging.getLogger("OTP")
+
+# Bump when the stored layout (or the meaning of a cached record) changes.
+CACHE_FORMAT = 3
+
+DEFAULT_MAX_MB = 512
+ENTRY_SUFFIX = ".cache"
+
+# Statement attributes restored from a cache entry.
+STATEMENT_FIELDS = (
+    "account_id",
+    "currency",
+    "start_balance",
+    "start_date",
+    "end_balance",
+    "end_date",
+)
+
+
+def _package_version() -> str:
+    from importlib.metadata import PackageNotFoundError, version
+
+    try:
+        return version("ofxstatement-otp")
+    except PackageNotFoundError:  # pragma: no cover - running from a checkout
+        return "0"
+
+
+def file_digest(filename) -> str:
+    """SHA-256 of a file's content, read in chunks. ``filename`` may also be
+    a seekable binary file object, which is read from its start and left
+    where it was."""
+    digest = hashlib.sha256()
+    if hasattr(filename, "read"):
+        position = filename.tell()
+        filename.seek(0)
+        try:
+            for chunk in iter(lambda: filename.read(1 << 20), b""):
+                digest.update(chunk)
+        finally:
+            filename.seek(position)
+        return digest.hexdigest()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ParseCache:
+    """A directory of cached parse results with LRU eviction by size."""
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_MB << 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_settings(cls, settings) -> Optional["ParseCache"]:
+        """Return the cache configured by the ``cache``/``cache_size``
+        settings, or ``None`` when caching is off."""
+        directory = directory_setting(settings, "cache", cache_directory)
+        if directory is None:
+            return None
+        max_mb = int(settings.get("cache_size", DEFAULT_MAX_MB))
+        return cls(directory, max_mb << 20)
+
+    def key(self, filename, parser: str, settings) -> str:
+        """Cache key: ``<file digest>-<digest of everything else>``."""
+        variant = json.dumps(
+            [
+                CACHE_FORMAT,
+                _package_version(),
+                parser,
+                sorted(
+                    (str(k), str(v))
+                    for k, v in dict(settings).items()
+                    if k not in profiling.SETTINGS
+                ),
+            ]
+        )
+        variant_digest = hashlib.sha256(variant.encode()).hexdigest()[:16]
+        return f"{file_digest(filename)}-{variant_digest}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def load(self, key: str) -> Optional[Tuple[Dict[str, Any], List[tuple]]]:
+        """Return ``(statement metadata, records)`` for ``key``, or ``None``."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                metadata, records = pickle.loads(zlib.decompress(f.read()))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("Ignoring unreadable cache entry %s: %s", path, e)
+            return None
+        try:
+            os.utime(path)  # mark as recently used
+        except FileNotFoundError:
+            pass  # evicted by another conversion meanwhile: still a hit
+        logger.debug("Cache hit: %s", path)
+        return metadata, records
+
+    def store(self, key: str, metadata: Dict[str, Any], records: List[tuple]) -> None:
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        path = self._path(key)
+        data = zlib.compress(
+            pickle.dumps((metadata, records), protocol=pickle.HIGHEST_PROTOCOL)
+        )
+        write_atomic(path, data)
+        logger.debug("Cached %d records in %s", len(records), path)
+        self.evict()
+
+    def recording(
+        self, key: str, statement: Statement, records: Iterable[Any]
+    ) -> Iterator[Any]:
+        """Pass ``records`` (dataclass instances) through, storing them as
+        tuples with the statement metadata once they have all been consumed."""
+        rows = []
+        for record in records:
+            rows.append(tuple(getattr(record, f.name) for f in fields(record)))
+            yield record
+        metadata = {name: getattr(statement, name) for name in STATEMENT_FIELDS}
+        self.store(key, metadata, rows)
+
+    def _entries(self) -> List[os.DirEntry]:
+        try:
+            return [
+                entry
+                for entry in os.scandir(self.directory)
+                if entry.name.endswith(ENTRY_SUFFIX)
+            ]
+        except FileNotFoundError:
+            return []
+
+    def _stats(self) -> List[Tuple[str, os.stat_result]]:
+        """``(path, stat)`` of the entries, skipping any that vanish while
+        being looked at (conversions sharing the cache evict concurrently)."""
+        stats = []
+        for entry in self._entries():
+            try:
+                stats.append((entry.path, entry.stat()))
+            except FileNotFoundError:
+                pass
+        return stats
+
+    def evict(self) -> int:
+        """Delete the least recently used entries until the cache fits in
+        ``max_bytes``; return how many were deleted."""
+        stats = sorted(self._stats(), key=lambda item: item[1].st_mtime)
+        total = sum(stat.st_size for _, stat in stats)
+        evicted = 0
+        for path, stat in stats:
+            if total <= self.max_bytes:
+                break
+            total -= stat.st_size
+            if _remove(path):
+                evicted += 1
+        return evicted
+
+    def invalidate(self, filenames: Optional[Iterable[str]] = None) -> int:
+        """Delete the entries of ``filenames`` (every parser and settings
+        variant), or all entries; return how many were deleted."""
+        digests = None
+        if filenames is not None:
+            digests = {file_digest(filename) for filename in filenames}
+        removed = 0
+        for entry in self._entries():
+            if digests is None or entry.name.split("-", 1)[0] in digests:
+                if _remove(entry.path):
+                    removed += 1
+        return removed
+
+
+def _remove(path: str) -> bool:
+    """Remove ``path``; return ``False`` if another process already did."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def restore_statement(statement: Statement, metadata: Dict[str, Any]) -> None:
+    for name in STATEMENT_FIELDS:
+        setattr(statement, name, metadata.get(name))
@@ -0,0 +1,85 @@
+"""Conversion of cell values to the dates and amounts of transaction records.
+
+Dates come as ``YYYY-MM-DD HH:MM:SS`` / ``YYYY-MM-DD`` text (or, now and
+then, as native datetime cells), amounts as numbers. Converting them is the
+bulk of the per-row work, so:
+
+  * well-formed text is parsed with ``datetime.fromisoformat``, some fifty
+    times faster than ``strptime``; anything else still goes through
+    ``strptime``, so what is accepted and the errors raised do not change;
+  * booking dates repeat heavily (every transaction of a day shares one), so
+    each distinct date string is parsed once and the same ``datetime`` object
+    is shared by all its records;
+  * float amounts go through their shortest repr, exactly as before, with the
+    ``Decimal`` of each distinct value remembered as well.
+"""
+
+from datetime import datetime
+from decimal import Decimal
+from functools import lru_cache
+
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DATE_FORMAT = "%Y-%m-%d"
+
+# Distinct booking dates / float amounts whose conversion is remembered.
+DATE_CACHE_SIZE = 4096
+AMOUNT_CACHE_SIZE = 4096
+
+
+def _parse_text_datetime(text: str) -> datetime:
+    # Only the exact fixed layout takes the fast path: newer Pythons'
+    # fromisoformat also accepts other ISO 8601 forms (time zones, week
+    # dates) that strptime would reject.
+    if (
+        len(text) == 19
+        and text[4] == text[7] == "-"
+        and text[10] == " "
+        and text[13] == text[16] == ":"
+    ):
+        try:
+            return datetime.fromisoformat(text)
+        except ValueError:
+            pass
+    return datetime.strptime(text, DATETIME_FORMAT)
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def _parse_text_date(text: str) -> datetime:
+    if len(text) == 10 and text[4] == text[7] == "-":
+        try:
+            return datetime.fromisoformat(text)
+        except ValueError:
+            pass
+    return datetime.strptime(text, DATE_FORMAT)
+
+
+def parse_datetime(value) -> datetime:
+    """A transaction datetime: a native datetime cell, or text in
+    ``DATETIME_FORMAT``."""
+    if isinstance(value, datetime):
+        return value
+    return _parse_text_datetime(value)
+
+
+def parse_date(value) -> datetime:
+    """A booking date: a native datetime cell, or text in ``DATE_FORMAT``."""
+    if isinstance(value, datetime):
+        return value
+    return _parse_text_date(value)
+
+
+@lru_cache(maxsize=AMOUNT_CACHE_SIZE)
+def _float_to_decimal(value: float) -> Decimal:
+    return Decimal(repr(value))
+
+
+def to_decimal(value) -> Decimal:
+    """Convert a cell amount. Floats go through their shortest repr, so 12.5
+    stays 12.5 rather than becoming its binary expansion."""
+    kind = type(value)
+    if kind is int:
+        return Decimal(value)
+    # not zeros: -0.0 == 0.0, so they would share a cache entry
+    if kind is float and value:
+        return _float_to_decimal(value)
+    return Decimal(str(value))
@@ -0,0 +1,696 @@
+"""``ofxstatement-otp``: bulk conversions that ``ofxstatement convert`` can't do.
+
+``ofxstatement convert`` writes exactly one OFX per invocation. The commands
+here work on whole OTP exports at once, e.g. writing one OFX per account from a
+single read of a bundled export, converting a directory of exports across a
+pool of worker processes, or merging overlapping exports into one statement per
+account. Settings come from the same ofxstatement config file
+(``-t`` names the section), so ``BIC``, ``account`` and ``encoding`` behave
+exactly as they do for ``convert``.
+"""
+
+import argparse
+import glob
+import logging
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    MutableMapping,
+    Optional,
+    Set,
+    Tuple,
+)
+
+from ofxstatement import configuration, ofx, ui
+from ofxstatement.statement import Statement, StatementLine
+
+from ofxstatement_otp import columnar, otp, otp_legacy
+from ofxstatement_otp.cache import ParseCache
+from ofxstatement_otp.detect import FORMAT_CURRENT, FORMAT_LEGACY, open_export
+from ofxstatement_otp.files import account_filename, cache_directory
+from ofxstatement_otp.ofxstream import write_streaming
+from ofxstatement_otp.otp import OtpPlugin
+from ofxstatement_otp.profiling import deferred, profiled
+from ofxstatement_otp.state import IncrementalState, committing
+
+# The record type each plugin's parser yields from split_records.
+RECORD_TYPES = {FORMAT_CURRENT: otp.Transaction, FORMAT_LEGACY: otp_legacy.Transaction}
+
+log = logging.getLogger(__name__)
+
+
+def load_settings(config_path: Optional[str], section: Optional[str]) -> Dict:
+    """Return the settings of ``section`` in the ofxstatement config file.
+
+    Without a section the plugin defaults are used, as with ``convert`` when
+    there is no config file.
+    """
+    if not section:
+        return {}
+    config: Optional[MutableMapping] = configuration.read(config_path)
+    if config is None or section not in config:
+        raise SystemExit(
+            "No section '%s' in config file. Edit configuration using "
+            "ofxstatement edit-config and add section [%s]." % (section, section)
+        )
+    return dict(config[section])
+
+
+def ofx_text(
+    statement: Statement, pretty: bool = False, encoding: str = "utf-8"
+) -> str:
+    """``statement`` as OFX, the same way ``ofxstatement convert`` writes it."""
+    statement.assert_valid()
+    return ofx.OfxWriter(statement).toxml(pretty=pretty, encoding=encoding)
+
+
+def write_ofx(
+    statement: Statement, path: str, pretty: bool = False, encoding: str = "utf-8"
+) -> None:
+    """Write ``statement`` to ``path`` the same way ``ofxstatement convert``
+    does."""
+    text = ofx_text(statement, pretty=pretty, encoding=encoding)
+    with open(path, "w", encoding=encoding) as out:
+        out.write(text)
+
+
+def stream_ofx(
+    statement: Statement,
+    lines: Iterable[StatementLine],
+    path: str,
+    pretty: bool = False,
+    encoding: str = "utf-8",
+) -> int:
+    """Write ``statement`` to ``path`` like ``write_ofx``, but with ``lines``
+    streamed in as they come rather than held in ``statement.lines``; return
+    the number of lines. The file only appears once it is complete."""
+    tmp_path = path + ".part"
+    try:
+        with open(tmp_path, "w", encoding=encoding) as out:
+            written = write_streaming(
+                statement, lines, out, pretty=pretty, encoding=encoding
+            )
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return written
+
+
+def parser_lines(parser) -> Iterator[StatementLine]:
+    """Stream the validated statement lines of ``parser``, as its ``parse``
+    would collect them."""
+    for record in parser.split_records():
+        line = parser.parse_record(record)
+        line.assert_valid()
+        yield line
+
+
+def read_statement(parser) -> Statement:
+    """The statement of ``parser`` with all its lines, like its ``parse``,
+    but with the incremental state left for the caller to commit once the
+    statement is written."""
+    statement = parser.statement
+    statement.lines.extend(parser_lines(parser))
+    return statement
+
+
+def split(args: argparse.Namespace) -> int:
+    settings = load_settings(args.config, args.type)
+    parser = OtpPlugin(ui.UI(), settings).get_parser(args.input)
+    if args.period:
+        return split_periods(args, parser, settings)
+    with deferred(parser.profiler), committing(parser.state):
+        statements = parser.parse_accounts()
+        if not statements:
+            log.warning("No transactions found in %s", args.input)
+            return 0
+
+        os.makedirs(args.output_dir, exist_ok=True)
+        encoding = settings.get("encoding", "utf-8")
+        for account_id, statement in statements.items():
+            path = os.path.join(
+                args.output_dir, account_filename(args.input, account_id)
+            )
+            with profiled(parser.profiler, "ofx"):
+                write_ofx(statement, path, pretty=args.pretty, encoding=encoding)
+            log.info(
+                "Wrote %d line%s for account %s to %s",
+                len(statement.lines),
+                "s" if len(statement.lines) != 1 else "",
+                account_id,
+                path,
+            )
+    return 0
+
+
+def split_periods(args: argparse.Namespace, parser, settings: Dict) -> int:
+    # imported here: only split --period needs the shard writer
+    from ofxstatement_otp.shards import write_shards
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    with deferred(parser.profiler), committing(parser.state):
+        with profiled(parser.profiler, "ofx"):
+            shards = write_shards(
+                parser,
+                args.output_dir,
+                args.input,
+                args.period,
+                pretty=args.pretty,
+                encoding=settings.get("encoding", "utf-8"),
+            )
+    if not shards:
+        log.warning("No transactions found in %s", args.input)
+    for shard in shards:
+        log.info(
+            "Wrote %d line%s for account %s, %s to %s",
+            shard.lines,
+            "s" if shard.lines != 1 else "",
+            shard.account_id,
+            shard.period,
+            shard.path,
+        )
+    return 0
+
+
+@dataclass
+class ConversionResult:
+    """Outcome of converting one export in a batch."""
+
+    input: str
+    output: str
+    plugin: Optional[str] = None
+    lines: int = 0
+    seconds: float = 0.0
+    error: Optional[str] = None
+
+
+def find_exports(inputs: Iterable[str]) -> List[str]:
+    """Expand directories (to the ``*.xlsx`` files in them) and glob patterns
+    into a sorted, de-duplicated list of exports."""
+    found: Set[str] = set()
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*.xlsx")
+        found.update(path for path in glob.glob(pattern) if os.path.isfile(path))
+    return sorted(found)
+
+
+def output_paths(exports: Iterable[str], output_dir: str, suffix: str) -> List[str]:
+    """The output file in ``output_dir`` of each export: its name with
+    ``suffix``, numbered (``x-2.ofx``) where two exports share a name, so
+    that no output overwrites another."""
+    taken: Set[str] = set()
+    paths = []
+    for path in exports:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name, number = stem + suffix, 1
+        # case-insensitive: some file systems are
+        while name.lower() in taken:
+            number += 1
+            name = "%s-%d%s" % (stem, number, suffix)
+        if number > 1:
+            log.warning("%s: writing %s, as the name is taken", path, name)
+        taken.add(name.lower())
+        paths.append(os.path.join(output_dir, name))
+    return paths
+
+
+def convert_export(
+    path: str, output: str, settings: Dict, pretty: bool = False
+) -> ConversionResult:
+    """Convert one export to ``output``. Runs inside a worker process, so
+    failures are reported in the result rather than raised."""
+    result = ConversionResult(input=path, output=output)
+    started = time.perf_counter()
+    try:
+        result.plugin, parser = open_export(path, settings)
+        with deferred(parser.profiler), committing(parser.state):
+            # streamed: the lines are never all in memory
+            with profiled(parser.profiler, "ofx"):
+                result.lines = stream_ofx(
+                    parser.statement,
+                    parser_lines(parser),
+                    output,
+                    pretty=pretty,
+                    encoding=settings.get("encoding", "utf-8"),
+                )
+    except Exception as e:
+        result.error = "%s: %s" % (type(e).__name__, e)
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def convert(args: argparse.Namespace) -> int:
+    settings = load_settings(args.config, args.type)
+    result = convert_export(args.input, args.output, settings, pretty=args.pretty)
+    if result.error:
+        log.error("%s: %s", result.input, result.error)
+        return 2
+    log.info(
+        "%s: %d lines (%s) in %.2fs -> %s",
+        result.input,
+        result.lines,
+        result.plugin,
+        result.seconds,
+        result.output,
+    )
+    return 0
+
+
+def batch(args: argparse.Namespace) -> int:
+    settings = load_settings(args.config, args.type)
+    exports = find_exports(args.inputs)
+    if not exports:
+        log.error("No OTP exports found in %s", ", ".join(args.inputs))
+        return 1
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    outputs = output_paths(exports, args.output_dir, ".ofx")
+
+    # imported here: the process pool machinery is only needed by batch
+    from concurrent.futures import ProcessPoolExecutor
+
+    started = time.perf_counter()
+    # One workbook per task: XLSX decoding is CPU-bound, so it scales across
+    # processes, not threads.
+    with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        results = list(
+            pool.map(
+                convert_export,
+                exports,
+                outputs,
+                [settings] * len(exports),
+                [args.pretty] * len(exports),
+            )
+        )
+    elapsed = time.perf_counter() - started
+
+    failed = 0
+    for result in results:
+        if result.error:
+            failed += 1
+            log.error("%s: %s", result.input, result.error)
+        else:
+            log.info(
+                "%s: %d lines (%s) in %.2fs -> %s",
+                result.input,
+                result.lines,
+                result.plugin,
+                result.seconds,
+                result.output,
+            )
+    log.info(
+        "Converted %d of %d exports (%d lines) in %.2fs",
+        len(results) - failed,
+        len(results),
+        sum(result.lines for result in results),
+        elapsed,
+    )
+    return 2 if failed else 0
+
+
+def export_lines(
+    path: str, settings: Dict, state: Optional[IncrementalState] = None
+) -> Iterator[Tuple[str, Optional[str], StatementLine]]:
+    """Stream ``(account id, currency, line)`` for every transaction of the
+    export at ``path``, in either format (with ``state`` as its incremental
+    state, if given)."""
+    _, parser = open_export(path, settings, state)
+    with deferred(parser.profiler):
+        for record in parser.split_records():
+            line = parser.parse_record(record)
+            line.assert_valid()
+            yield str(record.account_no), record.currency, line
+
+
+def merge(args: argparse.Namespace) -> int:
+    # imported here, like the process pool in batch: sqlite3 is merge-only
+    from ofxstatement_otp.merge import MergeIndex
+
+    settings = load_settings(args.config, args.type)
+    exports = find_exports(args.inputs)
+    if not exports:
+        log.error("No OTP exports found in %s", ", ".join(args.inputs))
+        return 1
+    os.makedirs(args.output_dir, exist_ok=True)
+    # one incremental state for all the exports: each is compared against
+    # the ones before it, and it is committed once the merged files are written
+    state = IncrementalState.from_settings(settings)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index_path = args.index or os.path.join(tmp_dir, "merge.sqlite")
+        with MergeIndex(index_path) as index, committing(state):
+            failed = 0
+            for path in exports:
+                try:
+                    added = index.add(export_lines(path, settings, state))
+                except Exception as e:
+                    failed += 1
+                    log.error("%s: %s: %s", path, type(e).__name__, e)
+                    continue
+                log.info("%s: %d new lines", path, added)
+
+            encoding = settings.get("encoding", "utf-8")
+            for account_id, currency, count in index.accounts():
+                statement = Statement(
+                    bank_id=settings.get("BIC", "OTPVHUHB"),
+                    account_id=account_id,
+                    currency=currency or "HUF",
+                )
+                statement.start_date, statement.end_date = index.date_range(account_id)
+                output = os.path.join(
+                    args.output_dir, account_filename("merged", account_id)
+                )
+                stream_ofx(
+                    statement,
+                    index.lines(account_id),
+                    output,
+                    pretty=args.pretty,
+                    encoding=encoding,
+                )
+                log.info(
+                    "Wrote %d lines for account %s to %s", count, account_id, output
+                )
+    return 2 if failed else 0
+
+
+def export(args: argparse.Namespace) -> int:
+    settings = load_settings(args.config, args.type)
+    exports = find_exports(args.inputs)
+    if not exports:
+        log.error("No OTP exports found in %s", ", ".join(args.inputs))
+        return 1
+    fmt = columnar.resolve_format(args.format)
+    write = columnar.WRITERS[fmt]
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    failed = 0
+    for path, output in zip(exports, output_paths(exports, args.output_dir, "." + fmt)):
+        started = time.perf_counter()
+        try:
+            plugin, parser = open_export(path, settings)
+            with deferred(parser.profiler), committing(parser.state):
+                written = write(parser.split_records(), RECORD_TYPES[plugin], output)
+        except Exception as e:
+            failed += 1
+            log.error("%s: %s: %s", path, type(e).__name__, e)
+            continue
+        log.info(
+            "%s: %d transactions (%s) in %.2fs -> %s",
+            path,
+            written,
+            plugin,
+            time.perf_counter() - started,
+            output,
+        )
+    return 2 if failed else 0
+
+
+def serve(args: argparse.Namespace) -> int:
+    # imported here: the server and its pool are only needed by serve
+    from ofxstatement_otp.server import ConversionService, make_server
+
+    settings = load_settings(args.config, args.type)
+    with ConversionService(
+        settings, jobs=args.jobs, queue_size=args.queue, timeout=args.timeout
+    ) as service:
+        server = make_server(
+            service,
+            host=args.host,
+            port=args.port,
+            socket_path=args.socket,
+            allow_paths=args.allow_paths,
+            max_upload_mb=args.max_upload,
+        )
+        log.info(
+            "Serving on %s (%d workers, queue of %d)",
+            args.socket or "http://%s:%d" % (args.host, args.port),
+            service.jobs,
+            service.queue_size,
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # also removes the socket the server created, if any
+            server.server_close()
+    return 0
+
+
+def invalidate_cache(args: argparse.Namespace) -> int:
+    if args.cache_dir:
+        cache = ParseCache(args.cache_dir)
+    else:
+        settings = load_settings(args.config, args.type)
+        cache = ParseCache.from_settings(settings) or ParseCache(cache_directory())
+    removed = cache.invalidate(args.files or None)
+    log.info(
+        "Removed %d cache entr%s from %s",
+        removed,
+        "y" if removed == 1 else "ies",
+        cache.directory,
+    )
+    return 0
+
+
+def _add_settings_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "-c",
+        "--config",
+        metavar="myconfig.ini",
+        default=None,
+        help="custom config file to use",
+    )
+    parser.add_argument(
+        "-t",
+        "--type",
+        default=None,
+        help="config file section to take the plugin settings from",
+    )
+
+
+def _add_output_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "-p",
+        "--pretty",
+        action="store_true",
+        default=False,
+        help="produce pretty xml with nested tags properly indented.",
+    )
+
+
+def make_args_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Bulk conversion of OTP Bank XLSX exports to OFX."
+    )
+    parser.add_argument(
+        "-d",
+        "--debug",
+        action="store_true",
+        default=False,
+        help="show debugging information",
+    )
+    subparsers = parser.add_subparsers(title="action")
+
+    # split
+    parser_split = subparsers.add_parser(
+        "split", help="write one OFX per account from a single (current) export"
+    )
+    _add_settings_arguments(parser_split)
+    _add_output_arguments(parser_split)
+    parser_split.add_argument(
+        "--period",
+        choices=("month", "quarter"),
+        default=None,
+        help="also split each account by booking month or quarter, into "
+        "<input>-<account>-<period>.ofx files",
+    )
+    parser_split.add_argument("input", help="OTP export (XLSX) to process")
+    parser_split.add_argument(
+        "output_dir", help="directory to write <input>-<account>.ofx files to"
+    )
+    parser_split.set_defaults(func=split)
+
+    # convert
+    parser_convert = subparsers.add_parser(
+        "convert",
+        help="convert one export (current or legacy) like ofxstatement convert, "
+        "saving the incremental state once the OFX is written",
+    )
+    _add_settings_arguments(parser_convert)
+    _add_output_arguments(parser_convert)
+    parser_convert.add_argument("input", help="OTP export (XLSX) to convert")
+    parser_convert.add_argument("output", help="OFX file to write")
+    parser_convert.set_defaults(func=convert)
+
+    # batch
+    parser_batch = subparsers.add_parser(
+        "batch", help="convert many exports (current or legacy) in parallel"
+    )
+    _add_settings_arguments(parser_batch)
+    _add_output_arguments(parser_batch)
+    parser_batch.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of worker processes (default: one per CPU)",
+    )
+    parser_batch.add_argument(
+        "-o",
+        "--output-dir",
+        required=True,
+        help="directory to write <input>.ofx files to",
+    )
+    parser_batch.add_argument(
+        "inputs", nargs="+", help="OTP exports: files, directories or glob patterns"
+    )
+    parser_batch.set_defaults(func=batch)
+
+    # merge
+    parser_merge = subparsers.add_parser(
+        "merge",
+        help="merge overlapping exports into one de-duplicated OFX per account",
+    )
+    _add_settings_arguments(parser_merge)
+    _add_output_arguments(parser_merge)
+    parser_merge.add_argument(
+        "-o",
+        "--output-dir",
+        required=True,
+        help="directory to write merged-<account>.ofx files to",
+    )
+    parser_merge.add_argument(
+        "--index",
+        default=None,
+        help="SQLite file to keep the merged lines in between runs "
+        "(default: a temporary one)",
+    )
+    parser_merge.add_argument(
+        "inputs", nargs="+", help="OTP exports: files, directories or glob patterns"
+    )
+    parser_merge.set_defaults(func=merge)
+
+    # export
+    parser_export = subparsers.add_parser(
+        "export",
+        help="write every field of the transactions to Parquet or CSV files",
+    )
+    _add_settings_arguments(parser_export)
+    parser_export.add_argument(
+        "-f",
+        "--format",
+        choices=(columnar.FORMAT_AUTO, columnar.FORMAT_PARQUET, columnar.FORMAT_CSV),
+        default=columnar.FORMAT_AUTO,
+        help="output format (default: parquet if pyarrow is installed, else csv)",
+    )
+    parser_export.add_argument(
+        "-o",
+        "--output-dir",
+        required=True,
+        help="directory to write <input>.parquet/.csv files to",
+    )
+    parser_export.add_argument(
+        "inputs", nargs="+", help="OTP exports: files, directories or glob patterns"
+    )
+    parser_export.set_defaults(func=export)
+
+    # serve
+    parser_serve = subparsers.add_parser(
+        "serve",
+        help="run a local conversion server with warm worker processes",
+    )
+    _add_settings_arguments(parser_serve)
+    parser_serve.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="address to listen on (default: %(default)s)",
+    )
+    parser_serve.add_argument(
+        "--port",
+        type=int,
+        default=8765,
+        help="port to listen on (default: %(default)s)",
+    )
+    parser_serve.add_argument(
+        "--socket",
+        default=None,
+        help="listen on this Unix socket instead of TCP",
+    )
+    parser_serve.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=None,
+        help="number of worker processes (default: one per CPU)",
+    )
+    parser_serve.add_argument(
+        "--queue",
+        type=int,
+        default=32,
+        help="conversions that may wait for a worker before requests are "
+        "turned away with 503 (default: %(default)s)",
+    )
+    parser_serve.add_argument(
+        "--timeout",
+        type=float,
+        default=300.0,
+        help="seconds a conversion may take, queueing included (default: %(default)s)",
+    )
+    parser_serve.add_argument(
+        "--max-upload",
+        type=int,
+        default=64,
+        metavar="MB",
+        help="largest export accepted, in MB (default: %(default)s)",
+    )
+    parser_serve.add_argument(
+        "--allow-paths",
+        action="store_true",
+        default=False,
+        help="also convert exports named by a path on this machine (?path=)",
+    )
+    parser_serve.set_defaults(func=serve)
+
+    # invalidate-cache
+    parser_invalidate = subparsers.add_parser(
+        "invalidate-cache",
+        help="drop cached parse results (of the given exports, or all of them)",
+    )
+    _add_settings_arguments(parser_invalidate)
+    parser_invalidate.add_argument(
+        "--cache-dir",
+        default=None,
+        help="cache directory (default: the 'cache' setting, or the user cache)",
+    )
+    parser_invalidate.add_argument(
+        "files", nargs="*", help="exports whose cache entries to drop"
+    )
+    parser_invalidate.set_defaults(func=invalidate_cache)
+
+    return parser
+
+
+def run(argv=None) -> int:
+    parser = make_args_parser()
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        format="%(levelname)s: %(message)s",
+        level=logging.DEBUG if args.debug else logging.INFO,
+    )
+
+    if not hasattr(args, "func"):
+        parser.print_usage()
+        parser.exit(1)
+
+    return args.func(args)
@@ -0,0 +1,142 @@
+"""Write parsed transactions as Parquet or CSV, for analytics.
+
+OFX keeps only what a bank statement needs; the category, the partner account
+and the raw description of a transaction are lost on the way. The writers here
+take the parsers' ``Transaction`` records instead, every field of them, and
+stream them out in batches: Parquet through ``pyarrow`` (the ``parquet``
+extra) when it is installed, CSV otherwise.
+"""
+
+import csv
+import itertools
+from datetime import datetime
+from decimal import Decimal
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    get_type_hints,
+)
+
+FORMAT_PARQUET = "parquet"
+FORMAT_CSV = "csv"
+FORMAT_AUTO = "auto"
+
+# Records per Parquet row group / CSV write.
+BATCH_SIZE = 50000
+
+# Parquet type of Decimal amounts: OTP amounts have at most two decimals.
+AMOUNT_PRECISION = 20
+AMOUNT_SCALE = 4
+
+
+def have_pyarrow() -> bool:
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def resolve_format(fmt: str) -> str:
+    """``auto`` -> ``parquet`` if pyarrow is installed, else ``csv``."""
+    if fmt == FORMAT_AUTO:
+        return FORMAT_PARQUET if have_pyarrow() else FORMAT_CSV
+    if fmt == FORMAT_PARQUET and not have_pyarrow():
+        raise RuntimeError(
+            "Parquet output needs pyarrow: pip install ofxstatement-otp[parquet]"
+        )
+    return fmt
+
+
+def _batches(records: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(records)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def _field_kind(field_type: Any) -> type:
+    """``datetime``, ``Decimal`` or ``str``: how a record field is stored."""
+    for kind in (datetime, Decimal):
+        if field_type is kind or kind in getattr(field_type, "__args__", ()):
+            return kind
+    return str
+
+
+def _columns(record_type: type) -> List[Tuple[str, type]]:
+    """``(field name, kind)`` of a record dataclass, in field order."""
+    return [
+        (name, _field_kind(hint)) for name, hint in get_type_hints(record_type).items()
+    ]
+
+
+def _as_text(value: Any) -> Optional[str]:
+    return None if value is None or value == "" else str(value)
+
+
+def write_csv(
+    records: Iterable[Any], record_type: type, path: str, batch_size: int = BATCH_SIZE
+) -> int:
+    """Write ``records`` (``record_type`` dataclass instances) to a CSV file
+    with a header row; return the number of records written. Dates are written
+    as ``YYYY-MM-DD HH:MM:SS``, amounts as exact decimals and missing values as
+    empty fields."""
+    columns = _columns(record_type)
+    names = [name for name, _ in columns]
+    written = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(names)
+        for batch in _batches(records, batch_size):
+            writer.writerows(
+                [
+                    "" if value is None else value
+                    for value in (getattr(record, name) for name in names)
+                ]
+                for record in batch
+            )
+            written += len(batch)
+    return written
+
+
+def write_parquet(
+    records: Iterable[Any], record_type: type, path: str, batch_size: int = BATCH_SIZE
+) -> int:
+    """Write ``records`` (``record_type`` dataclass instances) to a Parquet
+    file, one row group per batch; return the number of records written."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = _columns(record_type)
+    arrow_types = {
+        datetime: pa.timestamp("us"),
+        Decimal: pa.decimal128(AMOUNT_PRECISION, AMOUNT_SCALE),
+        str: pa.string(),
+    }
+    converters: List[Callable[[Any], Any]] = [
+        _as_text if kind is str else (lambda value: value) for _, kind in columns
+    ]
+    schema = pa.schema([(name, arrow_types[kind]) for name, kind in columns])
+    written = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in _batches(records, batch_size):
+            arrays = [
+                pa.array(
+                    [convert(getattr(record, name)) for record in batch],
+                    type=schema.field(name).type,
+                )
+                for (name, _), convert in zip(columns, converters)
+            ]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            written += len(batch)
+    return written
+
+
+WRITERS = {FORMAT_PARQUET: write_parquet, FORMAT_CSV: write_csv}
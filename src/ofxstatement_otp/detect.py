@@ -0,0 +1,111 @@
+"""Tell current and legacy OTP exports apart without loading the workbook.
+
+Picking the wrong plugin used to cost a full workbook load before failing.
+``detect_format`` instead peeks at the first rows of the ``Tranzakciók`` sheet
+through ``xlsx.iter_rows``, which streams the sheet XML and reads only the
+shared strings those rows use, so it takes about the same time for any file
+size.
+"""
+
+import itertools
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, Type, Union
+from zipfile import BadZipFile
+
+from ofxstatement import ui
+
+from ofxstatement_otp import otp, otp_legacy
+from ofxstatement_otp.cells import DATE_FORMAT, DATETIME_FORMAT
+from ofxstatement_otp.xlsx import iter_rows, open_source
+
+logger = logging.getLogger("OTP")
+
+# Plugin names, as registered in setup.py.
+FORMAT_CURRENT = "otp"
+FORMAT_LEGACY = "otp_legacy"
+
+PLUGINS: Dict[str, Union[Type[otp.OtpPlugin], Type[otp_legacy.OtpLegacyPlugin]]] = {
+    FORMAT_CURRENT: otp.OtpPlugin,
+    FORMAT_LEGACY: otp_legacy.OtpLegacyPlugin,
+}
+
+# How many rows to look at. The current format's preamble is well within this.
+SNIFF_ROWS = 30
+
+# Preamble labels that only the current format has in column A.
+PREAMBLE_LABELS = frozenset({otp.LABEL_START_DATE, otp.LABEL_END_DATE})
+
+
+def _matches(value: Any, fmt: str) -> bool:
+    if not isinstance(value, str):
+        return False
+    try:
+        datetime.strptime(value, fmt)
+    except ValueError:
+        return False
+    return True
+
+
+def classify(rows: List[List[Any]]) -> Optional[str]:
+    """Classify an export from its first rows (row 1 first, blank rows
+    included as empty lists); ``None`` when neither layout matches."""
+    for cells in rows:
+        a, b = (cells + [None, None])[:2]
+        if a == otp.HEADER_ACCOUNT_NO and b == otp.HEADER_PARTNER_ACCOUNT:
+            return FORMAT_CURRENT
+        if a in PREAMBLE_LABELS:
+            return FORMAT_CURRENT
+
+    # Legacy: data from row 2, with the transaction datetime in A and the
+    # booking date in B as text, and no more than the twelve columns A-L.
+    if len(rows) >= otp_legacy.FIRST_DATA_ROW:
+        cells = rows[otp_legacy.FIRST_DATA_ROW - 1] + [None, None]
+        if (
+            len(cells) - 2 <= otp_legacy.N_COLUMNS
+            and _matches(cells[0], DATETIME_FORMAT)
+            and _matches(cells[1], DATE_FORMAT)
+        ):
+            return FORMAT_LEGACY
+    return None
+
+
+def sniff_rows(source, limit: int = SNIFF_ROWS) -> List[List[Any]]:
+    """Return the raw values of the first ``limit`` rows of the transactions
+    sheet, with blank rows as empty lists."""
+    rows: List[List[Any]] = []
+    stream = iter_rows(source, otp.TRANSACTIONS_SHEET_NAME)
+    try:
+        for row_no, values, _ in itertools.islice(stream, limit):
+            if row_no > limit:
+                break
+            rows.extend([] for _ in range(row_no - 1 - len(rows)))
+            rows.append(values)
+    finally:
+        stream.close()
+    return rows
+
+
+def detect_format(source) -> Optional[str]:
+    """Return the plugin name (``otp`` or ``otp_legacy``) for the export at
+    ``source``, or ``None`` if it is not a recognised OTP export."""
+    try:
+        rows = sniff_rows(source)
+    except (BadZipFile, KeyError) as e:
+        logger.debug("Not an OTP export: %s", e)
+        return None
+    return classify(rows)
+
+
+def open_export(source, settings: Dict, state=None) -> Tuple[str, Any]:
+    """Return the plugin name and a parser for the export at ``source``,
+    with the plugin matching its format. ``source`` may also be bytes or a
+    binary file object (see ``xlsx.open_source``). The format is sniffed
+    here only, not again by the plugin. ``state`` is the incremental state
+    to use instead of the settings' (see ``OtpXlsxParser``)."""
+    source = open_source(source)
+    plugin = detect_format(source)
+    if plugin is None:
+        raise ValueError("not a recognised OTP export")
+    # both plugins return a StatementParser, with split_records/parse_record
+    return plugin, PLUGINS[plugin](ui.UI(), settings).parser_for(source, state)
@@ -0,0 +1,75 @@
+"""Where the plugin keeps its own files, how it names and how it writes them.
+
+The parse cache and the incremental state are both directories named by a
+setting -- ``yes`` for the default location under the user's cache or state
+directory, or a path -- whose files are replaced atomically, so that a reader
+(possibly another process) never sees half of one.
+"""
+
+import os
+import re
+import tempfile
+from typing import Callable, Optional
+
+import platformdirs
+from ofxstatement import configuration
+
+TRUE_VALUES = ("1", "yes", "true", "on")
+FALSE_VALUES = ("", "0", "no", "false", "off")
+
+
+def directory_setting(settings, name: str, default: Callable[[], str]) -> Optional[str]:
+    """The directory the setting ``name`` turns on: ``default()`` for a true
+    value, the path given otherwise, or ``None`` when it is off."""
+    location = str(settings.get(name, "")).strip()
+    if location.lower() in FALSE_VALUES:
+        return None
+    if location.lower() in TRUE_VALUES:
+        return default()
+    return os.path.expanduser(location)
+
+
+def cache_directory() -> str:
+    return os.path.join(
+        platformdirs.user_cache_dir(configuration.APP_NAME, configuration.APP_AUTHOR),
+        "otp",
+    )
+
+
+def state_directory() -> str:
+    return os.path.join(
+        platformdirs.user_state_dir(configuration.APP_NAME, configuration.APP_AUTHOR),
+        "otp",
+    )
+
+
+def safe_name(name: str) -> str:
+    """``name`` (an account number) usable in a file name: runs of anything
+    but letters, digits, ``_`` and ``-`` become ``_``."""
+    return re.sub(r"[^0-9A-Za-z_-]+", "_", name)
+
+
+def account_filename(input_path: str, account_id: str) -> str:
+    """``statement.xlsx`` + ``11111111-22222222`` ->
+    ``statement-11111111-22222222.ofx``."""
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    return f"{stem}-{safe_name(account_id)}.ofx"
+
+
+def write_atomic(path: str, data: bytes) -> None:
+    """Replace the file at ``path`` with ``data``, through a temporary file
+    next to it: readers see the old content or the new, never a mix. Any
+    number of processes and threads may write the same path at once."""
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".",
+        prefix=os.path.basename(path) + ".",
+        suffix=".tmp",
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
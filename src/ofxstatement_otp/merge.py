@@ -0,0 +1,144 @@
+"""An on-disk index for merging overlapping exports without duplicates.
+
+Exports with overlapping query windows repeat transactions. ``MergeIndex``
+stores statement lines in SQLite, keyed by account and line id (the bank
+identifier in the current format, ``generate_transaction_id`` in the legacy
+one), so adding a line already seen is a primary-key lookup and the merged
+lines never need to fit in memory. A legacy id is only a hash of the date,
+memo and amount, so genuinely identical transactions of a day share it; the
+key therefore also has the line's occurrence of that id within its export.
+Such lines are all kept, while a later export repeating them still adds
+nothing. The occurrences are counted by SQLite too: an export's lines are
+staged in a temporary table and numbered as they are copied over. Lines are
+read back per account in booking date order, straight from the database, and
+streamed into the OFX.
+
+The index can be kept between runs (``ofxstatement-otp merge --index``): lines
+added by earlier runs are then part of every later merge.
+"""
+
+import pickle
+import sqlite3
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from ofxstatement.statement import StatementLine
+
+# Lines are staged in batches of this size, in one transaction per export.
+BATCH_SIZE = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lines (
+    account TEXT NOT NULL,
+    id TEXT NOT NULL,
+    occurrence INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    line BLOB NOT NULL,
+    PRIMARY KEY (account, id, occurrence)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS lines_by_date ON lines (account, date, id, occurrence);
+CREATE TABLE IF NOT EXISTS accounts (
+    account TEXT PRIMARY KEY,
+    currency TEXT
+);
+CREATE TEMP TABLE staged (
+    seq INTEGER PRIMARY KEY,
+    account TEXT NOT NULL,
+    id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    line BLOB NOT NULL
+);
+"""
+
+
+class MergeIndex:
+    """Statement lines of any number of exports, de-duplicated by
+    ``(account, line id, occurrence of the id in its export)``."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.db.close()
+
+    def __enter__(self) -> "MergeIndex":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def add(self, lines: Iterable[Tuple[str, Optional[str], StatementLine]]) -> int:
+        """Add ``(account id, currency, line)`` triples, all from one export;
+        return how many were new. Lines need an ``id`` and a ``date``."""
+        currencies = {}
+        batch: List[Tuple[str, str, str, bytes]] = []
+        with self.db:
+            self.db.execute("DELETE FROM staged")
+            for account, currency, line in lines:
+                if currency and account not in currencies:
+                    currencies[account] = currency
+                if line.id is None or line.date is None:
+                    raise ValueError(
+                        f"A line of the statement of {account} has no id or date: "
+                        f"{line}"
+                    )
+                batch.append(
+                    (
+                        account,
+                        line.id,
+                        line.date.isoformat(),
+                        pickle.dumps(line, protocol=pickle.HIGHEST_PROTOCOL),
+                    )
+                )
+                if len(batch) >= BATCH_SIZE:
+                    self._stage(batch)
+                    batch = []
+            self._stage(batch)
+            before = self.db.total_changes
+            # numbered in the order they came: the nth line with an id is
+            # occurrence n - 1 in any export
+            self.db.execute(
+                "INSERT OR IGNORE INTO lines (account, id, occurrence, date, line)"
+                " SELECT account, id,"
+                " ROW_NUMBER() OVER (PARTITION BY account, id ORDER BY seq) - 1,"
+                " date, line FROM staged"
+            )
+            added = self.db.total_changes - before
+            self.db.execute("DELETE FROM staged")
+            self.db.executemany(
+                "INSERT OR IGNORE INTO accounts (account, currency) VALUES (?, ?)",
+                currencies.items(),
+            )
+        return added
+
+    def _stage(self, batch: List[Tuple[str, str, str, bytes]]) -> None:
+        self.db.executemany(
+            "INSERT INTO staged (account, id, date, line) VALUES (?, ?, ?, ?)",
+            batch,
+        )
+
+    def accounts(self) -> List[Tuple[str, Optional[str], int]]:
+        """``(account id, currency, number of lines)`` of every account."""
+        return self.db.execute(
+            "SELECT lines.account, accounts.currency, COUNT(*) FROM lines"
+            " LEFT JOIN accounts ON accounts.account = lines.account"
+            " GROUP BY lines.account ORDER BY lines.account"
+        ).fetchall()
+
+    def date_range(self, account: str) -> Tuple[datetime, datetime]:
+        """The first and last booking date of ``account``."""
+        first, last = self.db.execute(
+            "SELECT MIN(date), MAX(date) FROM lines WHERE account = ?", (account,)
+        ).fetchone()
+        return datetime.fromisoformat(first), datetime.fromisoformat(last)
+
+    def lines(self, account: str) -> Iterator[StatementLine]:
+        """Stream the lines of ``account`` in booking date order."""
+        cursor = self.db.execute(
+            "SELECT line FROM lines WHERE account = ? ORDER BY date, id, occurrence",
+            (account,),
+        )
+        for (line,) in cursor:
+            yield pickle.loads(line)
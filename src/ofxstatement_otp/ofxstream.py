@@ -0,0 +1,207 @@
+"""Writing OFX as the statement lines are produced.
+
+ofxstatement's ``OfxWriter`` builds the whole document from ``statement.lines``,
+so every line of an export is in memory before the first byte is written.
+``StreamingOfxWriter`` writes the same document piece by piece instead: the
+header and sign-on from the statement's metadata, then each ``STMTTRN`` as it
+is passed in, and the ledger balance and closing tags at the end. Memory stays
+flat however many lines go through it.
+
+The output is the same as ``OfxWriter.toxml`` for the same statement, pretty
+or not, byte for byte (the tests compare them). As with ``OfxWriter``, an
+empty statement has no transaction list at all.
+"""
+
+from decimal import Decimal
+from math import isclose
+from typing import Callable, Iterable, TextIO
+from xml.dom import minidom
+from xml.etree import ElementTree as etree
+
+from ofxstatement import exceptions
+from ofxstatement.ofx import OfxWriter
+from ofxstatement.statement import Statement, StatementLine
+
+# As ``OfxWriter.toxml(pretty=True)`` lays the document out.
+INDENT = "  "
+NEWLINE = "\r\n"
+
+# Nesting depth of the STMTTRN elements under <OFX>.
+_LINE_DEPTH = 5
+
+
+class StreamingOfxWriter(OfxWriter):
+    """Write a statement to ``out`` one line at a time.
+
+    ``statement`` supplies the metadata (account, currency, dates, balances)
+    and must not hold the lines itself; pass them to ``write_line`` (or
+    ``write_lines``) and call ``close`` after the last one. ``end_balance``
+    may still be set on the statement until then.
+    """
+
+    def __init__(
+        self,
+        statement: Statement,
+        out: TextIO,
+        pretty: bool = False,
+        encoding: str = "utf-8",
+    ) -> None:
+        super().__init__(statement)
+        self.out = out
+        self.pretty = pretty
+        self.encoding = encoding
+        self.lines = 0
+        self.total = Decimal(0)
+        self._depth = 0
+        self._started = False
+        self._in_list = False
+
+    def start(self) -> None:
+        """Write the OFX header and the sign-on; called by the first
+        ``write_line`` or by ``close``, whichever comes first."""
+        assert not self.statement.lines, "the lines are streamed, not stored"
+        # The document of the statement without lines is exactly the header,
+        # <OFX> and the sign-on, so OfxWriter itself writes those.
+        document = self.toxml(pretty=self.pretty, encoding=self.encoding)
+        self.out.write(document[: document.rindex("</OFX>")])
+        self._depth = 1
+        self._started = True
+
+    def write_line(self, line: StatementLine) -> None:
+        if not self._started:
+            self.start()
+        if not self._in_list:
+            self._open_list()
+        self._fragment(lambda: self.buildBankTransaction(line))
+        self.lines += 1
+        if line.amount is not None:
+            self.total += line.amount
+
+    def write_lines(self, lines: Iterable[StatementLine]) -> int:
+        """Write every line of ``lines``; return how many were written."""
+        written = self.lines
+        for line in lines:
+            self.write_line(line)
+        return self.lines - written
+
+    def close(self) -> None:
+        """Write the ledger balance and the closing tags, then check the
+        balances against the lines, as ``Statement.assert_valid`` does."""
+        if not self._started:
+            self.start()
+        if self._in_list:
+            self._close_list()
+        self._depth = 0
+        self._tag("/OFX")
+        statement = self.statement
+        if statement.start_balance is not None and statement.end_balance is not None:
+            if not isclose(statement.start_balance + self.total, statement.end_balance):
+                raise exceptions.ValidationError(
+                    "Start balance ({0}) plus the total amount ({1}) "
+                    "should be equal to the end balance ({2})".format(
+                        statement.start_balance, self.total, statement.end_balance
+                    ),
+                    statement,
+                )
+
+    def _open_list(self) -> None:
+        # buildBankTransactionList up to the first STMTTRN
+        statement = self.statement
+        self._open("BANKMSGSRSV1")
+        self._open("STMTTRNRS")
+        self._fragment(self._build_status)
+        self._open("STMTRS")
+        self._fragment(lambda: self._build_account(statement))
+        self._open("BANKTRANLIST")
+        self._fragment(lambda: self._build_dates(statement))
+        assert self._depth == _LINE_DEPTH
+        self._in_list = True
+
+    def _close_list(self) -> None:
+        # the rest of buildBankTransactionList
+        statement = self.statement
+        self._close("BANKTRANLIST")
+        self._fragment(lambda: self._build_ledger_balance(statement))
+        self._close("STMTRS")
+        self._close("STMTTRNRS")
+        self._close("BANKMSGSRSV1")
+        self._in_list = False
+
+    def _build_status(self) -> None:
+        tb = self.tb
+        self.buildText("TRNUID", "0")
+        tb.start("STATUS", {})
+        self.buildText("CODE", "0")
+        self.buildText("SEVERITY", "INFO")
+        tb.end("STATUS")
+
+    def _build_account(self, statement: Statement) -> None:
+        tb = self.tb
+        self.buildText("CURDEF", statement.currency)
+        tb.start("BANKACCTFROM", {})
+        self.buildText("BANKID", statement.bank_id, False)
+        self.buildText("ACCTID", statement.account_id, False)
+        self.buildText("ACCTTYPE", statement.account_type)
+        tb.end("BANKACCTFROM")
+
+    def _build_dates(self, statement: Statement) -> None:
+        self.buildDate("DTSTART", statement.start_date, False)
+        self.buildDate("DTEND", statement.end_date, False)
+
+    def _build_ledger_balance(self, statement: Statement) -> None:
+        tb = self.tb
+        tb.start("LEDGERBAL", {})
+        self.buildAmount("BALAMT", statement.end_balance, False)
+        self.buildDateTime("DTASOF", statement.end_date, False)
+        tb.end("LEDGERBAL")
+
+    def _fragment(self, build: Callable[[], None]) -> None:
+        """Write the elements ``build`` makes with the ``OfxWriter.build*``
+        methods at the current depth."""
+        self.tb = etree.TreeBuilder()
+        self.tb.start("fragment", {})
+        build()
+        self.tb.end("fragment")
+        for element in self.tb.close():
+            xml = etree.tostring(element, "unicode")
+            if self.pretty:
+                # laid out by minidom, as toxml(pretty=True) does
+                node = minidom.parseString(xml).documentElement
+                assert node is not None
+                node.writexml(
+                    self.out,
+                    indent=INDENT * self._depth,
+                    addindent=INDENT,
+                    newl=NEWLINE,
+                )
+            else:
+                self.out.write(xml)
+
+    def _tag(self, tag: str) -> None:
+        if self.pretty:
+            self.out.write(INDENT * self._depth + "<" + tag + ">" + NEWLINE)
+        else:
+            self.out.write("<" + tag + ">")
+
+    def _open(self, tag: str) -> None:
+        self._tag(tag)
+        self._depth += 1
+
+    def _close(self, tag: str) -> None:
+        self._depth -= 1
+        self._tag("/" + tag)
+
+
+def write_streaming(
+    statement: Statement,
+    lines: Iterable[StatementLine],
+    out: TextIO,
+    pretty: bool = False,
+    encoding: str = "utf-8",
+) -> int:
+    """Write ``statement`` with ``lines`` to ``out`` as OFX; return the
+    number of lines."""
+    writer = StreamingOfxWriter(statement, out, pretty=pretty, encoding=encoding)
+    written = writer.write_lines(lines)
+    writer.close()
+    return written
@@ -1,16 +1,39 @@
-from openpyxl import load_workbook
 from dataclasses import dataclass
 from datetime import datetime
 from decimal import Decimal
 import logging
-import warnings
-from typing import Optional
+import re
+from collections import deque
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
 from ofxstatement.plugin import Plugin
 from ofxstatement.parser import StatementParser
 from ofxstatement.statement import Statement, StatementLine
 
-from ofxstatement_otp.transaction_types import transaction_type
+from ofxstatement_otp.balances import RunningBalances
+from ofxstatement_otp.cache import ParseCache, restore_statement
+from ofxstatement_otp.cells import parse_date, parse_datetime, to_decimal
+from ofxstatement_otp.profiling import Profiler, profiled
+from ofxstatement_otp.state import IncrementalState
+from ofxstatement_otp.transaction_types import classifier_for
+from ofxstatement_otp.xlsx import (
+    hidden_rows,
+    iter_rows,
+    load_workbook,
+    open_source,
+    source_name,
+)
 
 logger = logging.getLogger("OTP")
 
@@ -24,12 +47,27 @@ LABEL_END_DATE = "Lekérdezés vége"
 
 # Column A header that marks the start of the transaction table. The same word
 # also appears as a metadata label in the preamble, so the header row is
-# identified by also requiring the column B header (see _find_header_row).
+# identified by also requiring the column B header (see _SheetScan).
 HEADER_ACCOUNT_NO = "Számlaszám"
 HEADER_PARTNER_ACCOUNT = "Ellenoldali számlaszám"
 
-DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
-DATE_FORMAT = "%Y-%m-%d"
+# The transaction table spans columns A-K (see Transaction).
+N_COLUMNS = 11
+
+# A sheet row: its 1-based row number and its N_COLUMNS cell values.
+Row = Tuple[int, Sequence[Any]]
+BLANK_ROW = (None,) * N_COLUMNS
+
+# Values of the ``reader`` setting: openpyxl's read-only mode (the default), or
+# the leaner reader of xlsx.iter_rows that parses the worksheet XML directly.
+READER_OPENPYXL = "openpyxl"
+READER_XML = "xml"
+
+# Values of the ``date_order`` setting: how the booking dates of the whole
+# table are sorted, so that the scan can stop at the first row past the
+# ``start``/``end`` range.
+DATE_ORDER_ASCENDING = "ascending"
+DATE_ORDER_DESCENDING = "descending"
 
 
 @dataclass
@@ -46,75 +84,364 @@ class Transaction:
     amount: Decimal
     currency: str
 
+    # Explicit slots, as dataclass(slots=True) needs Python 3.10: no
+    # per-record __dict__, which adds up over long histories.
+    __slots__ = tuple(__annotations__)
+
 
 class OtpPlugin(Plugin):
     """OTP Bank, post-2026-June netbank export (XLSX).
 
     The export bundles every account into a single file; set the ``account``
     setting to the (partial) account number to emit a statement for just one
-    account.
+    account, or use ``parse_accounts`` to get one statement per account.
+    Exports can be given as a path, as bytes (or another buffer, such as an
+    mmap) or as a binary file object.
     """
 
+    def parse_accounts(self, filename) -> Dict[str, Statement]:
+        """Read ``filename`` once and return a statement per account number."""
+        return self.get_parser(filename).parse_accounts()
+
     def get_parser(self, filename):
-        parser = OtpXlsxParser(filename, self.settings)
+        # imported here: detect reads this module's header constants
+        from ofxstatement_otp.detect import FORMAT_LEGACY, detect_format
+
+        # opened once: a stream can only be read once
+        source = open_source(filename)
+        if detect_format(source) == FORMAT_LEGACY:
+            raise ValueError(
+                f"{source_name(filename)} is a pre-2026-June OTP export; "
+                "convert it with the otp_legacy plugin"
+            )
+        return self.parser_for(source)
+
+    def parser_for(
+        self, source, state: Optional[IncrementalState] = None
+    ) -> "OtpXlsxParser":
+        """A parser for ``source``, already known to be a current export
+        (``detect.open_export`` sniffs the format once, for either plugin);
+        see ``OtpXlsxParser`` for ``state``."""
+        parser = OtpXlsxParser(source, self.settings, state)
         parser.statement.bank_id = self.settings.get("BIC", "OTPVHUHB")
         return parser
 
 
-def _to_datetime(value, fmt: str) -> datetime:
-    """Accept either a native datetime cell or a string in ``fmt``."""
-    if isinstance(value, datetime):
-        return value
-    return datetime.strptime(value, fmt)
+class _SheetScan:
+    """A single forward pass over the transactions sheet.
 
+    The preamble labels and the header position are collected up front.
+    ``read_ahead`` then consumes data rows only until the first account and
+    currency matching ``included`` are known; the matching rows it reads are
+    buffered and replayed by ``data_rows``, which continues the same stream.
+    The statement metadata and the transactions are thus served from one
+    traversal. ``first_data_row``/``last_data_row`` give the span of the
+    transaction table once the stream has been drained.
+    """
 
-def _load_workbook(filename):
-    """Load an xlsx, silencing openpyxl's harmless "no default style" warning.
+    def __init__(
+        self,
+        rows: Iterator[Row],
+        included: Callable[[Any], bool],
+        hidden: Callable[[int], bool],
+    ):
+        self._rows = rows
+        self._included = included
+        self._hidden = hidden
+        self._buffer: Deque[Row] = deque()
+        self._done = False
+        self.preamble: Dict[Any, Any] = {}
+        self.account_id: Optional[str] = None
+        self.currency: Optional[str] = None
+        self.first_data_row: Optional[int] = None
+        self.last_data_row: Optional[int] = None
+        # rows of other accounts dropped by read_ahead
+        self.dropped = 0
+        self.header_row = self._read_preamble()
+
+    def _read_preamble(self) -> int:
+        """Locate the transaction table header row, collecting the labelled
+        metadata rows above it.
 
-    OTP exports ship a stylesheet without a named default style, which makes
-    openpyxl warn on every load. The warning is noise for our read-only use.
-    """
-    with warnings.catch_warnings():
-        warnings.filterwarnings(
-            "ignore",
-            message="Workbook contains no default style",
-            category=UserWarning,
+        ``Számlaszám`` appears both as a metadata label and as the table's
+        first column header, so the header is disambiguated by also requiring
+        the partner-account header in column B.
+        """
+        for row, (a, b, *_) in self._rows:
+            if a == HEADER_ACCOUNT_NO and b == HEADER_PARTNER_ACCOUNT:
+                return row
+            if a is not None:
+                self.preamble.setdefault(a, b)
+        raise ValueError(
+            "Could not find the transaction table header (expected a row with "
+            f"'{HEADER_ACCOUNT_NO}' / '{HEADER_PARTNER_ACCOUNT}') in sheet "
+            f"'{TRANSACTIONS_SHEET_NAME}'"
         )
-        return load_workbook(filename)
 
+    def _next_data_row(self) -> Optional[Row]:
+        """Read the next table row; ``None`` once the table has ended (at the
+        first visible row without an account number: hidden rows are part of
+        the table, blank or not)."""
+        if self._done:
+            return None
+        for row, cells in self._rows:
+            if not cells[0] and not self._hidden(row):
+                break
+            if self.first_data_row is None:
+                self.first_data_row = row
+            self.last_data_row = row
+            return row, cells
+        self._done = True
+        return None
 
-class OtpXlsxParser(StatementParser):
+    def read_ahead(self) -> None:
+        """Consume rows until the first matching account and currency are
+        known (or the table ends). Non-matching rows are dropped, as
+        ``split_records`` would skip them anyway."""
+        while self.account_id is None or self.currency is None:
+            item = self._next_data_row()
+            if item is None:
+                return
+            account_no, currency = item[1][0], item[1][N_COLUMNS - 1]
+            if not account_no:
+                # a hidden blank row: skipped by _get_transactions
+                self._buffer.append(item)
+                continue
+            if not self._included(account_no):
+                self.dropped += 1
+                continue
+            self._buffer.append(item)
+            if self.account_id is None:
+                self.account_id = str(account_no)
+            if self.currency is None and currency:
+                self.currency = str(currency)
+
+    def data_row_count(self) -> int:
+        """Rows in the transaction table read so far (the table has no gaps)."""
+        if self.first_data_row is None or self.last_data_row is None:
+            return 0
+        return self.last_data_row - self.first_data_row + 1
+
+    def data_rows(self) -> Iterator[Row]:
+        """Yield the table rows: the buffered read-ahead first, then the rest
+        of the stream."""
+        while self._buffer:
+            yield self._buffer.popleft()
+        while True:
+            item = self._next_data_row()
+            if item is None:
+                return
+            yield item
+
+
+def _date_setting(settings, name: str) -> Optional[datetime]:
+    value = str(settings.get(name, "")).strip()
+    if not value:
+        return None
+    try:
+        return parse_date(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name} date {value!r}; use YYYY-MM-DD")
 
-    def __init__(self, filename, settings=None):
-        self.filename = filename
+
+class OtpXlsxParser(StatementParser):
+    """Parser of a current export. ``state`` is an incremental state to use
+    instead of the one the settings configure, e.g. one shared by several
+    exports."""
+
+    def __init__(
+        self, filename, settings=None, state: Optional[IncrementalState] = None
+    ) -> None:
+        # a path, bytes (or another buffer) or a binary file object
+        self.source = open_source(filename)
+        self.filename = source_name(filename)
         self.settings = settings or {}
         self.account_filter = self.settings.get("account")
-        self.workbook = _load_workbook(self.filename)
-        self.sheet = self.workbook[TRANSACTIONS_SHEET_NAME]
-        self.header_row = self._find_header_row()
-
-        self.statement = Statement()
-        self.statement.account_id = self._get_account_id()
-        self.statement.currency = self._get_currency()
-        self.statement.start_balance = self._get_start_balance()
-        self.statement.start_date = self._get_start_date()
-        self.statement.end_balance = self._get_end_balance()
-        self.statement.end_date = self._get_end_date()
+        # exact account numbers, separated by commas or whitespace
+        self.accounts = frozenset(
+            account
+            for account in re.split(r"[\s,]+", str(self.settings.get("accounts", "")))
+            if account
+        )
+        self.filters_accounts = bool(self.account_filter or self.accounts)
+        # account number -> whether its rows pass the account filters
+        self._account_matches: Dict[Any, bool] = {}
+        self.start = _date_setting(self.settings, "start")
+        self.end = _date_setting(self.settings, "end")
+        self.date_order = self.settings.get("date_order")
+        if self.date_order not in (
+            None,
+            DATE_ORDER_ASCENDING,
+            DATE_ORDER_DESCENDING,
+        ):
+            raise ValueError(
+                f"Unknown date_order {self.date_order!r}; "
+                f"use {DATE_ORDER_ASCENDING!r} or {DATE_ORDER_DESCENDING!r}"
+            )
+        self.profiler = Profiler.from_settings(
+            self.settings, self.filename, type(self).__name__
+        )
+
+        self.classifier = classifier_for(self.settings)
+        if state is None:
+            state = IncrementalState.from_settings(self.settings)
+        self.state = state
+        self.balances = RunningBalances.from_settings(self.settings, self.state)
+
+        self.cache = ParseCache.from_settings(self.settings)
+        self.cached_records: Optional[List[tuple]] = None
+        if self.cache is not None:
+            key_settings = self.settings
+            if self.state is not None:
+                # Rows behind the watermark never reach the cache (see
+                # _get_transactions), so entries are only valid for this state.
+                key_settings = dict(
+                    self.settings, incremental_state=self.state.fingerprint()
+                )
+            with profiled(self.profiler, "cache"):
+                self.cache_key = self.cache.key(
+                    self.source, type(self).__name__, key_settings
+                )
+                entry = self.cache.load(self.cache_key)
+            if entry is not None:
+                # Cache hit: the workbook is never opened.
+                metadata, self.cached_records = entry
+                self.statement = Statement()
+                restore_statement(self.statement, metadata)
+                logger.debug(self.statement)
+                return
+
+        self.reader = self.settings.get("reader", READER_OPENPYXL)
+        if self.profiler is not None:
+            self.profiler.details["reader"] = self.reader
+        if self.reader == READER_OPENPYXL:
+            with profiled(self.profiler, "load"):
+                self.workbook = load_workbook(self.source)
+                self.sheet = self.workbook[TRANSACTIONS_SHEET_NAME]
+                # The stored sheet dimension is not trusted: a stale one would
+                # make the streaming reader stop early, so always read to the
+                # last row.
+                self.sheet.reset_dimensions()
+                # needed by the scan: a hidden row does not end the table
+                self.hidden: Set[int] = set(
+                    hidden_rows(self.source, TRANSACTIONS_SHEET_NAME)
+                )
+        elif self.reader == READER_XML:
+            # Filled in as the rows stream past (see _iter_xml_rows).
+            self.hidden = set()
+        else:
+            raise ValueError(
+                f"Unknown reader {self.reader!r}; "
+                f"use {READER_OPENPYXL!r} or {READER_XML!r}"
+            )
+        # set as soon as it is known: see _skip_xml_row
+        self.header_row: Optional[int] = None
+        with profiled(self.profiler, "header"):
+            self.scan = _SheetScan(
+                self._iter_rows(), self._included, self.hidden.__contains__
+            )
+            self.header_row = self.scan.header_row
+            self.scan.read_ahead()
+
+        with profiled(self.profiler, "metadata"):
+            self.statement = Statement()
+            self.statement.account_id = self._get_account_id()
+            self.statement.currency = self._get_currency()
+            self.statement.start_balance = self._get_start_balance()
+            self.statement.start_date = self._get_start_date()
+            self.statement.end_balance = self._get_end_balance()
+            self.statement.end_date = self._get_end_date()
         logger.debug(self.statement)
 
     def parse(self):
-        return super(OtpXlsxParser, self).parse()
+        with profiled(self.profiler, "lines"):
+            statement = super(OtpXlsxParser, self).parse()
+        if self.profiler is not None:
+            self.profiler.report()
+        if self.state is not None:
+            # ofxstatement convert writes the statement after this returns,
+            # and may yet fail: only the state read is used (see state.py)
+            if self.state.pending():
+                logger.warning(
+                    "Not saving the incremental state: convert with "
+                    "ofxstatement-otp convert to save it once the OFX is written"
+                )
+            self.state.rollback()
+        return statement
 
     def split_records(self):
-        return self._get_transactions()
+        if self.cached_records is not None:
+            records = (Transaction(*row) for row in self.cached_records)
+        elif self.cache is not None:
+            records = self.cache.recording(
+                self.cache_key, self.statement, self._get_transactions()
+            )
+        else:
+            records = self._get_transactions()
+        if self.state is not None:
+            records = self.state.new_records(records)
+        if self.balances is not None:
+            records = self.balances.running(records, self.statement)
+        if self.profiler is not None:
+            records = self.profiler.records(records)
+        return records
+
+    def parse_accounts(self) -> Dict[str, Statement]:
+        """Read the export once and return one statement per account number.
+
+        Transactions are grouped by ``account_no`` (the ``account`` filter, if
+        set, still applies). Each statement carries its own account id and
+        currency; its date range is the query window from the preamble, or the
+        account's booking dates when the preamble has none. With ``incremental``
+        on, commit ``self.state`` once the statements are written.
+        """
+        with profiled(self.profiler, "lines"):
+            statements = self._parse_accounts()
+        if self.profiler is not None:
+            self.profiler.report()
+        return statements
+
+    def _parse_accounts(self) -> Dict[str, Statement]:
+        statements: Dict[str, Statement] = {}
+        booked: Dict[str, Tuple[datetime, datetime]] = {}
+        if self.balances is not None:
+            self.balances.per_account = True
+        for record in self.split_records():
+            self.cur_record += 1
+            account_id = str(record.account_no)
+            statement = statements.get(account_id)
+            if statement is None:
+                statement = statements[account_id] = Statement(
+                    bank_id=self.statement.bank_id, account_id=account_id
+                )
+            if statement.currency is None and record.currency:
+                statement.currency = str(record.currency)
+            first, last = booked.get(
+                account_id, (record.booking_date, record.booking_date)
+            )
+            booked[account_id] = (
+                min(first, record.booking_date),
+                max(last, record.booking_date),
+            )
+            stat_line = self.parse_record(record)
+            stat_line.assert_valid()
+            statement.lines.append(stat_line)
+
+        for account_id, statement in statements.items():
+            first, last = booked[account_id]
+            statement.currency = statement.currency or "HUF"
+            statement.start_date = self.statement.start_date or first
+            statement.end_date = self.statement.end_date or last
+            if self.balances is not None:
+                balances = self.balances.balances(account_id)
+                statement.start_balance, statement.end_balance = balances
+            logger.debug(statement)
+        return statements
 
     def parse_record(self, record: Transaction):
         logger.debug(record)
         stat_line = StatementLine(
-            record.bank_txn_id,
-            record.booking_date,
-            record.memo,
-            Decimal(str(record.amount)),
+            record.bank_txn_id, record.booking_date, record.memo, record.amount
         )
         stat_line.date_user = record.transaction_date
         stat_line.payee = record.partner_name
@@ -122,37 +449,77 @@ class OtpXlsxParser(StatementParser):
         logger.debug(stat_line)
         return stat_line
 
-    def _find_header_row(self) -> int:
-        """Locate the transaction table header row.
+    def _iter_rows(self) -> Iterator[Row]:
+        """Stream ``(row number, values)`` pairs from the transactions sheet.
 
-        ``Számlaszám`` appears both as a metadata label and as the table's
-        first column header, so the header is disambiguated by also requiring
-        the partner-account header in column B.
+        Rows are read in a single forward pass over the worksheet XML and are
+        always padded to the table's ``N_COLUMNS`` columns.
         """
-        for row in range(1, self.sheet.max_row + 1):
-            a = self.sheet.cell(row=row, column=1).value
-            b = self.sheet.cell(row=row, column=2).value
-            if a == HEADER_ACCOUNT_NO and b == HEADER_PARTNER_ACCOUNT:
-                return row
-        raise ValueError(
-            "Could not find the transaction table header (expected a row with "
-            f"'{HEADER_ACCOUNT_NO}' / '{HEADER_PARTNER_ACCOUNT}') in sheet "
-            f"'{TRANSACTIONS_SHEET_NAME}'"
+        if self.reader == READER_XML:
+            return self._iter_xml_rows()
+        rows = self.sheet.iter_rows(max_col=N_COLUMNS, values_only=True)
+        return enumerate(rows, start=1)
+
+    def _iter_xml_rows(self) -> Iterator[Row]:
+        """``_iter_rows`` for the XML reader.
+
+        Rows absent from the XML (blank rows) are filled in, as openpyxl does,
+        so a gap still ends the transaction table. The hidden flags come with
+        the rows and are collected into ``self.hidden``.
+        """
+        expected = 1
+        skip_row = self._skip_xml_row if self.filters_accounts else None
+        for row, values, hidden in iter_rows(
+            self.source, TRANSACTIONS_SHEET_NAME, N_COLUMNS, skip_row
+        ):
+            for blank in range(expected, row):
+                yield blank, BLANK_ROW
+            if hidden:
+                self.hidden.add(row)
+            yield row, values
+            expected = row + 1
+
+    def _skip_xml_row(self, row: int, account_no) -> bool:
+        """Whether the XML reader can leave all but column A of ``row``
+        unconverted: a table row of an account the filters exclude."""
+        return (
+            self.header_row is not None
+            and row > self.header_row
+            and not self._included(account_no)
         )
 
     def _included(self, account_no) -> bool:
-        if not self.account_filter:
-            return True
-        return self.account_filter.lower() in str(account_no).lower()
+        """Whether rows of ``account_no`` pass the ``account`` (substring)
+        and ``accounts`` (exact) filters; decided once per account number."""
+        included = self._account_matches.get(account_no)
+        if included is None:
+            text = str(account_no)
+            included = (
+                not self.account_filter or self.account_filter.lower() in text.lower()
+            ) and (not self.accounts or text in self.accounts)
+            self._account_matches[account_no] = included
+        return included
 
     def _get_transactions(self):
-        for row in range(self.header_row + 1, self.sheet.max_row + 1):
+        hidden = self.hidden
+        included = self._included if self.filters_accounts else None
+        start, end, order = self.start, self.end, self.date_order
+        previous = None  # the last booking date, when the order is relied on
+        # skipped rows, by reason (for the profile)
+        n_hidden = n_incomplete = n_filtered = n_behind = n_outside = 0
+        for row, cells in self.scan.data_rows():
             # skip hidden rows -- some netbank filters are applied as such
-            if self.sheet.row_dimensions[row].hidden:
+            if row in hidden:
                 logger.debug("Skipping hidden row: %s", row)
+                n_hidden += 1
+                continue
+
+            # only emit the configured accounts, if filtering is enabled;
+            # decided on column A alone, before the rest of the row is read
+            if included is not None and not included(cells[0]):
+                n_filtered += 1
                 continue
 
-            cells = [self.sheet.cell(row=row, column=col).value for col in range(1, 12)]
             (
                 account_no,
                 partner_account,
@@ -167,83 +534,109 @@ class OtpXlsxParser(StatementParser):
                 currency,
             ) = cells
 
-            # stop at the first row without an account number
-            if not account_no:
-                break
-
             # skip rows without a booking date (e.g. pending items)
             if not booking_date:
                 logger.debug("Skipping incomplete row: %s", row)
+                n_incomplete += 1
                 continue
 
-            # only emit the configured account, if filtering is enabled
-            if not self._included(account_no):
+            # incremental mode: drop rows long converted before parsing them
+            if self.state is not None and self.state.is_behind(
+                str(account_no), booking_date
+            ):
+                n_behind += 1
                 continue
 
+            # the date range: in a sorted export, the first row past it in
+            # the sort direction means that all the remaining rows are too
+            booked = parse_date(booking_date)
+            if order is not None:
+                # stopping early on an unsorted export would drop rows silently
+                if previous is not None and (
+                    booked < previous
+                    if order == DATE_ORDER_ASCENDING
+                    else booked > previous
+                ):
+                    raise ValueError(
+                        f"{self.filename}: row {row} is booked on "
+                        f"{booked:%Y-%m-%d}, after {previous:%Y-%m-%d}; "
+                        f"the booking dates are not in {order} order"
+                    )
+                previous = booked
+            if start is not None and booked < start:
+                if order == DATE_ORDER_DESCENDING:
+                    break
+                n_outside += 1
+                continue
+            if end is not None and booked > end:
+                if order == DATE_ORDER_ASCENDING:
+                    break
+                n_outside += 1
+                continue
+
+            # positional: keyword arguments cost a dict per row
             yield Transaction(
-                account_no=account_no,
-                partner_account=partner_account,
-                partner_name=partner_name,
-                description=description,
-                memo=memo,
-                category=category,
-                bank_txn_id=bank_txn_id,
+                account_no,
+                partner_account,
+                partner_name,
+                description,
+                memo,
+                category,
+                bank_txn_id,
                 # The row is booked (booking date present, checked above); the
                 # transaction datetime may still be blank, so guard it.
-                transaction_date=(
-                    _to_datetime(transaction_date, DATETIME_FORMAT)
-                    if transaction_date
-                    else None
-                ),
-                booking_date=_to_datetime(booking_date, DATE_FORMAT),
-                amount=amount,
-                currency=currency,
+                parse_datetime(transaction_date) if transaction_date else None,
+                booked,
+                to_decimal(amount),
+                currency,
+            )
+
+        if self.profiler is not None:
+            self.profiler.rows.update(
+                scanned=self.scan.data_row_count(),
+                hidden=n_hidden,
+                incomplete=n_incomplete,
+                filtered=n_filtered + self.scan.dropped,
+                behind_watermark=n_behind,
+                outside_dates=n_outside,
             )
 
     def _get_account_id(self) -> Optional[str]:
         # When filtering, report the filtered account; otherwise fall back to
         # the first account number that appears in the data.
-        for row in range(self.header_row + 1, self.sheet.max_row + 1):
-            account_no = self.sheet.cell(row=row, column=1).value
-            if not account_no:
-                break
-            if self._included(account_no):
-                return str(account_no)
-        if self.account_filter:
+        if self.scan.account_id is not None:
+            return self.scan.account_id
+        if self.filters_accounts:
             logger.warning(
                 "No transactions matched account filter %r; "
                 "leaving account_id unset",
-                self.account_filter,
+                self.account_filter or ",".join(sorted(self.accounts)),
             )
         return None
 
     def _get_currency(self) -> str:
         # Read the currency of the first matching transaction; default to HUF.
-        for row in range(self.header_row + 1, self.sheet.max_row + 1):
-            account_no = self.sheet.cell(row=row, column=1).value
-            if not account_no:
-                break
-            if self._included(account_no):
-                currency = self.sheet.cell(row=row, column=11).value
-                if currency:
-                    return str(currency)
-        return "HUF"
+        return self.scan.currency or "HUF"
 
     def _get_preamble_value(self, label: str):
         """Return the column-B value of a labelled metadata row (rows above
         the transaction table)."""
-        for row in range(1, self.header_row):
-            if self.sheet.cell(row=row, column=1).value == label:
-                return self.sheet.cell(row=row, column=2).value
-        return None
+        return self.scan.preamble.get(label)
 
     def _get_start_date(self) -> Optional[datetime]:
+        # the query window, narrowed to the start setting
         value = self._get_preamble_value(LABEL_START_DATE)
-        return _to_datetime(value, DATE_FORMAT) if value else None
+        start = parse_date(value) if value else None
+        if self.start is not None and (start is None or self.start > start):
+            return self.start
+        return start
 
     def _get_end_date(self) -> Optional[datetime]:
         value = self._get_preamble_value(LABEL_END_DATE)
-        return _to_datetime(value, DATE_FORMAT) if value else None
+        end = parse_date(value) if value else None
+        if self.end is not None and (end is None or self.end < end):
+            return self.end
+        return end
 
     def _get_start_balance(self):
         return None
@@ -252,4 +645,4 @@ class OtpXlsxParser(StatementParser):
         return None
 
     def _get_transaction_type(self, transaction: Transaction) -> str:
-        return transaction_type(transaction.description)
+        return self.classifier.classify(transaction.description)
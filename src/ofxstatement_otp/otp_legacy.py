@@ -6,22 +6,51 @@ date from cell B2). It is kept as ``otp_legacy`` for converting older exports;
 new exports use the ``otp`` plugin.
 """
 
-from openpyxl import load_workbook
 from dataclasses import dataclass
+import itertools
 from datetime import datetime
 from decimal import Decimal
 import logging
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
 
 from ofxstatement.plugin import Plugin
 from ofxstatement.parser import StatementParser
 from ofxstatement.statement import Statement, StatementLine, generate_transaction_id
 
-from ofxstatement_otp.transaction_types import transaction_type
+from ofxstatement_otp.balances import RunningBalances
+from ofxstatement_otp.cache import ParseCache, restore_statement
+from ofxstatement_otp.cells import (
+    DATE_FORMAT,
+    parse_date,
+    parse_datetime,
+    to_decimal,
+)
+from ofxstatement_otp.profiling import Profiler, profiled
+from ofxstatement_otp.transaction_types import classifier_for
+from ofxstatement_otp.xlsx import (
+    hidden_rows,
+    load_workbook,
+    open_source,
+    source_name,
+)
 
 logger = logging.getLogger("OTP")
 
 TRANSACTIONS_SHEET_NAME = "Tranzakciók"
 
+# The transaction table spans columns A-L, with the data starting on row 2.
+N_COLUMNS = 12
+FIRST_DATA_ROW = 2
+
+# Statement metadata cells, as (row, 0-based column): B2 and D8. The rows up to
+# the lowest of them are read ahead and buffered for the transaction stream.
+START_DATE_CELL = (2, 1)
+ACCOUNT_ID_CELL = (8, 3)
+HEAD_ROWS = max(START_DATE_CELL[0], ACCOUNT_ID_CELL[0])
+
+# A sheet row: its 1-based row number and its N_COLUMNS cell values.
+Row = Tuple[int, Sequence[Any]]
+
 
 @dataclass
 class Transaction:
@@ -38,12 +67,31 @@ class Transaction:
     amount: Decimal
     currency: str
 
+    # Explicit slots, as dataclass(slots=True) needs Python 3.10: no
+    # per-record __dict__, which adds up over long histories.
+    __slots__ = tuple(__annotations__)
+
 
 class OtpLegacyPlugin(Plugin):
     """OTP Bank, pre-2026-June netbank export (XLSX)."""
 
     def get_parser(self, filename):
-        parser = OtpLegacyXlsxParser(filename)
+        # imported here: detect reads this module's layout constants
+        from ofxstatement_otp.detect import FORMAT_CURRENT, detect_format
+
+        # opened once: a stream can only be read once
+        source = open_source(filename)
+        if detect_format(source) == FORMAT_CURRENT:
+            raise ValueError(
+                f"{source_name(filename)} is a post-2026-June OTP export; "
+                "convert it with the otp plugin"
+            )
+        return self.parser_for(source)
+
+    def parser_for(self, source, state=None) -> "OtpLegacyXlsxParser":
+        """A parser for ``source``, already known to be a legacy export.
+        ``state`` is ignored: legacy exports have no incremental state."""
+        parser = OtpLegacyXlsxParser(source, self.settings)
         parser.statement.bank_id = self.settings.get("BIC", "OTPVHUHB")
         return parser
 
@@ -51,62 +99,123 @@ class OtpLegacyPlugin(Plugin):
 class OtpLegacyXlsxParser(StatementParser):
 
     def split_records(self):
-        return self._get_transactions()
-
-    def __init__(self, filename):
-        self.filename = filename
-        self.statement = Statement()
-        self.statement.account_id = self._get_account_id()
-        self.statement.currency = self._get_currency()
-        self.statement.start_balance = self._get_start_balance()
-        self.statement.start_date = self._get_start_date()
-        self.statement.end_balance = self._get_end_balance()
-        self.statement.end_date = self._get_end_date()
+        if self.cached_records is not None:
+            records = (Transaction(*row) for row in self.cached_records)
+        elif self.cache is not None:
+            records = self.cache.recording(
+                self.cache_key, self.statement, self._get_transactions()
+            )
+        else:
+            records = self._get_transactions()
+        if self.balances is not None:
+            records = self.balances.running(records, self.statement)
+        if self.profiler is not None:
+            records = self.profiler.records(records)
+        return records
+
+    def __init__(self, filename, settings=None) -> None:
+        # a path, bytes (or another buffer) or a binary file object
+        self.source = open_source(filename)
+        self.filename = source_name(filename)
+        self.settings = settings or {}
+        self.profiler = Profiler.from_settings(
+            self.settings, self.filename, type(self).__name__
+        )
+
+        self.classifier = classifier_for(self.settings)
+        # no incremental state here: only the balance setting
+        self.state = None
+        self.balances = RunningBalances.from_settings(self.settings)
+
+        self.cache = ParseCache.from_settings(self.settings)
+        self.cached_records: Optional[List[tuple]] = None
+        if self.cache is not None:
+            with profiled(self.profiler, "cache"):
+                self.cache_key = self.cache.key(
+                    self.source, type(self).__name__, self.settings
+                )
+                entry = self.cache.load(self.cache_key)
+            if entry is not None:
+                # Cache hit: the workbook is never opened.
+                metadata, self.cached_records = entry
+                self.statement = Statement()
+                restore_statement(self.statement, metadata)
+                logger.debug(self.statement)
+                return
+
+        # One read-only workbook handle, streamed front to back exactly once:
+        # the metadata rows are buffered in self.head and replayed to
+        # _get_transactions, which continues the same row stream.
+        with profiled(self.profiler, "load"):
+            self.workbook = load_workbook(self.source)
+            self.sheet = self.workbook[TRANSACTIONS_SHEET_NAME]
+            # A stale stored dimension would make the streaming reader stop
+            # early.
+            self.sheet.reset_dimensions()
+        with profiled(self.profiler, "header"):
+            self._rows = self._iter_rows()
+            self.head: List[Row] = list(itertools.islice(self._rows, HEAD_ROWS))
+
+        with profiled(self.profiler, "metadata"):
+            self.statement = Statement()
+            self.statement.account_id = self._get_account_id()
+            self.statement.currency = self._get_currency()
+            self.statement.start_balance = self._get_start_balance()
+            self.statement.start_date = self._get_start_date()
+            self.statement.end_balance = self._get_end_balance()
+            self.statement.end_date = self._get_end_date()
         logger.debug(self.statement)
 
     def parse(self):
-        return super(OtpLegacyXlsxParser, self).parse()
+        with profiled(self.profiler, "lines"):
+            statement = super(OtpLegacyXlsxParser, self).parse()
+        if self.profiler is not None:
+            self.profiler.report()
+        return statement
 
     def parse_record(self, record: Transaction):
         logger.debug(record)
+        # The id hashes the amount as this parser used to read it, with the
+        # float's full binary expansion, so ids match earlier conversions.
         stat_line = StatementLine(
-            None, record.booking_date, record.memo, Decimal(record.amount)
+            None, record.booking_date, record.memo, Decimal(float(record.amount))
         )
         logger.debug(stat_line)
         stat_line.id = generate_transaction_id(stat_line)
+        stat_line.amount = record.amount
         stat_line.date_user = record.transaction_date
         stat_line.payee = record.partner_name
         stat_line.trntype = self._get_transaction_type(record)
         logger.debug(stat_line)
         return stat_line
 
+    def _iter_rows(self) -> Iterator[Row]:
+        """Stream ``(row number, values)`` pairs from the transactions sheet,
+        padded to the table's ``N_COLUMNS`` columns."""
+        rows = self.sheet.iter_rows(max_col=N_COLUMNS, values_only=True)
+        return enumerate(rows, start=1)
+
+    def _cell(self, row: int, column: int):
+        """Return a metadata cell value from the buffered head rows."""
+        if row > len(self.head):
+            return None
+        return self.head[row - 1][1][column]
+
     def _get_account_id(self):
         # FIXME: there's no single field for this in this format
-        wb = load_workbook(self.filename)
-        return wb[TRANSACTIONS_SHEET_NAME]["D8"].value
+        return self._cell(*ACCOUNT_ID_CELL)
 
     def _get_currency(self):
         # TODO: support non-HUF accounts
         return "HUF"
 
     def _get_transactions(self):
-        wb = load_workbook(self.filename)
-        starting_column = "A"
-        ending_column = "L"
-        starting_row = 2
-        offset = 0
-
-        while True:
-            data = wb[TRANSACTIONS_SHEET_NAME][
-                "{}{}:{}{}".format(
-                    starting_column,
-                    starting_row + offset,
-                    ending_column,
-                    starting_row + offset,
-                )
-            ]
-
-            cells = [*map(lambda x: x.value, data[0])]
+        hidden = hidden_rows(self.source, TRANSACTIONS_SHEET_NAME)
+        rows = [row for row in self.head if row[0] >= FIRST_DATA_ROW]
+        # skipped rows, by reason (for the profile)
+        n_hidden = n_incomplete = 0
+        row = FIRST_DATA_ROW - 1
+        for row, cells in itertools.chain(rows, self._rows):
             logger.debug(cells)
             (
                 transaction_date,
@@ -124,41 +233,47 @@ class OtpLegacyXlsxParser(StatementParser):
             ) = cells
 
             # skip hidden rows -- some filters are applied as such
-            if wb.active.row_dimensions[starting_row + offset].hidden:
-                logger.debug("Skipping hidden row: " + str(starting_row + offset))
-                offset += 1
+            if row in hidden:
+                logger.debug("Skipping hidden row: %s", row)
+                n_hidden += 1
                 continue
 
             # stop when we reach the end of the file
             if not transaction_date:
+                row -= 1  # not a table row
                 break
 
             # skip lines without parseable dates
             if not booking_date:
-                logger.debug("Skipping incomplete row: " + str(starting_row + offset))
-                offset += 1
+                logger.debug("Skipping incomplete row: %s", row)
+                n_incomplete += 1
                 continue
 
-            offset += 1
+            # positional: keyword arguments cost a dict per row
             yield Transaction(
-                transaction_date=datetime.strptime(
-                    transaction_date, "%Y-%m-%d %H:%M:%S"
-                ),
-                booking_date=datetime.strptime(booking_date, "%Y-%m-%d"),
-                description=description,
-                in_or_out=in_or_out,
-                partner_name=partner_name,
-                partner_account=partner_account,
-                otp_generated_category=otp_generated_category,
-                memo=memo,
-                account_name=account_name,
-                account_no=account_no,
-                amount=amount,
-                currency=currency,
+                parse_datetime(transaction_date),
+                parse_date(booking_date),
+                description,
+                in_or_out,
+                partner_name,
+                partner_account,
+                otp_generated_category,
+                memo,
+                account_name,
+                account_no,
+                to_decimal(amount),
+                currency,
+            )
+
+        if self.profiler is not None:
+            self.profiler.rows.update(
+                scanned=row - FIRST_DATA_ROW + 1,
+                hidden=n_hidden,
+                incomplete=n_incomplete,
             )
 
     def _get_transaction_type(self, transaction: Transaction) -> str:
-        return transaction_type(transaction.description)
+        return self.classifier.classify(transaction.description)
 
     def _get_start_balance(self):
         return None
@@ -167,9 +282,8 @@ class OtpLegacyXlsxParser(StatementParser):
         return None
 
     def _get_start_date(self):
-        wb = load_workbook(self.filename)
-        date = wb[TRANSACTIONS_SHEET_NAME]["B2"].value
-        return datetime.strptime(date, "%Y-%m-%d")
+        date = self._cell(*START_DATE_CELL)
+        return datetime.strptime(date, DATE_FORMAT)
 
     def _get_end_date(self):
         return None
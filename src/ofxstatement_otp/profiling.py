@@ -0,0 +1,247 @@
+"""Per-phase timing of a conversion, for finding out where a slow one spends
+its time.
+
+With the ``profile`` setting (or the ``OFXSTATEMENT_OTP_PROFILE`` environment
+variable) set, the parsers time each phase of a conversion:
+
+  * ``cache``    -- looking the export up in the parse cache
+  * ``load``     -- opening the workbook (openpyxl reader)
+  * ``header``   -- finding the table header and the first rows
+  * ``metadata`` -- the rest of the parser set-up: statement account, currency
+    and dates
+  * ``records``  -- reading, filtering and converting the transaction rows
+  * ``lines``    -- building and validating the statement lines
+  * ``ofx``      -- writing the OFX file (``ofxstatement-otp`` commands only;
+    ``ofxstatement convert`` writes it after the parser is done)
+
+Phases do not overlap: the rows read while building the statement lines count
+as ``records``, not ``lines``. For each phase the report has the wall time and
+the peak RSS of the process at its end; with ``profile_memory = yes`` it also
+has the peak of the memory allocated by Python during the phase (traced with
+``tracemalloc``, which makes the conversion itself a few times slower). The
+row counts (scanned, and skipped as hidden, incomplete or filtered out) come
+with them.
+
+The report is one JSON object: logged on the ``OTP`` logger when ``profile`` is
+``yes``, otherwise appended as a line to the file ``profile`` names. The
+``profile_cprofile`` setting (``OFXSTATEMENT_OTP_CPROFILE``) additionally
+dumps ``cProfile`` statistics of the conversion to that file -- or to
+``<export name>.prof`` in it, if it is a directory -- for ``pstats`` or
+``snakeviz``.
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Any, ContextManager, Dict, Iterable, Iterator, List, Optional
+
+from ofxstatement_otp.files import FALSE_VALUES, TRUE_VALUES
+
+logger = logging.getLogger("OTP")
+
+PROFILE_SETTING = "profile"
+MEMORY_SETTING = "profile_memory"
+CPROFILE_SETTING = "profile_cprofile"
+# In the order they run.
+PHASES = ("cache", "load", "header", "metadata", "records", "lines", "ofx")
+
+# Settings that change how a conversion is observed, not its result.
+SETTINGS = (PROFILE_SETTING, MEMORY_SETTING, CPROFILE_SETTING)
+
+PROFILE_ENV = "OFXSTATEMENT_OTP_PROFILE"
+CPROFILE_ENV = "OFXSTATEMENT_OTP_CPROFILE"
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far, in MB."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def _setting(settings, name: str, env: Optional[str] = None) -> str:
+    value = str(settings.get(name, "")).strip()
+    if not value and env:
+        value = os.environ.get(env, "").strip()
+    return "" if value.lower() in FALSE_VALUES else value
+
+
+class Profiler:
+    """Wall time and memory per phase, plus row counts, of one conversion."""
+
+    def __init__(
+        self,
+        filename: str,
+        parser: str,
+        output: Optional[str] = None,
+        trace_memory: bool = False,
+        cprofile_path: Optional[str] = None,
+    ):
+        self.filename = str(filename)
+        self.parser = parser
+        self.output = output
+        self.phases: Dict[str, Dict[str, Any]] = {}
+        self.rows: Dict[str, int] = {}
+        self.details: Dict[str, Any] = {}
+        # [phase, start time] of the phases entered, innermost last
+        self._stack: List[List[Any]] = []
+        self._deferred = 0
+        self._reported = False
+        self._started = time.perf_counter()
+
+        self.trace_memory = trace_memory
+        self._own_tracing = False
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._own_tracing = True
+
+        self.cprofile_path = cprofile_path
+        self._cprofile: Optional[Any] = None
+        if cprofile_path:
+            import cProfile
+
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    @classmethod
+    def from_settings(cls, settings, filename, parser: str) -> Optional["Profiler"]:
+        """Return the profiler configured by the ``profile``/``profile_memory``/
+        ``profile_cprofile`` settings (or environment variables), or ``None``
+        when profiling is off."""
+        output = _setting(settings, PROFILE_SETTING, PROFILE_ENV)
+        cprofile_path = _setting(settings, CPROFILE_SETTING, CPROFILE_ENV)
+        if not output and not cprofile_path:
+            return None
+        if output.lower() in TRUE_VALUES:
+            output = ""
+        if cprofile_path and os.path.isdir(cprofile_path):
+            stem = os.path.splitext(os.path.basename(str(filename)))[0]
+            cprofile_path = os.path.join(cprofile_path, stem + ".prof")
+        return cls(
+            filename,
+            parser,
+            output=os.path.expanduser(output) if output else None,
+            trace_memory=_setting(settings, MEMORY_SETTING).lower() in TRUE_VALUES,
+            cprofile_path=cprofile_path and os.path.expanduser(cprofile_path),
+        )
+
+    def _enter(self, name: str) -> None:
+        now = time.perf_counter()
+        if self._stack:
+            # the enclosing phase is paused while this one runs
+            self._stop(self._stack[-1], now)
+        self._stack.append([name, now])
+
+    def _exit(self) -> None:
+        now = time.perf_counter()
+        self._stop(self._stack.pop(), now)
+        if self._stack:
+            self._stack[-1][1] = now
+
+    def _stop(self, entry: List[Any], now: float) -> None:
+        name, started = entry
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = {"seconds": 0.0}
+        phase["seconds"] += now - started
+        if self.trace_memory and tracemalloc.is_tracing():
+            peak = tracemalloc.get_traced_memory()[1] / (1 << 20)
+            phase["peak_traced_mb"] = max(phase.get("peak_traced_mb", 0.0), peak)
+            tracemalloc.reset_peak()
+
+    def _mark_rss(self, name: str) -> None:
+        # Not per record: getrusage costs about as much as reading a row.
+        self.phases[name]["peak_rss_mb"] = peak_rss_mb()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time the ``with`` block as (part of) phase ``name``."""
+        self._enter(name)
+        try:
+            yield
+        finally:
+            self._exit()
+            self._mark_rss(name)
+
+    def records(self, records: Iterable[Any]) -> Iterator[Any]:
+        """Pass ``records`` through, timing the time spent producing them as
+        the ``records`` phase, and count them as ``rows["emitted"]``."""
+        iterator = iter(records)
+        emitted = 0
+        while True:
+            self._enter("records")
+            try:
+                record = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                self._exit()
+            emitted += 1
+            yield record
+        self.rows["emitted"] = emitted
+        self._mark_rss("records")
+
+    @contextmanager
+    def deferred(self) -> Iterator["Profiler"]:
+        """Hold back ``report`` until the end of the ``with`` block, so that
+        phases after the parser's own (writing the OFX) are in the report."""
+        self._deferred += 1
+        try:
+            yield self
+        finally:
+            self._deferred -= 1
+            self.report()
+
+    def to_json(self) -> Dict[str, Any]:
+        rss = peak_rss_mb()
+        return dict(
+            {
+                "file": self.filename,
+                "parser": self.parser,
+                "seconds": time.perf_counter() - self._started,
+                "peak_rss_mb": rss,
+                "phases": {
+                    name: self.phases[name] for name in PHASES if name in self.phases
+                },
+                "rows": self.rows,
+            },
+            **self.details,
+        )
+
+    def report(self) -> None:
+        """Emit the report (once), and dump the cProfile statistics."""
+        if self._deferred or self._reported:
+            return
+        self._reported = True
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            assert self.cprofile_path
+            self._cprofile.dump_stats(self.cprofile_path)
+            logger.info("Wrote cProfile statistics to %s", self.cprofile_path)
+        if self._own_tracing:
+            tracemalloc.stop()
+
+        line = json.dumps(self.to_json(), ensure_ascii=False)
+        if self.output:
+            with open(self.output, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        else:
+            logger.info("profile: %s", line)
+
+
+def profiled(profiler: Optional[Profiler], name: str) -> ContextManager:
+    """``profiler.phase(name)``, or a no-op when profiling is off."""
+    return nullcontext() if profiler is None else profiler.phase(name)
+
+
+def deferred(profiler: Optional[Profiler]) -> ContextManager:
+    """``profiler.deferred()``, or a no-op when profiling is off."""
+    return nullcontext() if profiler is None else profiler.deferred()
@@ -0,0 +1,413 @@
+"""A local conversion server, for services that convert exports on demand.
+
+Every ``ofxstatement convert`` pays for starting Python and importing
+ofxstatement, the plugins and openpyxl before it reads a single row. The
+``ofxstatement-otp serve`` command pays that once: it keeps a pool of worker
+processes with everything imported and converts each request in one of them.
+
+  * ``POST /convert`` with an export as the request body returns its OFX.
+    Query parameters set the ``REQUEST_SETTINGS`` of the conversion (e.g.
+    ``?account=11773535&BIC=OTPVHUHB``) over the server's own settings, and
+    ``pretty=1`` indents the OFX. With ``--allow-paths``, ``?path=`` names an
+    export on the server's file system instead of uploading it.
+  * ``GET /status`` returns the pool size, the requests running and waiting
+    and the totals so far, as JSON.
+
+At most ``jobs`` conversions run at a time; up to ``queue_size`` more wait for
+a worker. Requests beyond that are turned away at once with ``503`` (and a
+``Retry-After``) rather than piling up, and a conversion that takes longer
+than ``timeout`` seconds gets ``504``. Each response carries its timing in the
+``X-Queue-Seconds`` and ``X-Convert-Seconds`` headers, and each request is
+logged with it.
+
+The server listens on localhost TCP or on a Unix socket. It has no
+authentication: do not expose it beyond the machine (or the socket's
+permissions).
+"""
+
+import codecs
+import http.server
+import json
+import logging
+import multiprocessing
+import os
+import socketserver
+import stat
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple, Union
+from urllib.parse import parse_qsl, urlsplit
+
+from ofxstatement_otp.files import TRUE_VALUES
+
+log = logging.getLogger(__name__)
+
+# Settings a request may set; everything else (cache, incremental, profile,
+# ...) is the server's to decide.
+REQUEST_SETTINGS = (
+    "account",
+    "accounts",
+    "BIC",
+    "balance",
+    "start",
+    "end",
+    "date_order",
+    "encoding",
+    "reader",
+)
+
+DEFAULT_PORT = 8765
+DEFAULT_QUEUE_SIZE = 32
+# Seconds a conversion may take, queueing included.
+DEFAULT_TIMEOUT = 300.0
+DEFAULT_MAX_UPLOAD_MB = 64
+# Seconds a turned-away client is asked to wait before retrying.
+RETRY_AFTER = 5
+
+
+@dataclass
+class Conversion:
+    """The result of one conversion in a worker."""
+
+    plugin: str
+    lines: int
+    ofx: str
+    seconds: float
+
+
+def warm_up() -> None:
+    """Worker initializer: import everything a conversion needs up front, so
+    that the first request a worker gets is as fast as the later ones."""
+    import openpyxl  # noqa: F401
+    from ofxstatement import ofx  # noqa: F401
+
+    from ofxstatement_otp import cli, detect, otp, otp_legacy  # noqa: F401
+
+
+def worker_pid() -> int:
+    return os.getpid()
+
+
+def convert(source, settings: Dict, pretty: bool = False) -> Conversion:
+    """Convert an export, uploaded (bytes) or on disk (a path); runs in a
+    worker. Uploads are read in memory, never written to disk."""
+    from ofxstatement_otp.cli import ofx_text, read_statement
+    from ofxstatement_otp.detect import open_export
+    from ofxstatement_otp.profiling import deferred, profiled
+    from ofxstatement_otp.state import committing
+
+    started = time.perf_counter()
+    plugin, parser = open_export(source, settings)
+    # the incremental state, if any, is committed once the OFX is made
+    with deferred(parser.profiler), committing(parser.state):
+        with profiled(parser.profiler, "lines"):
+            statement = read_statement(parser)
+        with profiled(parser.profiler, "ofx"):
+            text = ofx_text(
+                statement, pretty=pretty, encoding=settings.get("encoding", "utf-8")
+            )
+    return Conversion(plugin, len(statement.lines), text, time.perf_counter() - started)
+
+
+class Busy(Exception):
+    """Raised when every worker is busy and the queue is full."""
+
+
+class ConversionService:
+    """A pool of warm workers behind a bounded queue."""
+
+    def __init__(
+        self,
+        settings: Optional[Dict] = None,
+        jobs: Optional[int] = None,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        timeout: float = DEFAULT_TIMEOUT,
+    ):
+        self.settings = dict(settings or {})
+        self.jobs = jobs or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.timeout = timeout
+        # one slot per running or waiting conversion
+        self._slots = threading.BoundedSemaphore(self.jobs + queue_size)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.served = 0
+        self.failed = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+        # spawned, not forked: the server's threads must not leak into workers
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.jobs,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=warm_up,
+        )
+
+    def start(self) -> None:
+        """Start the workers now rather than on the first requests."""
+        started = time.perf_counter()
+        # each submission to a pool without an idle worker starts one
+        for future in [self.pool.submit(worker_pid) for _ in range(self.jobs)]:
+            future.result()
+        log.info(
+            "Started %d worker%s in %.2fs",
+            self.jobs,
+            "" if self.jobs == 1 else "s",
+            time.perf_counter() - started,
+        )
+
+    def close(self) -> None:
+        self.pool.shutdown(wait=True)
+
+    def __enter__(self) -> "ConversionService":
+        self.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def request_settings(self, params: Dict[str, str]) -> Dict:
+        """The server settings, with the request's ``REQUEST_SETTINGS`` over
+        them. Raises ``ValueError`` for any other parameter."""
+        settings = dict(self.settings)
+        for name, value in params.items():
+            if name not in REQUEST_SETTINGS:
+                raise ValueError(f"Unknown or disallowed setting {name!r}")
+            if name == "encoding":
+                try:
+                    codecs.lookup(value)
+                except LookupError:
+                    raise ValueError(f"Unknown encoding {value!r}")
+            settings[name] = value
+        return settings
+
+    def convert(
+        self, source: Union[str, bytes], settings: Dict, pretty: bool = False
+    ) -> Tuple[Conversion, float]:
+        """Convert ``source`` in a worker; return the result and the seconds
+        it waited for one. Raises ``Busy`` when the queue is full, and
+        ``concurrent.futures.TimeoutError`` on timeout."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise Busy()
+        submitted = time.perf_counter()
+        with self._lock:
+            self.pending += 1
+        try:
+            future = self.pool.submit(convert, source, settings, pretty)
+        except BaseException:
+            self._release()
+            raise
+        # A timed-out conversion keeps its worker (and its slot) until it
+        # ends: only one still waiting for a worker can be cancelled.
+        future.add_done_callback(lambda future: self._release())
+        try:
+            result = future.result(timeout=self.timeout)
+        except BaseException:
+            future.cancel()
+            with self._lock:
+                self.failed += 1
+            raise
+        waited = time.perf_counter() - submitted - result.seconds
+        with self._lock:
+            self.served += 1
+            self.busy_seconds += result.seconds
+        return result, max(waited, 0.0)
+
+    def _release(self) -> None:
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "jobs": self.jobs,
+                "queue_size": self.queue_size,
+                "pending": self.pending,
+                "served": self.served,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "mean_convert_seconds": (
+                    self.busy_seconds / self.served if self.served else None
+                ),
+            }
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    server_version = "ofxstatement-otp"
+    # set by make_server
+    service: ConversionService
+    allow_paths = False
+    max_upload = DEFAULT_MAX_UPLOAD_MB << 20
+
+    def address_string(self) -> str:
+        # Unix socket clients have no address
+        if isinstance(self.client_address, tuple):
+            return str(self.client_address[0])
+        return "unix"
+
+    def log_message(self, format: str, *args) -> None:
+        log.debug("%s %s", self.address_string(), format % args)
+
+    def _reply(
+        self,
+        status: int,
+        body: bytes,
+        content_type: str = "text/plain; charset=utf-8",
+        headers: Optional[Dict[str, str]] = None,
+    ) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str, **headers: str) -> None:
+        log.warning("%s %s: %d %s", self.command, self.path, status, message)
+        self._reply(status, (message + "\n").encode("utf-8"), headers=headers)
+
+    def do_GET(self) -> None:
+        if urlsplit(self.path).path != "/status":
+            self._error(404, "Not found")
+            return
+        body = json.dumps(self.service.status()).encode("utf-8")
+        self._reply(200, body, "application/json")
+
+    def do_POST(self) -> None:
+        url = urlsplit(self.path)
+        if url.path != "/convert":
+            self._error(404, "Not found")
+            return
+        params = dict(parse_qsl(url.query))
+        pretty = params.pop("pretty", "").lower() in TRUE_VALUES
+        path = params.pop("path", None)
+        try:
+            settings = self.service.request_settings(params)
+        except ValueError as e:
+            self._error(400, str(e))
+            return
+
+        source: Union[str, bytes]
+        if path is not None:
+            if not self.allow_paths:
+                self._error(403, "Converting server-side paths is not enabled")
+                return
+            source = path
+            name = path
+        else:
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                self._error(400, "Invalid Content-Length")
+                return
+            if not length:
+                self._error(400, "Send the export as the request body")
+                return
+            if length > self.max_upload:
+                self._error(413, "Export too large")
+                return
+            source = self.rfile.read(length)
+            name = "upload of %d bytes" % length
+
+        try:
+            result, waited = self.service.convert(source, settings, pretty)
+        except Busy:
+            self._error(
+                503, "Too many conversions", **{"Retry-After": str(RETRY_AFTER)}
+            )
+            return
+        except FutureTimeoutError:
+            self._error(504, "Conversion timed out")
+            return
+        except Exception as e:
+            self._error(422, "%s: %s" % (type(e).__name__, e))
+            return
+
+        log.info(
+            "%s: %d lines (%s), queued %.3fs, converted in %.3fs",
+            name,
+            result.lines,
+            result.plugin,
+            waited,
+            result.seconds,
+        )
+        encoding = settings.get("encoding", "utf-8")
+        try:
+            body = result.ofx.encode(encoding)
+        except (LookupError, UnicodeEncodeError) as e:
+            self._error(400, "Cannot encode the OFX in %s: %s" % (encoding, e))
+            return
+        self._reply(
+            200,
+            body,
+            "application/x-ofx; charset=%s" % encoding,
+            {
+                "X-Plugin": result.plugin,
+                "X-Lines": str(result.lines),
+                "X-Queue-Seconds": "%.6f" % waited,
+                "X-Convert-Seconds": "%.6f" % result.seconds,
+            },
+        )
+
+
+class _TCPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, handler) -> None:
+        self.path = path
+        super().__init__(path, handler)
+
+    def server_close(self) -> None:
+        super().server_close()
+        # the socket file this server created, if it is still there
+        _remove_socket(self.path)
+
+
+def _remove_socket(path: str) -> None:
+    """Remove the Unix socket at ``path``, if there is one; refuse to remove
+    anything else."""
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise ValueError(f"{path} exists and is not a socket")
+    os.unlink(path)
+
+
+def make_server(
+    service: ConversionService,
+    host: str = "127.0.0.1",
+    port: int = DEFAULT_PORT,
+    socket_path: Optional[str] = None,
+    allow_paths: bool = False,
+    max_upload_mb: int = DEFAULT_MAX_UPLOAD_MB,
+) -> socketserver.BaseServer:
+    """An HTTP server for ``service``, on ``host:port`` or, if given, on the
+    Unix socket ``socket_path``. Call ``serve_forever`` to run it."""
+    handler = type(
+        "Handler",
+        (RequestHandler,),
+        {
+            "service": service,
+            "allow_paths": allow_paths,
+            "max_upload": max_upload_mb << 20,
+        },
+    )
+    if socket_path:
+        # left behind by a server that did not shut down cleanly
+        _remove_socket(socket_path)
+        return _UnixServer(socket_path, handler)
+    return _TCPServer((host, port), handler)
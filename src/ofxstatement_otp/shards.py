@@ -0,0 +1,221 @@
+"""Splitting an export into one OFX per account and period in a single pass.
+
+Some importers cannot take the OFX of a whole multi-year, multi-account
+export. ``write_shards`` reads the export once and routes every transaction
+to the shard of its account and booking month (or quarter), each an OFX of
+its own written with ``StreamingOfxWriter``: all shards are filled as the
+rows stream past, and no shard's lines are ever held in memory.
+
+A shard's statement covers its period, narrowed to the export's query window
+(and the ``start``/``end`` settings), so consecutive shards tile the window
+without gaps or overlaps. Shard files only appear once complete. With the
+``date_order`` setting, the shards of a period are finished as soon as the
+scan has moved past it, which keeps the number of open files down to the
+accounts of one period; otherwise they all stay unfinished to the end. At
+most ``MAX_OPEN_SHARDS`` shard files are open at a time either way: the least
+recently written one is closed and reopened for appending when its next line
+comes.
+"""
+
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import IO, Dict, List, Optional, Set, Tuple
+
+from ofxstatement.statement import Statement
+
+from ofxstatement_otp.files import account_filename
+from ofxstatement_otp.ofxstream import StreamingOfxWriter
+from ofxstatement_otp.otp import OtpXlsxParser, Transaction
+
+PERIOD_MONTH = "month"
+PERIOD_QUARTER = "quarter"
+PERIODS = (PERIOD_MONTH, PERIOD_QUARTER)
+
+# Shard files kept open at once, well below the usual limit of 1024 open files
+# per process.
+MAX_OPEN_SHARDS = 64
+
+
+def period_of(date: datetime, period: str) -> Tuple[str, datetime, datetime]:
+    """``(label, first day, last day)`` of the period holding ``date``, e.g.
+    ``("2026-06", 2026-06-01, 2026-06-30)`` or ``("2026-Q2", ...)``."""
+    if period == PERIOD_MONTH:
+        first_month, label = date.month, "%04d-%02d" % (date.year, date.month)
+        months = 1
+    elif period == PERIOD_QUARTER:
+        quarter = (date.month - 1) // 3
+        first_month, label = quarter * 3 + 1, "%04d-Q%d" % (date.year, quarter + 1)
+        months = 3
+    else:
+        raise ValueError(
+            f"Unknown period {period!r}; use {PERIOD_MONTH!r} or {PERIOD_QUARTER!r}"
+        )
+    first = datetime(date.year, first_month, 1)
+    month = first_month + months
+    after = datetime(date.year + (month > 12), (month - 1) % 12 + 1, 1)
+    return label, first, after - timedelta(days=1)
+
+
+@dataclass
+class Shard:
+    """One shard file: the transactions of an account in a period."""
+
+    account_id: str
+    period: str
+    path: str
+    start_date: datetime
+    end_date: datetime
+    lines: int = 0
+
+
+class _OpenShard:
+    def __init__(self, shard: Shard, statement: Statement, pretty: bool, encoding):
+        self.shard = shard
+        self.tmp_path = shard.path + ".part"
+        self.encoding = encoding
+        self.file: Optional[IO[str]] = open(self.tmp_path, "w", encoding=encoding)
+        self.writer = StreamingOfxWriter(
+            statement, self.file, pretty=pretty, encoding=encoding
+        )
+
+    def suspend(self) -> None:
+        """Close the file; the writer carries on where it stopped after
+        ``resume``."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def resume(self) -> None:
+        if self.file is None:
+            self.file = open(self.tmp_path, "a", encoding=self.encoding)
+            self.writer.out = self.file
+
+    def finish(self) -> None:
+        try:
+            self.resume()
+            try:
+                self.writer.close()
+            finally:
+                self.suspend()
+        except BaseException:
+            os.unlink(self.tmp_path)
+            raise
+        os.replace(self.tmp_path, self.shard.path)
+        self.shard.lines = self.writer.lines
+
+    def discard(self) -> None:
+        self.suspend()
+        os.unlink(self.tmp_path)
+
+
+def shard_filename(input_path: str, account_id: str, period: str) -> str:
+    """``statement.xlsx`` + ``11111111-22222222`` + ``2026-06`` ->
+    ``statement-11111111-22222222-2026-06.ofx``."""
+    return account_filename(input_path, f"{account_id}-{period}")
+
+
+def write_shards(
+    parser: OtpXlsxParser,
+    output_dir: str,
+    name: str,
+    period: str = PERIOD_MONTH,
+    pretty: bool = False,
+    encoding: str = "utf-8",
+    max_open: int = MAX_OPEN_SHARDS,
+) -> List[Shard]:
+    """Write the transactions of ``parser`` to one OFX per account and
+    ``period`` in ``output_dir``, as ``<name>-<account>-<period>.ofx``, with
+    at most ``max_open`` files open at a time; return the shards written, in
+    the order they were started."""
+    window_start = parser.statement.start_date
+    window_end = parser.statement.end_date
+    order = parser.date_order
+    shards: List[Shard] = []
+    open_shards: Dict[Tuple[str, str], _OpenShard] = {}
+    # the shards whose files are open, least recently written first
+    writing: "OrderedDict[Tuple[str, str], _OpenShard]" = OrderedDict()
+    finished: Set[Tuple[str, str]] = set()
+    current: Optional[str] = None
+
+    def finish(keys: List[Tuple[str, str]]) -> None:
+        # the open ones first, so that reopening the rest stays within max_open
+        for key in sorted(keys, key=lambda key: key not in writing):
+            writing.pop(key, None)
+            open_shards.pop(key).finish()
+            finished.add(key)
+
+    if parser.balances is not None:
+        parser.balances.per_account = True
+    try:
+        for record in parser.split_records():
+            label, first, last = period_of(record.booking_date, period)
+            if order is not None and label != current:
+                # sorted: the shards of the previous period are complete
+                finish([key for key in open_shards if key[1] != label])
+                current = label
+            account_id = str(record.account_no)
+            key = (account_id, label)
+            if key in writing:
+                writing.move_to_end(key)
+            elif len(writing) >= max_open:
+                # the least recently written shard makes room
+                writing.popitem(last=False)[1].suspend()
+            target = open_shards.get(key)
+            if target is None:
+                if key in finished:
+                    raise ValueError(
+                        f"{parser.filename}: a {label} transaction after a later "
+                        f"one; the booking dates are not in {order} order"
+                    )
+                path = os.path.join(output_dir, shard_filename(name, account_id, label))
+                start, end = _shard_dates(first, last, window_start, window_end)
+                target = open_shards[key] = _open_shard(
+                    parser,
+                    record,
+                    Shard(account_id, label, path, start, end),
+                    pretty,
+                    encoding,
+                )
+                shards.append(target.shard)
+            else:
+                target.resume()
+            writing[key] = target
+            line = parser.parse_record(record)
+            line.assert_valid()
+            target.writer.write_line(line)
+        finish(list(open_shards))
+    finally:
+        for target in open_shards.values():
+            target.discard()
+    return shards
+
+
+def _shard_dates(
+    first: datetime,
+    last: datetime,
+    window_start: Optional[datetime],
+    window_end: Optional[datetime],
+) -> Tuple[datetime, datetime]:
+    """The period ``first``..``last``, narrowed by the bounds of the query
+    window that fall inside it."""
+    start, end = first, last
+    if window_start is not None and first < window_start <= last:
+        start = window_start
+    if window_end is not None and first <= window_end < last:
+        end = window_end
+    return start, end
+
+
+def _open_shard(
+    parser: OtpXlsxParser, record: Transaction, shard: Shard, pretty: bool, encoding
+) -> _OpenShard:
+    statement = Statement(
+        bank_id=parser.statement.bank_id,
+        account_id=shard.account_id,
+        currency=str(record.currency) if record.currency else "HUF",
+    )
+    statement.start_date = shard.start_date
+    statement.end_date = shard.end_date
+    return _OpenShard(shard, statement, pretty, encoding)
@@ -0,0 +1,325 @@
+"""Incremental conversion: remember what has been emitted, per account.
+
+Daily exports overlap, and importing the same transactions again is at best
+wasted work. With the ``incremental`` setting (``yes`` for the default location
+under the user state directory, or a directory path) ``OtpXlsxParser`` keeps a
+small JSON file per account with its watermark -- the latest booking date
+emitted -- and the bank identifiers of the transactions booked in the last
+``incremental_overlap`` days before it (7 by default). A later run then emits
+only what is new:
+
+  * rows booked before the overlap window are skipped on the raw cell value,
+    before anything is converted;
+  * rows inside the window are skipped if their identifier was emitted before
+    (rows without one, if booked on or before the watermark);
+  * everything else is emitted.
+
+The overlap window catches transactions that OTP books with a date a few days
+in the past. Rows are not assumed to be in date order (accounts are
+interleaved), so the parser skips behind-the-watermark rows rather than
+stopping at the first one.
+
+Reading the records only updates the state in memory. Whoever writes the
+output calls ``commit`` once it is safely written (see ``committing``), or
+``rollback`` when it fails, so a failed conversion records nothing and its
+transactions are emitted again next time. The ``ofxstatement-otp`` commands,
+the conversion server and the asyncio API all do. ``ofxstatement convert``
+writes the OFX after ``parse`` returns, with no way to tell the plugin whether
+it succeeded, so ``parse`` only reads the state: convert single exports with
+``ofxstatement-otp convert`` to keep it up to date.
+
+Conversions sharing a state directory (``batch`` workers, or separate runs)
+take turns: the first state file read locks the directory until the state has
+been committed or rolled back, so an export is always compared against what
+the previous one emitted. The lock covers the whole directory rather than one
+account, as the accounts of an export only become known row by row, and
+locking them one at a time could deadlock two exports that list them in
+different orders. Several exports read before anything is written (``merge``)
+share one state instead.
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ofxstatement_otp.files import (
+    directory_setting,
+    safe_name,
+    state_directory,
+    write_atomic,
+)
+
+logger = logging.getLogger("OTP")
+
+# Bump when the layout of a state file changes.
+STATE_FORMAT = 1
+
+DEFAULT_OVERLAP_DAYS = 7
+STATE_SUFFIX = ".json"
+LOCK_NAME = ".lock"
+# Stands in for the uncommitted changes in a fingerprint.
+PENDING = "(uncommitted)"
+
+
+def _lock(f: IO[bytes]) -> None:
+    """Block until ``f`` is locked exclusively (released when closed)."""
+    if sys.platform == "win32":
+        import msvcrt
+
+        while True:
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:  # gives up after ten seconds: keep waiting
+                continue
+    else:
+        import fcntl
+
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def _as_date(value: Any) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+class AccountState:
+    """Watermark and recently emitted identifiers of one account, and its
+    balance after the last emitted transaction, if known (see balances)."""
+
+    def __init__(
+        self,
+        watermark: Optional[date] = None,
+        ids: Optional[Dict[str, date]] = None,
+        overlap: timedelta = timedelta(days=DEFAULT_OVERLAP_DAYS),
+        balance: Optional[Decimal] = None,
+    ):
+        self.watermark = watermark
+        self.ids = ids or {}
+        self.overlap = overlap
+        self.balance = balance
+        self.changed = False
+        self.cutoff: Optional[date] = None
+        self.cutoff_text: Optional[str] = None
+        if watermark is not None:
+            self.cutoff = watermark - overlap
+            self.cutoff_text = self.cutoff.isoformat()
+
+    def is_behind(self, booking_date: Any) -> bool:
+        """Whether a raw booking date cell (``YYYY-MM-DD`` text or a native
+        datetime) falls before the overlap window."""
+        if self.cutoff is None:
+            return False
+        if isinstance(booking_date, str):
+            # ISO dates compare correctly as strings: no parsing needed
+            assert self.cutoff_text is not None
+            return booking_date < self.cutoff_text
+        return _as_date(booking_date) < self.cutoff
+
+    def is_new(self, booking_date: date, txn_id: Optional[str]) -> bool:
+        if self.watermark is None:
+            return True
+        if self.cutoff is not None and booking_date < self.cutoff:
+            return False
+        if txn_id:
+            return txn_id not in self.ids
+        return booking_date > self.watermark
+
+    def copy(self) -> "AccountState":
+        state = AccountState(self.watermark, dict(self.ids), self.overlap, self.balance)
+        state.changed = self.changed
+        return state
+
+    def emitted(self, booking_date: date, txn_id: Optional[str]) -> None:
+        if self.watermark is None or booking_date > self.watermark:
+            self.watermark = booking_date
+        if txn_id:
+            self.ids[txn_id] = booking_date
+        self.changed = True
+
+    def to_json(self, account_id: str) -> Dict[str, Any]:
+        assert self.watermark is not None
+        cutoff = self.watermark - self.overlap
+        data: Dict[str, Any] = {
+            "format": STATE_FORMAT,
+            "account": account_id,
+            "watermark": self.watermark.isoformat(),
+            "ids": {
+                txn_id: booked.isoformat()
+                for txn_id, booked in sorted(self.ids.items())
+                if booked >= cutoff
+            },
+        }
+        if self.balance is not None:
+            # a string: a JSON number would be read back as a float
+            data["balance"] = str(self.balance)
+        return data
+
+
+class IncrementalState:
+    """A directory of per-account state files."""
+
+    def __init__(self, directory: str, overlap_days: int = DEFAULT_OVERLAP_DAYS):
+        self.directory = directory
+        self.overlap = timedelta(days=overlap_days)
+        self.accounts: Dict[str, AccountState] = {}
+        # open while this conversion holds the directory (see lock)
+        self._lock_file: Optional[IO[bytes]] = None
+
+    @classmethod
+    def from_settings(cls, settings) -> Optional["IncrementalState"]:
+        """Return the state configured by the ``incremental``/
+        ``incremental_overlap`` settings, or ``None`` when it is off."""
+        directory = directory_setting(settings, "incremental", state_directory)
+        if directory is None:
+            return None
+        overlap = int(settings.get("incremental_overlap", DEFAULT_OVERLAP_DAYS))
+        return cls(directory, overlap)
+
+    def path(self, account_id: str) -> str:
+        return os.path.join(self.directory, safe_name(account_id) + STATE_SUFFIX)
+
+    def account(self, account_id: str) -> AccountState:
+        """The state of ``account_id``, read from disk on first use (with the
+        directory locked, see ``lock``)."""
+        state = self.accounts.get(account_id)
+        if state is None:
+            self.lock()
+            state = self.accounts[account_id] = self._load(account_id)
+        return state
+
+    def lock(self) -> None:
+        """Lock the state directory, waiting for other conversions to commit
+        theirs first; ``unlock`` releases it."""
+        if self._lock_file is not None:
+            return
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        f = open(os.path.join(self.directory, LOCK_NAME), "a+b")
+        try:
+            logger.debug("Locking %s", self.directory)
+            _lock(f)
+        except BaseException:
+            f.close()
+            raise
+        self._lock_file = f
+
+    def unlock(self) -> None:
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _load(self, account_id: str) -> AccountState:
+        path = self.path(account_id)
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("format") != STATE_FORMAT:
+                raise ValueError("unsupported format %r" % data.get("format"))
+            watermark = date.fromisoformat(data["watermark"])
+            ids = {k: date.fromisoformat(v) for k, v in data["ids"].items()}
+            balance = Decimal(data["balance"]) if "balance" in data else None
+        except FileNotFoundError:
+            return AccountState(overlap=self.overlap)
+        except Exception as e:
+            # Emitting too much beats silently dropping transactions.
+            logger.warning("Ignoring unreadable state file %s: %s", path, e)
+            return AccountState(overlap=self.overlap)
+        return AccountState(watermark, ids, self.overlap, balance)
+
+    def fingerprint(self) -> List[Tuple[str, float]]:
+        """What the state currently looks like on disk (state file names and
+        modification times), for cache keys."""
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            entries = []
+        fingerprint = sorted(
+            (entry.name, entry.stat().st_mtime)
+            for entry in entries
+            if entry.name.endswith(STATE_SUFFIX)
+        )
+        if self.pending():
+            # ahead of the disk: no later conversion sees this state
+            fingerprint.append((PENDING, time.time()))
+        return fingerprint
+
+    def pending(self) -> bool:
+        """Whether there are changes to commit."""
+        return any(state.changed for state in self.accounts.values())
+
+    def is_behind(self, account_id: str, booking_date: Any) -> bool:
+        return self.account(account_id).is_behind(booking_date)
+
+    def new_records(self, records: Iterable[Any]) -> Iterator[Any]:
+        """Pass through the records (with ``account_no``, ``booking_date`` and
+        ``bank_txn_id``) not emitted before, marking them as emitted; commit
+        once they are written. If the records are not all read, the marks
+        are undone (and the directory released, unless earlier records of a
+        shared state are still to be committed)."""
+        before = {account: state.copy() for account, state in self.accounts.items()}
+        skipped = 0
+        complete = False
+        try:
+            for record in records:
+                state = self.account(str(record.account_no))
+                booked = _as_date(record.booking_date)
+                if not state.is_new(booked, record.bank_txn_id):
+                    skipped += 1
+                    continue
+                state.emitted(booked, record.bank_txn_id)
+                yield record
+            if skipped:
+                logger.info("Skipped %d transactions converted before", skipped)
+            complete = True
+        finally:
+            if not complete:
+                self.accounts = before
+                if not self.pending():
+                    self.unlock()
+
+    def commit(self) -> None:
+        """Save the changes, now that the records they mark are written, and
+        release the directory."""
+        try:
+            self.save()
+        finally:
+            self.unlock()
+
+    def rollback(self) -> None:
+        """Drop the changes (their records count as not emitted) and release
+        the directory."""
+        self.accounts = {}
+        self.unlock()
+
+    def save(self) -> None:
+        """Write the state files of the accounts that changed."""
+        for account_id, state in self.accounts.items():
+            if not state.changed:
+                continue
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+            path = self.path(account_id)
+            data = json.dumps(state.to_json(account_id), indent=1)
+            write_atomic(path, data.encode("utf-8"))
+            state.changed = False
+            logger.debug("Saved state of %s to %s", account_id, path)
+
+
+@contextmanager
+def committing(state: Optional[IncrementalState]) -> Iterator[None]:
+    """Commit ``state`` if the block, which reads the records and writes
+    them, completes; roll it back otherwise. Does nothing when ``state`` is
+    ``None`` (incremental mode is off)."""
+    if state is None:
+        yield
+        return
+    try:
+        yield
+    except BaseException:
+        state.rollback()
+        raise
+    state.commit()
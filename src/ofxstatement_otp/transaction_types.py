@@ -4,10 +4,40 @@ Both the current (``otp``) and legacy (``otp_legacy``) plugins read the same
 set of Hungarian transaction descriptions, so the table lives here as a single
 module-level constant -- built once at import time rather than rebuilt on every
 lookup inside each plugin.
+
+Descriptions are matched after normalization (case, accents and whitespace are
+ignored), first exactly, then by the longest ``TRANS_MAP`` entry they start
+with as whole words -- OTP truncates long descriptions and sometimes appends
+details -- and finally against ``PATTERN_RULES``. The rules are compiled once into a
+``Classifier`` (a prefix trie plus one combined regular expression, where
+the patterns allow it), and its results are memoized per distinct
+description.
+
+Users can extend the rules without patching the package: the
+``trntype_rules`` setting names an INI file with a ``[descriptions]`` section
+(``description = TRNTYPE``, merged over ``TRANS_MAP``) and a ``[patterns]``
+section (``regular expression = TRNTYPE``, tried before ``PATTERN_RULES``).
+A rule file is compiled once per process and recompiled only when it changes.
 """
 
+import configparser
+import os
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from ofxstatement.statement import TRANSACTION_TYPES
+
 DEFAULT_TYPE = "PAYMENT"
 
+# Distinct descriptions whose classification is remembered.
+CACHE_SIZE = 4096
+
+RULES_SETTING = "trntype_rules"
+SECTION_DESCRIPTIONS = "descriptions"
+SECTION_PATTERNS = "patterns"
+
 TRANS_MAP = {
     "NAPKÖZBENI ÁTUTALÁS": "XFER",
     "VÁSÁRLÁS KÁRTYÁVAL": "POS",
@@ -33,11 +63,205 @@ TRANS_MAP = {
     "EGYÉB BIZTOSÍTÁSI DÍJ": "PAYMENT",
 }
 
+# (regular expression, trntype) rules, searched for in order in the normalized
+# description (lower case, no accents, single spaces) when no table entry
+# matches.
+PATTERN_RULES = [
+    # Stock exchange purchases carry the order number, e.g. the
+    # "20TBE0561242 BÉT vétel  HB" entry above.
+    (r"\w+ bet vetel\b", "PAYMENT"),
+]
+
+
+def normalize(description: str) -> str:
+    """Fold case, strip accents and collapse whitespace:
+    ``"  Vásárlás   KÁRTYÁVAL "`` -> ``"vasarlas kartyaval"``."""
+    decomposed = unicodedata.normalize("NFKD", description)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.casefold().split())
+
+
+class _TrieNode:
+    __slots__ = ("children", "value")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.value: Optional[str] = None
+
+
+class _PrefixTrie:
+    """Character trie returning the value of the longest key that is a
+    prefix of a string, ending where a word does (before a space or at the
+    end of the string)."""
+
+    def __init__(self, items: Iterable[Tuple[str, str]]):
+        self.root = _TrieNode()
+        for key, value in items:
+            node = self.root
+            for char in key:
+                node = node.children.setdefault(char, _TrieNode())
+            node.value = value
+
+    def longest_prefix(self, text: str) -> Optional[str]:
+        found = None
+        node = self.root
+        for i, char in enumerate(text, 1):
+            child = node.children.get(char)
+            if child is None:
+                break
+            node = child
+            if node.value is not None and text[i : i + 1] in ("", " "):
+                found = node.value
+        return found
+
+
+# The flags of a pattern without inline flags.
+_DEFAULT_FLAGS = re.compile("").flags
+
+
+def _combinable(pattern: str) -> bool:
+    """Whether ``pattern`` keeps its meaning inside the classifier's combined
+    expression: no global inline flags such as ``(?i)`` (only allowed at the
+    start of an expression) and no groups, whose numbers would shift (and
+    whose backreferences would then point at other groups)."""
+    compiled = re.compile(pattern)
+    return compiled.flags == _DEFAULT_FLAGS and not compiled.groups
+
+
+class Classifier:
+    """Description -> trntype, compiled once from a table and pattern rules.
 
-def transaction_type(description: str) -> str:
+    ``table`` entries match exactly or as a prefix of whole words (the
+    longest wins);
+    ``patterns`` are ``(regular expression, trntype)`` pairs, searched for in
+    order when no entry matches. They are combined into a single expression,
+    unless one of them has inline flags or groups; then each is searched for
+    on its own. Keys and patterns apply to normalized descriptions
+    (see ``normalize``). Results are memoized for the ``cache_size`` most
+    recently seen descriptions.
+    """
+
+    def __init__(
+        self,
+        table: Mapping[str, str],
+        patterns: Iterable[Tuple[str, str]] = (),
+        default: str = DEFAULT_TYPE,
+        cache_size: int = CACHE_SIZE,
+    ):
+        self.default = default
+        self.exact = {normalize(key): code for key, code in table.items()}
+        self.prefixes = _PrefixTrie(self.exact.items())
+        patterns = list(patterns)
+        self.pattern_codes = {f"r{i}": code for i, (_, code) in enumerate(patterns)}
+        self.pattern: Optional[re.Pattern] = None
+        # (compiled rule, trntype), searched one by one, when the rules cannot
+        # be combined into self.pattern
+        self.rules: List[Tuple[re.Pattern, str]] = []
+        if patterns and all(_combinable(pattern) for pattern, _ in patterns):
+            # One alternation, matched from the start: the regex engine tries
+            # each alternative at every position (.*?) before moving on to the
+            # next one, so the first rule found anywhere in the text wins.
+            self.pattern = re.compile(
+                "|".join(
+                    f"(?P<r{i}>.*?(?:{pattern}))"
+                    for i, (pattern, _) in enumerate(patterns)
+                )
+            )
+        else:
+            self.rules = [(re.compile(pattern), code) for pattern, code in patterns]
+        self.classify = lru_cache(maxsize=cache_size)(self._classify)
+
+    def _classify(self, description: Optional[str]) -> str:
+        if not description:
+            return self.default
+        text = normalize(description)
+        code = self.exact.get(text)
+        if code is None:
+            code = self.prefixes.longest_prefix(text)
+        if code is None and self.pattern is not None:
+            match = self.pattern.match(text)
+            if match is not None:
+                assert match.lastgroup is not None
+                code = self.pattern_codes[match.lastgroup]
+        if code is None:
+            # the same order: the first rule found anywhere wins
+            code = next((c for rule, c in self.rules if rule.search(text)), None)
+        return self.default if code is None else code
+
+
+DEFAULT_CLASSIFIER = Classifier(TRANS_MAP, PATTERN_RULES)
+
+
+def transaction_type(description: Optional[str]) -> str:
     """Map an OTP transaction description to an OFX trntype.
 
-    The description is stripped before lookup; unknown descriptions fall back
-    to ``PAYMENT``.
+    Case, accents and surrounding or repeated whitespace are ignored, and a
+    description that merely starts with a known one followed by more words
+    (a suffixed variant) maps the same way; unknown descriptions fall back to ``PAYMENT``.
+    """
+    return DEFAULT_CLASSIFIER.classify(description)
+
+
+# Compiled rule files: absolute path -> ((mtime, size), classifier).
+_rule_files: Dict[str, Tuple[Tuple[int, int], Classifier]] = {}
+
+
+def read_rules(path: str) -> Tuple[Dict[str, str], List[Tuple[str, str]]]:
+    """Read a rule file into ``(descriptions, patterns)``.
+
+    Raises ``ValueError`` for unknown sections, trntype codes that OFX does
+    not define and invalid regular expressions.
+    """
+    parser = configparser.ConfigParser(delimiters=("=",), interpolation=None)
+    parser.optionxform = str  # type: ignore  # keep the case of descriptions
+    with open(path, encoding="utf-8") as f:
+        parser.read_file(f)
+
+    rules: Dict[str, List[Tuple[str, str]]] = {
+        SECTION_DESCRIPTIONS: [],
+        SECTION_PATTERNS: [],
+    }
+    for section in parser.sections():
+        if section not in rules:
+            raise ValueError(
+                f"{path}: unknown section [{section}]; "
+                f"use [{SECTION_DESCRIPTIONS}] or [{SECTION_PATTERNS}]"
+            )
+        for key, code in parser.items(section):
+            code = code.strip().upper()
+            if code not in TRANSACTION_TYPES:
+                raise ValueError(f"{path}: {key!r} maps to unknown trntype {code!r}")
+            if section == SECTION_PATTERNS:
+                try:
+                    re.compile(key)
+                except re.error as e:
+                    raise ValueError(f"{path}: invalid pattern {key!r}: {e}")
+            rules[section].append((key, code))
+    return dict(rules[SECTION_DESCRIPTIONS]), rules[SECTION_PATTERNS]
+
+
+def load_classifier(path: str) -> Classifier:
+    """The built-in rules extended with the rule file at ``path``.
+
+    Compiled classifiers are kept per file and reused until the file's
+    modification time or size changes, so converting many exports in one
+    process reads the rules only once.
     """
-    return TRANS_MAP.get(description.strip(), DEFAULT_TYPE)
+    path = os.path.abspath(os.path.expanduser(path))
+    stat = os.stat(path)
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    loaded = _rule_files.get(path)
+    if loaded is not None and loaded[0] == stamp:
+        return loaded[1]
+    descriptions, patterns = read_rules(path)
+    # User entries override built-in ones of the same (normalized) description.
+    classifier = Classifier(dict(TRANS_MAP, **descriptions), patterns + PATTERN_RULES)
+    _rule_files[path] = (stamp, classifier)
+    return classifier
+
+
+def classifier_for(settings: Mapping[str, str]) -> Classifier:
+    """The classifier configured by the ``trntype_rules`` setting, or the
+    built-in one."""
+    path = settings.get(RULES_SETTING)
+    return load_classifier(path) if path else DEFAULT_CLASSIFIER
@@ -0,0 +1,512 @@
+"""Low-level helpers for reading OTP XLSX exports.
+
+Both plugins only ever read the exports front to back, so workbooks are opened
+in openpyxl's read-only (streaming) mode. That mode does not expose row
+dimensions, so the hidden-row flags the netbank uses as a filter are read
+separately, straight from the worksheet XML.
+
+``iter_rows`` is a minimal reader working on the XML directly: it streams cell
+values through expat callbacks without building elements or cell objects (about
+twice as fast as openpyxl's own read-only mode), reads only the number formats of the
+stylesheet (to tell dates from numbers), and reads the shared string table only
+as far as the rows consumed so far require. Peeking at the first rows of a
+sheet is therefore cheap regardless of the file size, and reading a whole
+sheet runs in flat memory.
+
+Exports can be read from a path, from bytes (or any other buffer: bytearray,
+memoryview, mmap) or from a binary file object; ``open_source`` turns each into
+what ``ZipFile`` and openpyxl take. Buffers are read in place, without copying
+the whole export.
+"""
+
+import io
+import os
+import posixpath
+import re
+import warnings
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Generator,
+    List,
+    Optional,
+    Tuple,
+)
+from xml.etree.ElementTree import iterparse
+from xml.parsers import expat
+from zipfile import ZipFile
+
+NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+WORKBOOK_PATH = "xl/workbook.xml"
+WORKBOOK_RELS_PATH = "xl/_rels/workbook.xml.rels"
+SHARED_STRINGS_PATH = "xl/sharedStrings.xml"
+STYLES_PATH = "xl/styles.xml"
+
+# Built-in number formats that display dates or times (ECMA-376, 18.8.30).
+BUILTIN_DATE_FORMATS = frozenset(range(14, 23)) | {45, 46, 47}
+# Parts of a format code that are not date/time codes: quoted literals,
+# [colour]/[condition] sections, escaped characters, padding and fill.
+_FORMAT_LITERALS = re.compile(r'"[^"]*"|\[[^\]]*\]|\\.|_.|\*.')
+_DATE_CODES = re.compile(r"[dmyhs]", re.IGNORECASE)
+
+EPOCH_1900 = datetime(1899, 12, 30)
+EPOCH_1904 = datetime(1904, 1, 1)
+
+_CELL_REF = re.compile(r"([A-Z]+)")
+
+# Element names as reported by expat with ``namespace_separator=" "``.
+_MAIN = NS_MAIN[1:-1] + " "
+_ROW = _MAIN + "row"
+_CELL = _MAIN + "c"
+_VALUE = _MAIN + "v"
+_TEXT = _MAIN + "t"
+_PHONETIC = _MAIN + "rPh"
+_STRING_ITEM = _MAIN + "si"
+
+# Bytes of compressed XML handed to expat at a time.
+CHUNK_SIZE = 1 << 16
+
+TRUE_ATTRS = ("1", "true")
+
+
+class BufferReader(io.RawIOBase):
+    """A seekable binary file reading from an in-memory buffer (bytes,
+    bytearray, memoryview, mmap). Only the bytes read are copied, never the
+    buffer as a whole, and the buffer is only held during a read, so an mmap
+    can be closed whenever nothing is being read from it."""
+
+    def __init__(self, buffer, name: str = "<bytes>"):
+        self._buffer = buffer
+        with memoryview(buffer) as view:
+            self._size = view.nbytes
+        self._pos = 0
+        self.name = name
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError("negative seek position %d" % offset)
+        self._pos = offset
+        return offset
+
+    def read(self, size: Optional[int] = -1) -> bytes:
+        start = min(self._pos, self._size)
+        end = self._size if size is None or size < 0 else start + size
+        with memoryview(self._buffer) as view, view.cast("B") as data:
+            chunk = data[start:end].tobytes()
+        self._pos = start + len(chunk)
+        return chunk
+
+    def readinto(self, buffer) -> int:
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+def open_source(source):
+    """Return ``source`` as ``ZipFile`` and openpyxl take it: a path as it
+    is, a buffer as a ``BufferReader`` over it, a seekable binary file as it
+    is. Anything else with a ``read`` method (a pipe, a socket file) is read
+    into memory first, as the zip directory is at the end of the file."""
+    if isinstance(source, (str, os.PathLike)):
+        return source
+    try:
+        # anything with the buffer protocol; mmaps have a read method too
+        return BufferReader(source)
+    except TypeError:
+        pass
+    if not hasattr(source, "read"):
+        raise TypeError(
+            "Expected a path, a buffer or a binary file, got "
+            f"{type(source).__name__}"
+        )
+    seekable = getattr(source, "seekable", None)
+    if seekable is not None and seekable():
+        return source
+    return BufferReader(source.read(), source_name(source))
+
+
+def source_name(source) -> str:
+    """A name for ``source`` in messages and reports: the path, or the name
+    of the file object, if it has one."""
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source)
+    name = getattr(source, "name", None)
+    if isinstance(name, str):
+        return name
+    return "<stream>" if hasattr(source, "read") else "<bytes>"
+
+
+def load_workbook(filename):
+    """Open an xlsx for streaming reads, silencing openpyxl's harmless "no
+    default style" warning.
+
+    OTP exports ship a stylesheet without a named default style, which makes
+    openpyxl warn on every load. The warning is noise for our read-only use.
+    """
+    # imported here: openpyxl takes longer to import than the rest of the
+    # plugins together, and the xml reader and cache hits never need it
+    from openpyxl import load_workbook as _openpyxl_load_workbook
+
+    with warnings.catch_warnings():
+        warnings.filterwarnings(
+            "ignore",
+            message="Workbook contains no default style",
+            category=UserWarning,
+        )
+        return _openpyxl_load_workbook(filename, read_only=True, data_only=True)
+
+
+def sheet_path(archive: ZipFile, sheet_name: str) -> str:
+    """Return the archive member holding the worksheet called ``sheet_name``."""
+    with archive.open(WORKBOOK_PATH) as src:
+        rel_id = None
+        for _, element in iterparse(src):
+            if element.tag == NS_MAIN + "sheet" and element.get("name") == sheet_name:
+                rel_id = element.get(NS_REL + "id")
+                break
+    if rel_id is None:
+        raise KeyError(f"Worksheet {sheet_name!r} does not exist.")
+
+    with archive.open(WORKBOOK_RELS_PATH) as src:
+        for _, element in iterparse(src):
+            if (
+                element.tag == NS_PKG_REL + "Relationship"
+                and element.get("Id") == rel_id
+            ):
+                target = element.get("Target", "")
+                break
+        else:
+            raise KeyError(f"Worksheet {sheet_name!r} has no relationship target.")
+
+    # Targets are either package-absolute ("/xl/...") or relative to xl/.
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join("xl", target))
+
+
+def _expat_parser():
+    parser = expat.ParserCreate(namespace_separator=" ")
+    parser.buffer_text = True
+    return parser
+
+
+def hidden_rows(filename, sheet_name: str) -> FrozenSet[int]:
+    """Return the 1-based numbers of the hidden rows of ``sheet_name``.
+
+    Only the ``<row>`` start tags are inspected and nothing is kept of the
+    cells, so memory stays flat for large sheets.
+    """
+    hidden = set()
+    row_no = 0
+
+    def start(name: str, attrs: Dict[str, str]) -> None:
+        nonlocal row_no
+        if name == _ROW:
+            row_no = int(attrs.get("r", row_no + 1))
+            if attrs.get("hidden") in TRUE_ATTRS:
+                hidden.add(row_no)
+
+    with ZipFile(filename) as archive:
+        with archive.open(sheet_path(archive, sheet_name)) as src:
+            parser = _expat_parser()
+            parser.StartElementHandler = start
+            parser.ParseFile(src)
+    return frozenset(hidden)
+
+
+@lru_cache(maxsize=1024)
+def _column_letters_index(letters: str) -> int:
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+
+def column_index(ref: str) -> int:
+    """``"A1"`` -> 0, ``"K12"`` -> 10, ``"AA3"`` -> 26."""
+    letters = ref.rstrip("0123456789")
+    if not letters or _CELL_REF.fullmatch(letters) is None:
+        raise ValueError(f"Invalid cell reference {ref!r}")
+    return _column_letters_index(letters)
+
+
+class SharedStrings:
+    """The workbook's shared string table, read on demand.
+
+    Strings are parsed from ``sharedStrings.xml`` only up to the highest index
+    looked up so far, so reading the first rows of a sheet does not pay for
+    the whole table. Rich-text runs are concatenated; phonetic (``<rPh>``)
+    runs are skipped.
+    """
+
+    def __init__(self, archive: ZipFile):
+        self._strings: List[str] = []
+        self._src: Optional[IO[bytes]] = None
+        self._parser = None
+        self._parts: List[str] = []
+        self._in_text = False
+        self._phonetic = False
+        if SHARED_STRINGS_PATH in archive.namelist():
+            self._src = archive.open(SHARED_STRINGS_PATH)
+            self._parser = _expat_parser()
+            self._parser.StartElementHandler = self._start
+            self._parser.EndElementHandler = self._end
+            self._parser.CharacterDataHandler = self._characters
+
+    def __getitem__(self, index: int) -> str:
+        while index >= len(self._strings) and self._read_next():
+            pass
+        return self._strings[index]
+
+    def _start(self, name: str, attrs: Dict[str, str]) -> None:
+        if name == _TEXT:
+            self._in_text = not self._phonetic
+        elif name == _PHONETIC:
+            self._phonetic = True
+        elif name == _STRING_ITEM:
+            self._parts = []
+
+    def _end(self, name: str) -> None:
+        if name == _TEXT:
+            self._in_text = False
+        elif name == _PHONETIC:
+            self._phonetic = False
+        elif name == _STRING_ITEM:
+            self._strings.append("".join(self._parts))
+
+    def _characters(self, data: str) -> None:
+        if self._in_text:
+            self._parts.append(data)
+
+    def _read_next(self) -> bool:
+        """Feed the next chunk of the table to the parser; ``False`` once the
+        table is exhausted."""
+        if self._parser is None or self._src is None:
+            return False
+        chunk = self._src.read(CHUNK_SIZE)
+        self._parser.Parse(chunk, not chunk)
+        if not chunk:
+            self.close()
+            return False
+        return True
+
+    def close(self) -> None:
+        self._parser = None
+        if self._src is not None:
+            self._src.close()
+            self._src = None
+
+
+def is_date_format(code: str) -> bool:
+    """Whether a number format code displays a date or time."""
+    section = _FORMAT_LITERALS.sub("", code.split(";")[0])
+    return bool(_DATE_CODES.search(section))
+
+
+def date_styles(archive: ZipFile) -> FrozenSet[int]:
+    """Return the indices of the cell formats (``s`` attribute of a cell)
+    whose number format is a date or time."""
+    if STYLES_PATH not in archive.namelist():
+        return frozenset()
+    custom: Dict[int, str] = {}
+    styles = set()
+    in_cell_xfs = False
+    with archive.open(STYLES_PATH) as src:
+        for event, element in iterparse(src, events=("start", "end")):
+            if element.tag == NS_MAIN + "cellXfs":
+                in_cell_xfs = event == "start"
+                index = 0
+            elif event == "end" and element.tag == NS_MAIN + "numFmt":
+                custom[int(element.get("numFmtId", -1))] = element.get("formatCode", "")
+            elif event == "end" and in_cell_xfs and element.tag == NS_MAIN + "xf":
+                fmt_id = int(element.get("numFmtId", 0))
+                if fmt_id in BUILTIN_DATE_FORMATS or (
+                    fmt_id in custom and is_date_format(custom[fmt_id])
+                ):
+                    styles.add(index)
+                index += 1
+    return frozenset(styles)
+
+
+def workbook_epoch(archive: ZipFile) -> datetime:
+    """Day zero of the workbook's date serial numbers (1900 or 1904 system)."""
+    with archive.open(WORKBOOK_PATH) as src:
+        for _, element in iterparse(src):
+            if element.tag == NS_MAIN + "workbookPr":
+                if element.get("date1904") in ("1", "true"):
+                    return EPOCH_1904
+                break
+    return EPOCH_1900
+
+
+def from_serial(value: float, epoch: datetime = EPOCH_1900) -> datetime:
+    """Convert a date serial number to a datetime, to the millisecond."""
+    days, fraction = divmod(value, 1)
+    return epoch + timedelta(
+        days=days, milliseconds=round(fraction * 24 * 60 * 60 * 1000)
+    )
+
+
+class _SheetReader:
+    """expat callbacks collecting the rows of a worksheet.
+
+    Finished rows accumulate in ``rows`` as ``(row number, values, hidden)``
+    until the caller takes them. Cell values are converted as by openpyxl:
+    strings (shared, inline and formula results) come back as ``str``, booleans
+    as ``bool``, numbers as ``int``/``float`` and numbers whose cell format is
+    a date (index in ``dates``) as ``datetime``.
+
+    When ``skip_row(row number, column A value)`` is true, the other cells of
+    the row are not converted (their values are left ``None``).
+    """
+
+    def __init__(
+        self,
+        shared_strings: SharedStrings,
+        dates: FrozenSet[int],
+        epoch: datetime,
+        max_col: Optional[int],
+        skip_row: Optional[Callable[[int, Any], bool]] = None,
+    ):
+        self.shared_strings = shared_strings
+        self.dates = dates
+        self.epoch = epoch
+        self.max_col = max_col
+        self.skip_row = skip_row
+        self._skipping = False
+        self.rows: List[Tuple[int, List[Any], bool]] = []
+        self._row_no = 0
+        self._values: List[Any] = []
+        self._hidden = False
+        self._column = -1
+        self._kind = "n"
+        self._style = 0
+        self._parts: Optional[List[str]] = None
+        self._collecting = False
+        self._phonetic = False
+
+    def start(self, name: str, attrs: Dict[str, str]) -> None:
+        if name == _CELL:
+            ref = attrs.get("r")
+            self._column = column_index(ref) if ref else self._column + 1
+            self._kind = attrs.get("t", "n")
+            self._style = int(attrs.get("s", 0))
+            self._parts = None
+        elif name == _VALUE or (name == _TEXT and not self._phonetic):
+            if self._skipping:
+                return
+            if self._parts is None:
+                self._parts = []
+            self._collecting = True
+        elif name == _PHONETIC:
+            self._phonetic = True
+        elif name == _ROW:
+            self._row_no = int(attrs.get("r", self._row_no + 1))
+            self._hidden = attrs.get("hidden") in TRUE_ATTRS
+            self._values = []
+            self._column = -1
+            self._skipping = False
+
+    def end(self, name: str) -> None:
+        if name == _VALUE or name == _TEXT:
+            self._collecting = False
+        elif name == _CELL:
+            column = self._column
+            if self._parts is None or (
+                self.max_col is not None and column >= self.max_col
+            ):
+                return
+            values = self._values
+            if column >= len(values):
+                values.extend([None] * (column + 1 - len(values)))
+            value = values[column] = self._convert("".join(self._parts))
+            if column == 0 and self.skip_row is not None:
+                self._skipping = self.skip_row(self._row_no, value)
+        elif name == _PHONETIC:
+            self._phonetic = False
+        elif name == _ROW:
+            values = self._values
+            if self.max_col is not None and len(values) < self.max_col:
+                values.extend([None] * (self.max_col - len(values)))
+            self.rows.append((self._row_no, values, self._hidden))
+
+    def characters(self, data: str) -> None:
+        if self._collecting:
+            assert self._parts is not None
+            self._parts.append(data)
+
+    def _convert(self, value: str) -> Any:
+        kind = self._kind
+        if kind == "s":
+            return self.shared_strings[int(value)]
+        if kind in ("inlineStr", "str", "e"):
+            return value
+        if kind == "b":
+            return value == "1"
+        if self.dates and self._style in self.dates:
+            return from_serial(float(value), self.epoch)
+        if "." in value or "E" in value or "e" in value:
+            return float(value)
+        return int(value)
+
+
+def iter_rows(
+    source,
+    sheet_name: str,
+    max_col: Optional[int] = None,
+    skip_row: Optional[Callable[[int, Any], bool]] = None,
+) -> Generator[Tuple[int, List[Any], bool], None, None]:
+    """Stream ``(row number, values, hidden)`` for every row of ``sheet_name``.
+
+    ``source`` is a filename or a seekable binary file object (see
+    ``open_source``). Rows missing from the
+    XML (blank rows) are not yielded; when ``max_col`` is set, values are cut
+    or padded to that many columns. ``skip_row(row number, column A value)``
+    can tell rows apart by their first cell: only that cell of the rows it
+    returns true for is converted.
+    """
+    with ZipFile(source) as archive:
+        shared_strings = SharedStrings(archive)
+        reader = _SheetReader(
+            shared_strings,
+            date_styles(archive),
+            workbook_epoch(archive),
+            max_col,
+            skip_row,
+        )
+        parser = _expat_parser()
+        parser.StartElementHandler = reader.start
+        parser.EndElementHandler = reader.end
+        parser.CharacterDataHandler = reader.characters
+        try:
+            with archive.open(sheet_path(archive, sheet_name)) as src:
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    parser.Parse(chunk, not chunk)
+                    rows, reader.rows = reader.rows, []
+                    yield from rows
+                    if not chunk:
+                        break
+        finally:
+            shared_strings.close()
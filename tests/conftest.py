@@ -0,0 +1,11 @@
+"""Shared test set-up.
+
+``manual_test/`` is not a package: it goes on ``sys.path`` here, once, so that
+the tests import ``generate_sample`` and ``benchmark`` from it like any other
+module. The sample exports built from it are in ``samples.py``.
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "manual_test"))
@@ -0,0 +1,74 @@
+"""Sample exports for the tests, built with ``manual_test/generate_sample.py``
+(importable thanks to ``conftest.py``)."""
+
+from pathlib import Path
+from typing import Iterable, List, Sequence
+
+import generate_sample
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+NEW_SAMPLE = REPO_ROOT / "manual_test" / "sample-new-format-2026-06.xlsx"
+OLD_SAMPLE = REPO_ROOT / "manual_test" / "sample-old-format-pre-2026-06.xlsx"
+
+CHECKING = generate_sample.ACCOUNT_CHECKING
+CREDIT = generate_sample.ACCOUNT_CREDIT
+
+
+def row(
+    txn_id: str,
+    booked: str,
+    payee: str = "SPAR MAGYARORSZAG KFT",
+    amount: float = -100.0,
+    account: str = CHECKING,
+) -> List:
+    """A transaction row like the sample's first one, booked on ``booked``
+    (``YYYY-MM-DD``)."""
+    values = list(generate_sample.ROWS[0])
+    values[0] = account
+    values[2] = payee
+    values[6] = txn_id
+    values[7] = booked + " 12:00:00"
+    values[8] = booked
+    values[9] = amount
+    return values
+
+
+def export(path, extra_rows: Iterable[Sequence] = ()) -> str:
+    """Save the sample export with ``extra_rows`` appended to ``path``."""
+    wb = generate_sample.build_workbook()
+    ws = wb[generate_sample.TRANSACTIONS_SHEET_NAME]
+    # The sample ends with an incomplete row; appended rows go after it.
+    for values in extra_rows:
+        ws.append(list(values))
+    wb.save(path)
+    return str(path)
+
+
+def quarter_export(
+    path,
+    booking_dates: Sequence[str],
+    window: Sequence[str] = ("2024-01-10", "2024-03-20"),
+) -> str:
+    """Save the sample export with one row per booking date (alternating
+    between the two accounts) instead of its own rows, and the query
+    ``window``, to ``path``."""
+    wb = generate_sample.build_workbook()
+    ws = wb[generate_sample.TRANSACTIONS_SHEET_NAME]
+    for cells in ws.iter_rows():
+        if cells[0].value == "Lekérdezés kezdete":
+            cells[1].value = window[0]
+        elif cells[0].value == "Lekérdezés vége":
+            cells[1].value = window[1]
+    header_row = next(
+        cells[0].row
+        for cells in ws.iter_rows()
+        if [cell.value for cell in cells[:2]] == generate_sample.HEADER[:2]
+    )
+    ws.delete_rows(header_row + 1, ws.max_row)
+    for i, booked in enumerate(booking_dates):
+        txn_id = "%s%08d" % (booked.replace("-", ""), i)
+        ws.append(
+            row(txn_id, booked, amount=-4990.0, account=(CHECKING, CREDIT)[i % 2])
+        )
+    wb.save(path)
+    return str(path)
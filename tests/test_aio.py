@@ -0,0 +1,143 @@
+"""Tests for parsing exports from asyncio code."""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from ofxstatement.ui import UI
+
+from ofxstatement_otp import aio
+from ofxstatement_otp.otp import OtpPlugin
+from samples import NEW_SAMPLE, OLD_SAMPLE
+
+
+def test_parse_matches_the_plugin():
+    expected = OtpPlugin(UI(), {}).get_parser(str(NEW_SAMPLE)).parse()
+
+    statement = asyncio.run(aio.parse(str(NEW_SAMPLE)))
+
+    assert statement.account_id == expected.account_id
+    assert statement.start_date == expected.start_date
+    assert [line.id for line in statement.lines] == [line.id for line in expected.lines]
+    assert [line.amount for line in statement.lines] == [
+        line.amount for line in expected.lines
+    ]
+
+
+def test_stream_yields_batches_with_the_statement():
+    async def collect():
+        stream = aio.LineStream(str(OLD_SAMPLE), batch_size=3)
+        return stream, [batch async for batch in stream]
+
+    stream, batches = asyncio.run(collect())
+
+    assert stream.plugin == "otp_legacy"
+    assert stream.statement is not None and stream.statement.account_id
+    assert [len(batch) for batch in batches] == [3, 3, 2]
+
+
+def test_stream_applies_settings():
+    async def count():
+        stream = aio.LineStream(str(NEW_SAMPLE), {"account": "3333"})
+        return sum([len(batch) async for batch in stream])
+
+    assert asyncio.run(count()) == 2
+
+
+def test_parser_waits_for_a_slow_consumer():
+    async def consume():
+        stream = aio.LineStream(str(NEW_SAMPLE), batch_size=1, max_batches=1)
+        queued = []
+        async for _ in stream:
+            await asyncio.sleep(0.05)
+            assert stream._queue is not None
+            queued.append(stream._queue.qsize())
+        return queued
+
+    queued = asyncio.run(consume())
+
+    assert len(queued) == 8
+    # the next batch (and the end marker) at most, never the whole export
+    assert max(queued) <= 2
+
+
+def test_closing_early_stops_the_parser():
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    async def first_batch():
+        stream = aio.LineStream(
+            str(NEW_SAMPLE), batch_size=1, max_batches=1, executor=executor
+        )
+        batches = stream.__aiter__()
+        first = await batches.__anext__()
+        await batches.aclose()  # type: ignore[attr-defined]
+        # the executor thread is free again
+        loop = asyncio.get_running_loop()
+        assert await loop.run_in_executor(executor, lambda: "free") == "free"
+        return first
+
+    try:
+        assert len(asyncio.run(asyncio.wait_for(first_batch(), timeout=10))) == 1
+    finally:
+        executor.shutdown()
+
+
+def test_cancelling_the_consumer_stops_the_parser():
+    async def cancel():
+        stream = aio.LineStream(str(NEW_SAMPLE), batch_size=1, max_batches=1)
+        started = asyncio.Event()
+
+        async def consume():
+            async for _ in stream:
+                started.set()
+                await asyncio.sleep(10)
+
+        task = asyncio.ensure_future(consume())
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return stream
+
+    stream = asyncio.run(asyncio.wait_for(cancel(), timeout=10))
+    assert stream._stopped.is_set()
+
+
+def test_parser_errors_are_raised(tmp_path):
+    bogus = tmp_path / "bogus.xlsx"
+    bogus.write_bytes(b"not a workbook")
+
+    with pytest.raises(ValueError, match="not a recognised OTP export"):
+        asyncio.run(aio.parse(str(bogus)))
+
+
+def test_stream_can_only_be_iterated_once():
+    async def twice():
+        stream = aio.LineStream(str(NEW_SAMPLE))
+        async for _ in stream:
+            pass
+        async for _ in stream:
+            pass
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(twice())
+
+
+def test_incremental_state_is_saved_once_the_consumer_is_done(tmp_path):
+    settings = {"incremental": str(tmp_path / "state")}
+
+    async def consume(stop_early):
+        stream = aio.LineStream(str(NEW_SAMPLE), settings, batch_size=1)
+        lines = 0
+        async for batch in stream:
+            lines += len(batch)
+            if stop_early:
+                break
+        return lines
+
+    # a consumer that stops early has not stored the rest: nothing is saved
+    assert asyncio.run(consume(stop_early=True)) == 1
+    assert list((tmp_path / "state").glob("*.json")) == []
+    lines = asyncio.run(consume(stop_early=False))
+    assert lines > 1
+    assert asyncio.run(consume(stop_early=False)) == 0
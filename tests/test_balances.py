@@ -0,0 +1,134 @@
+"""Tests for balances reconstructed from an anchor balance."""
+
+import json
+from decimal import Decimal
+
+import pytest
+
+from ofxstatement_otp import cli
+from ofxstatement_otp.balances import RunningBalances
+from ofxstatement_otp.otp import OtpXlsxParser
+from ofxstatement_otp.otp_legacy import OtpLegacyXlsxParser
+from ofxstatement_otp.state import committing
+from samples import CHECKING, CREDIT, NEW_SAMPLE, OLD_SAMPLE, export, row
+
+
+def _total(statement):
+    return sum(line.amount for line in statement.lines)
+
+
+def test_balance_setting_is_the_opening_balance():
+    settings = {"account": CHECKING, "balance": "100 000"}
+
+    statement = OtpXlsxParser(str(NEW_SAMPLE), settings).parse()
+
+    assert statement.start_balance == Decimal("100000")
+    assert statement.end_balance == Decimal("100000") + _total(statement)
+    statement.assert_valid()
+
+
+def test_no_balances_without_settings():
+    statement = OtpXlsxParser(str(NEW_SAMPLE), {"account": CHECKING}).parse()
+
+    assert statement.start_balance is None
+    assert statement.end_balance is None
+
+
+def test_invalid_balance_is_rejected():
+    with pytest.raises(ValueError, match="Invalid balance 'lots'"):
+        OtpXlsxParser(str(NEW_SAMPLE), {"balance": "lots"})
+
+
+def test_statement_of_several_accounts_has_no_balances(caplog):
+    statement = OtpXlsxParser(str(NEW_SAMPLE), {"balance": "1000"}).parse()
+
+    assert statement.start_balance is None
+    assert statement.end_balance is None
+    assert "Ignoring the balance setting" in caplog.text
+
+
+def test_parse_accounts_anchors_the_first_account(caplog):
+    statements = OtpXlsxParser(str(NEW_SAMPLE), {"balance": "1000"}).parse_accounts()
+    assert "Ignoring the balance setting" not in caplog.text
+
+    checking, credit = statements[CHECKING], statements[CREDIT]
+    assert checking.start_balance == Decimal("1000")
+    assert checking.end_balance == Decimal("1000") + _total(checking)
+    assert (credit.start_balance, credit.end_balance) == (None, None)
+
+
+def test_legacy_parser():
+    statement = OtpLegacyXlsxParser(str(OLD_SAMPLE), {"balance": "-50.5"}).parse()
+
+    assert statement.start_balance == Decimal("-50.5")
+    assert statement.end_balance == Decimal("-50.5") + _total(statement)
+    statement.assert_valid()
+
+
+def _converted(path, settings):
+    """The statement of ``path``, with the incremental state committed."""
+    parser = OtpXlsxParser(path, settings)
+    with committing(parser.state):
+        return cli.read_statement(parser)
+
+
+def test_incremental_runs_carry_the_balance_over(tmp_path):
+    settings = {
+        "account": CHECKING,
+        "balance": "1000",
+        "incremental": str(tmp_path / "state"),
+    }
+    day1 = _converted(export(tmp_path / "day1.xlsx"), settings)
+    assert day1.start_balance == Decimal("1000")
+    state = json.loads((tmp_path / "state" / f"{CHECKING}.json").read_text())
+    assert Decimal(state["balance"]) == day1.end_balance
+
+    day2_export = export(
+        tmp_path / "day2.xlsx",
+        [
+            row("2024020100000011200", "2024-02-01", amount=-2000.25),
+            row("2024020200000011201", "2024-02-02", amount=500.0),
+        ],
+    )
+    day2 = _converted(day2_export, settings)
+
+    # only the new rows; the balance setting no longer applies
+    assert len(day2.lines) == 2
+    assert day2.start_balance == day1.end_balance
+    assert day2.end_balance == day1.end_balance - Decimal("1500.25")
+    state = json.loads((tmp_path / "state" / f"{CHECKING}.json").read_text())
+    assert Decimal(state["balance"]) == day2.end_balance
+
+    # nothing new: the balance stands
+    day3 = _converted(day2_export, settings)
+    assert day3.lines == []
+    assert day3.start_balance == day3.end_balance == day2.end_balance
+
+
+def test_running_balances_per_account():
+    class Record:
+        def __init__(self, account_no, amount):
+            self.account_no = account_no
+            self.amount = Decimal(amount)
+
+    balances = RunningBalances(Decimal("10"))
+    statement = OtpXlsxParser(str(NEW_SAMPLE)).statement
+    records = [Record("a", "1"), Record("b", "5"), Record("a", "-3")]
+
+    assert list(balances.running(records, statement)) == records
+    assert balances.balances("a") == (Decimal("10"), Decimal("8"))
+    assert balances.balances("b") == (None, None)
+
+
+def test_streamed_output_has_the_ledger_balance(tmp_path):
+    # the end balance is only known after the last line has been written
+    output = tmp_path / "out.ofx"
+    settings = {"account": CHECKING, "balance": "1000"}
+
+    result = cli.convert_export(str(NEW_SAMPLE), str(output), settings)
+
+    assert result.error is None
+    statement = OtpXlsxParser(str(NEW_SAMPLE), settings).parse()
+    end_balance = Decimal("1000") + _total(statement)
+    text = output.read_text(encoding="utf-8")
+    assert "<LEDGERBAL><BALAMT>%.2f</BALAMT>" % end_balance in text
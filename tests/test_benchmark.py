@@ -0,0 +1,77 @@
+"""Tests for the benchmark harness and the large-sample generator in
+``manual_test/``."""
+
+import benchmark
+import generate_sample
+import pytest
+
+from ofxstatement_otp.detect import FORMAT_CURRENT, FORMAT_LEGACY, detect_format
+from ofxstatement_otp.xlsx import hidden_rows
+
+CASE = {"rows": 300, "accounts": 4, "hidden_ratio": 0.05, "pending_ratio": 0.05}
+
+
+@pytest.mark.parametrize(
+    "layout, plugin",
+    [
+        (generate_sample.LAYOUT_CURRENT, FORMAT_CURRENT),
+        (generate_sample.LAYOUT_LEGACY, FORMAT_LEGACY),
+    ],
+)
+def test_large_sample_is_detected_and_has_hidden_rows(tmp_path, layout, plugin):
+    path = benchmark.ensure_sample(str(tmp_path), dict(CASE, layout=layout))
+    assert detect_format(path) == plugin
+    assert hidden_rows(path, generate_sample.TRANSACTIONS_SHEET_NAME)
+
+
+@pytest.mark.parametrize(
+    "layout, reader",
+    [
+        (generate_sample.LAYOUT_CURRENT, "openpyxl"),
+        (generate_sample.LAYOUT_CURRENT, "xml"),
+        (generate_sample.LAYOUT_LEGACY, "-"),
+    ],
+)
+def test_run_case_times_every_phase(tmp_path, layout, reader):
+    path = benchmark.ensure_sample(str(tmp_path), dict(CASE, layout=layout))
+    result = benchmark.run_case(path, layout, reader)
+
+    # Hidden and pending rows are skipped; the rest all become lines, and
+    # the two layouts hold the same transactions.
+    booked = [
+        values
+        for values, hidden in generate_sample.synthetic_rows(**CASE)
+        if not hidden and values[8]
+    ]
+    assert result["lines"] == len(booked)
+    seconds = result["seconds"]
+    assert seconds["total"] >= seconds["records"] > 0
+    assert (seconds["load"] is None) == (reader == "xml")
+    for phase in ("header", "metadata", "lines", "ofx"):
+        assert seconds[phase] is not None
+    # not cached
+    assert seconds["cache"] is None
+    assert result["peak_rss_mb"] > 0
+
+
+def test_regressions_compare_matching_cases():
+    def result(rows, total, rss):
+        return dict(
+            CASE,
+            layout="current",
+            reader="xml",
+            rows=rows,
+            seconds={"total": total},
+            peak_rss_mb=rss,
+        )
+
+    baseline = {"results": [result(1000, 1.0, 100.0), result(2000, 2.0, 100.0)]}
+    found = benchmark.regressions(
+        [result(1000, 1.1, 150.0), result(2000, 3.0, 100.0), result(3000, 9.0, 1.0)],
+        baseline,
+        tolerance=0.2,
+    )
+    assert found == [
+        "current xml, 1000 rows: peak RSS 100.00 -> 150.00 (+50%)",
+        "current xml, 2000 rows: time 2.00 -> 3.00 (+50%)",
+    ]
@@ -0,0 +1,149 @@
+"""Tests for the on-disk parse cache shared by both parsers."""
+
+import io
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ofxstatement_otp import cli, otp, otp_legacy
+from ofxstatement_otp.cache import ParseCache
+from ofxstatement_otp.otp import OtpXlsxParser
+from ofxstatement_otp.otp_legacy import OtpLegacyXlsxParser
+from samples import NEW_SAMPLE, OLD_SAMPLE
+
+
+@pytest.fixture
+def no_workbooks(monkeypatch):
+    """Make any attempt to open a workbook fail."""
+
+    def fail(filename):
+        raise AssertionError("workbook opened on a cache hit")
+
+    monkeypatch.setattr(otp, "load_workbook", fail)
+    monkeypatch.setattr(otp_legacy, "load_workbook", fail)
+
+
+def _lines(statement):
+    return [(l.id, l.date, l.amount, l.payee, l.trntype) for l in statement.lines]
+
+
+def test_cache_hit_skips_the_workbook(tmp_path, request):
+    settings = {"cache": str(tmp_path), "account": "3333"}
+    first = OtpXlsxParser(str(NEW_SAMPLE), settings).parse()
+    assert len(os.listdir(tmp_path)) == 1
+
+    request.getfixturevalue("no_workbooks")
+    second = OtpXlsxParser(str(NEW_SAMPLE), settings).parse()
+    assert _lines(second) == _lines(first)
+    assert second.account_id == first.account_id == "33333333-44444444"
+    assert second.start_date == first.start_date
+    assert second.currency == "HUF"
+
+
+def test_legacy_cache_hit_skips_the_workbook(tmp_path, request):
+    settings = {"cache": str(tmp_path)}
+    first = OtpLegacyXlsxParser(str(OLD_SAMPLE), settings).parse()
+
+    request.getfixturevalue("no_workbooks")
+    second = OtpLegacyXlsxParser(str(OLD_SAMPLE), settings).parse()
+    assert _lines(second) == _lines(first)
+    assert second.start_date == first.start_date
+
+
+def test_settings_and_content_are_part_of_the_key(tmp_path):
+    cache = ParseCache(str(tmp_path))
+    copy = tmp_path / "copy.xlsx"
+    shutil.copy(NEW_SAMPLE, copy)
+    key = cache.key(str(NEW_SAMPLE), "OtpXlsxParser", {"account": "1111"})
+    assert key == cache.key(str(copy), "OtpXlsxParser", {"account": "1111"})
+    assert key != cache.key(str(NEW_SAMPLE), "OtpXlsxParser", {"account": "3333"})
+    assert key != cache.key(str(NEW_SAMPLE), "OtpLegacyXlsxParser", {})
+    copy.write_bytes(copy.read_bytes() + b"\0")
+    assert key != cache.key(str(copy), "OtpXlsxParser", {"account": "1111"})
+
+
+def test_partial_parse_is_not_cached(tmp_path):
+    parser = OtpXlsxParser(str(NEW_SAMPLE), {"cache": str(tmp_path)})
+    next(iter(parser.split_records()))
+    assert os.listdir(tmp_path) == []
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ParseCache(str(tmp_path), max_bytes=10_000)
+    payload = [(os.urandom(2000).hex(),)]  # ~2 kB compressed per entry
+    for n, key in enumerate(["a-1", "b-1", "c-1"]):
+        cache.store(key, {}, payload)
+        os.utime(cache._path(key), (n, n))
+    assert cache.load("a-1") is not None  # now the most recently used
+
+    cache.max_bytes = 2 * os.path.getsize(cache._path("a-1"))
+    assert cache.evict() == 1
+    assert cache.load("b-1") is None
+    assert cache.load("a-1") is not None
+    assert cache.load("c-1") is not None
+
+
+def test_entries_removed_by_another_process_are_skipped(tmp_path, monkeypatch):
+    cache = ParseCache(str(tmp_path))
+    for key in ("a-1", "b-1"):
+        cache.store(key, {}, [("x",)])
+    cache.max_bytes = 0
+    entries = cache._entries()
+    os.remove(cache._path("a-1"))  # evicted concurrently after the scan
+    monkeypatch.setattr(cache, "_entries", lambda: entries)
+    assert cache.evict() == 1
+    assert cache.invalidate() == 0
+
+
+def test_threads_storing_the_same_entry_do_not_collide(tmp_path):
+    cache = ParseCache(str(tmp_path))
+    payload = [(str(n),) for n in range(1000)]
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda _: cache.store("a-1", {}, payload), range(32)))
+    assert os.listdir(tmp_path) == [os.path.basename(cache._path("a-1"))]
+    assert cache.load("a-1") is not None
+
+
+def test_unreadable_entry_is_a_miss(tmp_path):
+    cache = ParseCache(str(tmp_path))
+    (tmp_path / "broken-1.cache").write_bytes(b"garbage")
+    assert cache.load("broken-1") is None
+
+
+def test_invalidate_selected_files_or_everything(tmp_path):
+    cache_dir = tmp_path / "cache"
+    for sample, parser in (
+        (NEW_SAMPLE, OtpXlsxParser),
+        (OLD_SAMPLE, OtpLegacyXlsxParser),
+    ):
+        parser(str(sample), {"cache": str(cache_dir)}).parse()
+    assert len(os.listdir(cache_dir)) == 2
+
+    argv = ["invalidate-cache", "--cache-dir", str(cache_dir), str(OLD_SAMPLE)]
+    assert cli.run(argv) == 0
+    assert len(os.listdir(cache_dir)) == 1
+
+    assert cli.run(["invalidate-cache", "--cache-dir", str(cache_dir)]) == 0
+    assert os.listdir(cache_dir) == []
+
+
+def test_cache_is_off_by_default():
+    assert ParseCache.from_settings({}) is None
+    assert ParseCache.from_settings({"cache": "no"}) is None
+    cache = ParseCache.from_settings({"cache": "yes", "cache_size": "1"})
+    assert cache is not None and cache.max_bytes == 1 << 20
+
+
+def test_uploads_share_cache_entries_with_files(tmp_path, request):
+    settings = {"cache": str(tmp_path)}
+    first = OtpXlsxParser(str(NEW_SAMPLE), settings).parse()
+
+    request.getfixturevalue("no_workbooks")
+    upload = io.BytesIO(NEW_SAMPLE.read_bytes())
+    upload.seek(10)
+    second = OtpXlsxParser(upload, settings).parse()
+    assert _lines(second) == _lines(first)
+    # the digest leaves the file where it was
+    assert upload.tell() == 10
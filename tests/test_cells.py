@@ -0,0 +1,80 @@
+"""Tests for the conversion of date and amount cells."""
+
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from ofxstatement_otp.cells import (
+    DATE_FORMAT,
+    DATETIME_FORMAT,
+    parse_date,
+    parse_datetime,
+    to_decimal,
+)
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["2024-01-07 18:45:00", "2024-12-31 23:59:59", "2024-1-7 8:05:00"],
+)
+def test_parse_datetime_matches_strptime(text):
+    assert parse_datetime(text) == datetime.strptime(text, DATETIME_FORMAT)
+
+
+@pytest.mark.parametrize("text", ["2024-01-07", "2024-1-7"])
+def test_parse_date_matches_strptime(text):
+    assert parse_date(text) == datetime.strptime(text, DATE_FORMAT)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "2024-01-07T18:45:00",
+        "2024-01-07 18:45+01",
+        "2024-02-30 10:00:00",
+        "2024-01-07",
+        "",
+    ],
+)
+def test_parse_datetime_rejects_what_strptime_rejects(text):
+    with pytest.raises(ValueError):
+        parse_datetime(text)
+
+
+@pytest.mark.parametrize("text", ["20240107", "2024-W01-1", "2024-02-30", ""])
+def test_parse_date_rejects_what_strptime_rejects(text):
+    with pytest.raises(ValueError):
+        parse_date(text)
+
+
+def test_native_datetimes_pass_through():
+    value = datetime(2024, 1, 7, 18, 45)
+    assert parse_datetime(value) is value
+    assert parse_date(value) is value
+
+
+def test_repeated_dates_share_one_object():
+    assert parse_date("2024-03-01") is parse_date("2024-03-01")
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (-15500.5, "-15500.5"),
+        (0.1, "0.1"),
+        (12, "12"),
+        (1e-7, "1E-7"),
+        ("-1234.50", "-1234.50"),
+        (Decimal("3.10"), "3.10"),
+    ],
+)
+def test_to_decimal(value, expected):
+    assert str(to_decimal(value)) == expected
+    # cached conversions give the same result
+    assert str(to_decimal(value)) == expected
+
+
+def test_to_decimal_keeps_the_sign_of_zero():
+    assert str(to_decimal(0.0)) == "0.0"
+    assert str(to_decimal(-0.0)) == "-0.0"
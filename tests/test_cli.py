@@ -0,0 +1,248 @@
+"""Tests for the ``ofxstatement-otp`` bulk conversion command."""
+
+import json
+import logging
+import os
+import re
+import shutil
+
+import pytest
+
+from ofxstatement_otp import cli
+from samples import NEW_SAMPLE, OLD_SAMPLE
+
+
+def test_split_writes_one_ofx_per_account(tmp_path):
+    assert cli.run(["split", str(NEW_SAMPLE), str(tmp_path)]) == 0
+
+    written = sorted(p.name for p in tmp_path.iterdir())
+    assert written == [
+        "sample-new-format-2026-06-11111111-22222222.ofx",
+        "sample-new-format-2026-06-33333333-44444444.ofx",
+    ]
+    credit = (tmp_path / written[1]).read_text(encoding="utf-8")
+    assert "<ACCTID>33333333-44444444</ACCTID>" in credit
+    assert credit.count("<STMTTRN>") == 2
+    assert "<BANKID>OTPVHUHB</BANKID>" in credit
+
+
+def test_split_reads_settings_from_config(tmp_path):
+    config = tmp_path / "config.ini"
+    config.write_text("[otp:credit]\nplugin = otp\naccount = 3333\n")
+    out = tmp_path / "out"
+    argv = ["split", "-c", str(config), "-t", "otp:credit", str(NEW_SAMPLE), str(out)]
+    assert cli.run(argv) == 0
+
+    # The account filter narrows the fan-out to the credit account.
+    (only,) = out.iterdir()
+    assert only.name == "sample-new-format-2026-06-33333333-44444444.ofx"
+
+
+def test_split_by_period(tmp_path):
+    assert (
+        cli.run(["split", "--period", "quarter", str(NEW_SAMPLE), str(tmp_path)]) == 0
+    )
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "sample-new-format-2026-06-11111111-22222222-2024-Q1.ofx",
+        "sample-new-format-2026-06-33333333-44444444-2024-Q1.ofx",
+    ]
+    credit = tmp_path / "sample-new-format-2026-06-33333333-44444444-2024-Q1.ofx"
+    text = credit.read_text(encoding="utf-8")
+    assert text.count("<STMTTRN>") == 2
+    # the quarter, narrowed to the export's query window
+    assert "<DTSTART>20240101</DTSTART><DTEND>20240131</DTEND>" in text
+
+
+def test_batch_converts_both_formats_in_parallel(tmp_path, caplog):
+    exports = tmp_path / "exports"
+    exports.mkdir()
+    for sample in (NEW_SAMPLE, OLD_SAMPLE):
+        shutil.copy(sample, exports / sample.name)
+    out = tmp_path / "out"
+
+    caplog.set_level(logging.INFO)
+    assert cli.run(["batch", "-j", "2", "-o", str(out), str(exports)]) == 0
+
+    assert sorted(p.name for p in out.iterdir()) == [
+        "sample-new-format-2026-06.ofx",
+        "sample-old-format-pre-2026-06.ofx",
+    ]
+    assert "8 lines (otp)" in caplog.text
+    assert "8 lines (otp_legacy)" in caplog.text
+    assert "Converted 2 of 2 exports (16 lines)" in caplog.text
+
+
+def test_batch_numbers_outputs_of_exports_with_the_same_name(tmp_path, caplog):
+    for folder in ("a", "b"):
+        (tmp_path / folder).mkdir()
+        shutil.copy(NEW_SAMPLE, tmp_path / folder / "x.xlsx")
+    out = tmp_path / "out"
+
+    caplog.set_level(logging.INFO)
+    args = ["batch", "-o", str(out), str(tmp_path / "a"), str(tmp_path / "b")]
+    assert cli.run(args) == 0
+
+    assert sorted(p.name for p in out.iterdir()) == ["x-2.ofx", "x.ofx"]
+    assert "writing x-2.ofx, as the name is taken" in caplog.text
+    assert "Converted 2 of 2" in caplog.text
+
+
+def test_output_paths_are_unique():
+    assert cli.output_paths(["a/x.xlsx", "b/X.xlsx", "c/x.xlsx"], "out", ".csv") == [
+        os.path.join("out", "x.csv"),
+        os.path.join("out", "X-2.csv"),
+        os.path.join("out", "x-3.csv"),
+    ]
+
+
+def test_batch_reports_failures_without_aborting(tmp_path):
+    broken = tmp_path / "broken.xlsx"
+    broken.write_bytes(b"not a zip file")
+    out = tmp_path / "out"
+    argv = ["batch", "-j", "1", "-o", str(out), str(broken), str(NEW_SAMPLE)]
+    assert cli.run(argv) == 2
+    assert [p.name for p in out.iterdir()] == ["sample-new-format-2026-06.ofx"]
+
+
+def test_batch_output_matches_convert(tmp_path):
+    out = tmp_path / "out"
+    assert cli.run(["batch", "-j", "1", "-o", str(out), str(NEW_SAMPLE)]) == 0
+
+    _, parser = cli.open_export(str(NEW_SAMPLE), {})
+    expected = cli.ofx_text(parser.parse())
+    written = (out / "sample-new-format-2026-06.ofx").read_bytes().decode("utf-8")
+    # identical but for the generation time
+    server_time = re.compile(r"<DTSERVER>\d+</DTSERVER>")
+    assert server_time.sub("", written) == server_time.sub("", expected)
+
+
+def test_stream_ofx_leaves_no_partial_file(tmp_path):
+    statement = cli.open_export(str(NEW_SAMPLE), {})[1].parse()
+    lines, statement.lines = statement.lines, []
+
+    def failing():
+        yield lines[0]
+        raise ValueError("broken row")
+
+    output = tmp_path / "statement.ofx"
+    with pytest.raises(ValueError):
+        cli.stream_ofx(statement, failing(), str(output))
+    assert list(tmp_path.iterdir()) == []
+
+    assert cli.stream_ofx(statement, lines, str(output)) == len(lines)
+    assert [p.name for p in tmp_path.iterdir()] == ["statement.ofx"]
+
+
+def test_find_exports_expands_directories_and_globs(tmp_path):
+    for name in ("a.xlsx", "b.xlsx", "notes.txt"):
+        (tmp_path / name).write_text("")
+    assert cli.find_exports([str(tmp_path)]) == [
+        str(tmp_path / "a.xlsx"),
+        str(tmp_path / "b.xlsx"),
+    ]
+    assert cli.find_exports([str(tmp_path / "a*")]) == [str(tmp_path / "a.xlsx")]
+
+
+def _with_extra_row(src, dst, row):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(src)
+    wb["Tranzakciók"].append(row)
+    wb.save(dst)
+
+
+def test_merge_drops_duplicates_across_exports(tmp_path, caplog):
+    # A later export repeating the sample's transactions, plus a new one.
+    later = tmp_path / "later.xlsx"
+    new_row = [
+        "33333333-44444444",
+        "",
+        "NEW SHOP",
+        "VÁSÁRLÁS KÁRTYÁVAL",
+        "memo",
+        "Egyéb",
+        "2024010100000012003",
+        "2024-01-01 08:00:00",
+        "2024-01-01",
+        -10.0,
+        "HUF",
+    ]
+    _with_extra_row(NEW_SAMPLE, later, new_row)
+    out = tmp_path / "out"
+
+    caplog.set_level(logging.INFO)
+    argv = ["merge", "-o", str(out), str(NEW_SAMPLE), str(later), str(OLD_SAMPLE)]
+    assert cli.run(argv) == 0
+
+    assert sorted(p.name for p in out.iterdir()) == [
+        "merged-11111111-22222222.ofx",
+        "merged-11773016-12345678.ofx",
+        "merged-33333333-44444444.ofx",
+    ]
+    assert "later.xlsx: 1 new lines" in caplog.text
+    credit = (out / "merged-33333333-44444444.ofx").read_text(encoding="utf-8")
+    assert credit.count("<STMTTRN>") == 3
+    # Date-sorted: the new (earliest) transaction comes first.
+    assert credit.index("NEW SHOP") < credit.index("MEDIA MARKT")
+    assert "<DTSTART>20240101" in credit
+
+
+def test_merge_keeps_an_index_between_runs(tmp_path):
+    index = tmp_path / "index.sqlite"
+    out = tmp_path / "out"
+    argv = ["merge", "--index", str(index), "-o", str(out)]
+    assert cli.run(argv + [str(NEW_SAMPLE)]) == 0
+    assert cli.run(argv + [str(OLD_SAMPLE)]) == 0
+    # The second run still writes the accounts of the first one.
+    assert len(list(out.iterdir())) == 3
+
+
+def test_merge_reports_broken_exports(tmp_path):
+    broken = tmp_path / "broken.xlsx"
+    broken.write_bytes(b"not a zip file")
+    out = tmp_path / "out"
+    assert cli.run(["merge", "-o", str(out), str(broken), str(NEW_SAMPLE)]) == 2
+    assert len(list(out.iterdir())) == 2
+
+
+def test_export_writes_one_file_per_export(tmp_path, caplog):
+    out = tmp_path / "out"
+    caplog.set_level(logging.INFO)
+    argv = ["export", "-f", "csv", "-o", str(out), str(NEW_SAMPLE), str(OLD_SAMPLE)]
+    assert cli.run(argv) == 0
+    assert sorted(p.name for p in out.iterdir()) == [
+        "sample-new-format-2026-06.csv",
+        "sample-old-format-pre-2026-06.csv",
+    ]
+    assert "8 transactions (otp_legacy)" in caplog.text
+    header = (out / "sample-old-format-pre-2026-06.csv").read_text("utf-8")
+    assert header.startswith("transaction_date,booking_date,description,in_or_out")
+
+
+def test_export_numbers_outputs_of_exports_with_the_same_name(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    shutil.copy(NEW_SAMPLE, tmp_path / "a" / "x.xlsx")
+    shutil.copy(OLD_SAMPLE, tmp_path / "b" / "x.xlsx")
+    out = tmp_path / "out"
+    argv = ["export", "-f", "csv", "-o", str(out)]
+    assert cli.run(argv + [str(tmp_path / "a"), str(tmp_path / "b")]) == 0
+
+    assert sorted(p.name for p in out.iterdir()) == ["x-2.csv", "x.csv"]
+    assert (out / "x-2.csv").read_text("utf-8").startswith("transaction_date,")
+
+
+def test_batch_profile_includes_ofx_writing(tmp_path):
+    profile = tmp_path / "profile.jsonl"
+    config = tmp_path / "config.ini"
+    config.write_text(f"[otp:profiled]\nprofile = {profile}\n")
+    argv = ["batch", "-c", str(config), "-t", "otp:profiled", "-j", "1"]
+    argv += ["-o", str(tmp_path / "out"), str(NEW_SAMPLE), str(OLD_SAMPLE)]
+    assert cli.run(argv) == 0
+    reports = [json.loads(line) for line in profile.read_text("utf-8").splitlines()]
+    assert sorted(report["parser"] for report in reports) == [
+        "OtpLegacyXlsxParser",
+        "OtpXlsxParser",
+    ]
+    assert all("ofx" in report["phases"] for report in reports)
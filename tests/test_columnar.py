@@ -0,0 +1,118 @@
+"""Tests for the Parquet/CSV transaction writers."""
+
+import csv
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from ofxstatement_otp import columnar
+from ofxstatement_otp.otp import OtpXlsxParser, Transaction
+from ofxstatement_otp.otp_legacy import OtpLegacyXlsxParser
+from ofxstatement_otp.otp_legacy import Transaction as LegacyTransaction
+from samples import NEW_SAMPLE, OLD_SAMPLE
+
+
+def _records():
+    return OtpXlsxParser(str(NEW_SAMPLE)).split_records()
+
+
+def test_csv_has_every_field(tmp_path):
+    path = tmp_path / "out.csv"
+    assert columnar.write_csv(_records(), Transaction, str(path)) == 8
+    with open(path, encoding="utf-8", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert list(rows[0]) == [
+        "account_no",
+        "partner_account",
+        "partner_name",
+        "description",
+        "memo",
+        "category",
+        "bank_txn_id",
+        "transaction_date",
+        "booking_date",
+        "amount",
+        "currency",
+    ]
+    mol = next(row for row in rows if row["partner_name"] == "MOL TOLTOALLOMAS")
+    assert mol["category"] == "Üzemanyag"
+    assert mol["transaction_date"] == "2024-01-07 18:45:00"
+    assert mol["amount"] == "-15500.5"
+    assert mol["partner_account"] == ""
+
+
+def test_writers_stream_in_batches(tmp_path):
+    consumed = []
+
+    def records():
+        for record in _records():
+            consumed.append(record)
+            yield record
+
+    batches = columnar._batches(records(), 3)
+    assert len(next(batches)) == 3
+    # Only the first batch has been read from the parser so far.
+    assert len(consumed) == 3
+    assert [len(batch) for batch in batches] == [3, 2]
+
+    path = tmp_path / "out.csv"
+    assert columnar.write_csv(records(), Transaction, str(path), batch_size=3) == 8
+
+
+def test_parquet_keeps_types(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = tmp_path / "out.parquet"
+    records = OtpLegacyXlsxParser(str(OLD_SAMPLE)).split_records()
+    written = columnar.write_parquet(
+        records, LegacyTransaction, str(path), batch_size=3
+    )
+    assert written == 8
+
+    parquet = pq.ParquetFile(path)
+    assert parquet.metadata.num_row_groups == 3
+    rows = parquet.read().to_pylist()
+    assert rows[3]["amount"] == Decimal("-15500.5")
+    assert rows[3]["transaction_date"] == datetime(2024, 1, 7, 18, 45)
+    assert rows[0]["in_or_out"] == "K"
+    assert rows[0]["partner_account"] is None
+
+
+def _legacy_with_inexact_amounts(path):
+    """The legacy sample, with amounts that floats cannot represent exactly."""
+    from openpyxl import load_workbook
+
+    wb = load_workbook(OLD_SAMPLE)
+    ws = wb.active
+    ws["K2"] = 22560.98
+    ws["K3"] = -1234.56
+    wb.save(path)
+    return str(path)
+
+
+def test_inexact_legacy_amounts(tmp_path):
+    export = _legacy_with_inexact_amounts(tmp_path / "legacy.xlsx")
+    path = tmp_path / "out.csv"
+    records = OtpLegacyXlsxParser(export).split_records()
+    assert columnar.write_csv(records, LegacyTransaction, str(path)) == 8
+    with open(path, encoding="utf-8", newline="") as f:
+        amounts = [row["amount"] for row in csv.DictReader(f)]
+    assert amounts[:2] == ["22560.98", "-1234.56"]
+
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = tmp_path / "out.parquet"
+    records = OtpLegacyXlsxParser(export).split_records()
+    assert columnar.write_parquet(records, LegacyTransaction, str(path)) == 8
+    rows = pq.read_table(path).to_pylist()
+    assert [row["amount"] for row in rows[:2]] == [
+        Decimal("22560.98"),
+        Decimal("-1234.56"),
+    ]
+
+
+def test_auto_format_falls_back_to_csv(monkeypatch):
+    monkeypatch.setattr(columnar, "have_pyarrow", lambda: False)
+    assert columnar.resolve_format("auto") == "csv"
+    with pytest.raises(RuntimeError, match="pyarrow"):
+        columnar.resolve_format("parquet")
+    assert columnar.resolve_format("csv") == "csv"
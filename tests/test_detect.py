@@ -0,0 +1,118 @@
+"""Tests for telling current and legacy OTP exports apart by sniffing."""
+
+import zipfile
+
+import pytest
+
+from ofxstatement_otp import detect
+from ofxstatement_otp.detect import (
+    FORMAT_CURRENT,
+    FORMAT_LEGACY,
+    classify,
+    detect_format,
+    open_export,
+)
+from ofxstatement_otp.otp import OtpXlsxParser
+from ofxstatement_otp.otp_legacy import OtpLegacyXlsxParser
+from samples import NEW_SAMPLE, OLD_SAMPLE
+
+
+def test_detects_the_committed_samples():
+    assert detect_format(str(NEW_SAMPLE)) == FORMAT_CURRENT
+    assert detect_format(str(OLD_SAMPLE)) == FORMAT_LEGACY
+
+
+def test_not_an_xlsx_is_unknown(tmp_path):
+    path = tmp_path / "statement.xlsx"
+    path.write_bytes(b"not a zip file")
+    assert detect_format(str(path)) is None
+
+
+def test_workbook_without_transactions_sheet_is_unknown(tmp_path):
+    from openpyxl import Workbook
+
+    path = tmp_path / "other.xlsx"
+    Workbook().save(path)
+    assert detect_format(str(path)) is None
+
+
+def test_classify_current_by_header_without_preamble():
+    header = ["Számlaszám", "Ellenoldali számlaszám", "Ellenoldali név"]
+    assert classify([header]) == FORMAT_CURRENT
+
+
+def test_classify_current_by_preamble_label():
+    # The header may lie beyond the sniffed rows; the preamble still tells.
+    assert classify([["Számlatörténet"], [], ["Lekérdezés kezdete", "2024-01-01"]]) == (
+        FORMAT_CURRENT
+    )
+
+
+@pytest.mark.parametrize(
+    "row2",
+    [
+        ["2024-01-02", "2024-01-02"],  # no time in A
+        ["2024-01-02 09:15:00", None],  # no booking date
+        ["2024-01-02 09:15:00", "2024-01-02"] + [None] * 11,  # too wide
+    ],
+)
+def test_classify_rejects_other_layouts(row2):
+    assert classify([["fejléc"], row2]) is None
+
+
+def test_plugins_reject_the_other_format():
+    from ofxstatement_otp.otp import OtpPlugin
+    from ofxstatement_otp.otp_legacy import OtpLegacyPlugin
+
+    with pytest.raises(ValueError, match="otp_legacy plugin"):
+        OtpPlugin(None, {}).get_parser(str(OLD_SAMPLE))
+    with pytest.raises(ValueError, match="otp plugin"):
+        OtpLegacyPlugin(None, {}).get_parser(str(NEW_SAMPLE))
+
+
+def test_sniffing_stops_after_the_first_rows(tmp_path):
+    # A corrupt tail must not matter: only the first rows are ever parsed.
+    path = tmp_path / "truncated.xlsx"
+    with zipfile.ZipFile(NEW_SAMPLE) as zin, zipfile.ZipFile(path, "w") as zout:
+        for name in zin.namelist():
+            data = zin.read(name)
+            if name == "xl/worksheets/sheet1.xml":
+                start = data.index(b'<row r="10"')
+                end = data.index(b'<row r="11"')
+                filler = b"".join(
+                    data[start:end].replace(b'"10"', b'"%d"' % row)
+                    for row in range(10, 2000)
+                )
+                data = data[:start] + filler + b"<row r=" + b"<" * 1000
+            zout.writestr(name, data)
+    assert detect_format(str(path)) == FORMAT_CURRENT
+
+
+@pytest.mark.parametrize(
+    "sample, plugin, parser_type",
+    [
+        (NEW_SAMPLE, FORMAT_CURRENT, OtpXlsxParser),
+        (OLD_SAMPLE, FORMAT_LEGACY, OtpLegacyXlsxParser),
+    ],
+)
+def test_open_export_sniffs_once(sample, plugin, parser_type, monkeypatch):
+    sniffed = []
+    sniff_rows = detect.sniff_rows
+    monkeypatch.setattr(
+        detect,
+        "sniff_rows",
+        lambda source: sniffed.append(source) or sniff_rows(source),
+    )
+
+    name, parser = open_export(str(sample), {"BIC": "TESTHUHB"})
+
+    assert (name, type(parser)) == (plugin, parser_type)
+    assert parser.statement.bank_id == "TESTHUHB"
+    assert len(sniffed) == 1
+
+
+def test_open_export_rejects_other_files(tmp_path):
+    path = tmp_path / "other.xlsx"
+    path.write_bytes(b"not a workbook")
+    with pytest.raises(ValueError, match="not a recognised OTP export"):
+        open_export(str(path), {})
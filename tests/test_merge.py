@@ -0,0 +1,87 @@
+"""Tests for the de-duplicating merge index."""
+
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+from ofxstatement.statement import StatementLine
+
+from ofxstatement_otp import merge
+from ofxstatement_otp.merge import MergeIndex
+from samples import REPO_ROOT
+
+
+def _line(txn_id, day, amount="-100"):
+    line = StatementLine(txn_id, datetime(2024, 1, day), "memo", Decimal(amount))
+    line.payee = "payee %s" % txn_id
+    return line
+
+
+def test_duplicates_are_dropped_per_account(tmp_path):
+    with MergeIndex(str(tmp_path / "index.sqlite")) as index:
+        first = [("A", "HUF", _line("1", 3)), ("A", "HUF", _line("2", 1))]
+        assert index.add(first) == 2
+        # "1" again for A is a duplicate; for B it is not.
+        again = [("A", "HUF", _line("1", 3)), ("B", "EUR", _line("1", 2))]
+        assert index.add(again) == 1
+        assert index.accounts() == [("A", "HUF", 2), ("B", "EUR", 1)]
+
+
+def test_lines_come_back_in_date_order(tmp_path):
+    with MergeIndex(str(tmp_path / "index.sqlite")) as index:
+        index.add(
+            ("A", "HUF", _line(txn_id, day))
+            for txn_id, day in [("c", 5), ("a", 9), ("b", 5), ("d", 1)]
+        )
+        lines = list(index.lines("A"))
+    assert [line.id for line in lines] == ["d", "b", "c", "a"]
+    assert lines[0].payee == "payee d"
+    assert lines[0].amount == Decimal("-100")
+
+
+def test_index_persists_between_runs(tmp_path, monkeypatch):
+    monkeypatch.setattr(merge, "BATCH_SIZE", 2)  # exercise batching too
+    path = str(tmp_path / "index.sqlite")
+    with MergeIndex(path) as index:
+        index.add(("A", "HUF", _line(str(i), 1 + i)) for i in range(5))
+    with MergeIndex(path) as index:
+        assert index.add(("A", "HUF", _line(str(i), 1 + i)) for i in range(7)) == 2
+        assert index.accounts() == [("A", "HUF", 7)]
+
+
+def test_identical_lines_of_one_export_are_all_kept(tmp_path):
+    with MergeIndex(str(tmp_path / "index.sqlite")) as index:
+        export = [("A", "HUF", _line("same", 3)), ("A", "HUF", _line("same", 3))]
+        assert index.add(export) == 2
+        # a later export with the same two lines, and a third one
+        assert index.add(export + [("A", "HUF", _line("same", 3))]) == 1
+        assert [line.id for line in index.lines("A")] == ["same"] * 3
+
+
+def test_legacy_twins_survive_the_merge(tmp_path):
+    from openpyxl import load_workbook
+
+    from ofxstatement_otp import cli
+
+    sample = REPO_ROOT / "manual_test" / "sample-old-format-pre-2026-06.xlsx"
+    twins = tmp_path / "twins.xlsx"
+    wb = load_workbook(sample)
+    ws = wb.active
+    # the second data row repeats the first: two identical card payments
+    for column in range(1, ws.max_column + 1):
+        ws.cell(row=3, column=column).value = ws.cell(row=2, column=column).value
+    wb.save(twins)
+    out = tmp_path / "out"
+
+    assert cli.run(["merge", "-o", str(out), str(twins), str(twins)]) == 0
+
+    (merged,) = out.iterdir()
+    text = merged.read_text(encoding="utf-8")
+    assert text.count("<NAME>SPAR") == 2
+    assert text.count("<STMTTRN>") == 8
+
+
+def test_lines_without_an_id_are_rejected(tmp_path):
+    with MergeIndex(str(tmp_path / "index.sqlite")) as index:
+        with pytest.raises(ValueError, match="statement of A"):
+            index.add([("A", "HUF", _line(None, 3))])
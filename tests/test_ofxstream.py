@@ -0,0 +1,84 @@
+"""Tests for the streaming OFX writer."""
+
+import io
+from decimal import Decimal
+
+import pytest
+from ofxstatement import exceptions, ofx
+from ofxstatement.statement import Statement
+from ofxstatement.ui import UI
+
+from ofxstatement_otp.ofxstream import StreamingOfxWriter, write_streaming
+from ofxstatement_otp.otp import OtpPlugin
+from ofxstatement_otp.otp_legacy import OtpLegacyPlugin
+from samples import NEW_SAMPLE, OLD_SAMPLE
+
+
+def _streamed(statement, pretty=False, encoding="utf-8"):
+    """``statement`` written by OfxWriter and by the streaming writer."""
+    writer = ofx.OfxWriter(statement)
+    expected = writer.toxml(pretty=pretty, encoding=encoding)
+
+    lines, statement.lines = statement.lines, []
+    out = io.StringIO()
+    streaming = StreamingOfxWriter(statement, out, pretty=pretty, encoding=encoding)
+    streaming.genTime = writer.genTime
+    assert streaming.write_lines(lines) == len(lines)
+    streaming.close()
+    return expected, out.getvalue()
+
+
+@pytest.mark.parametrize("pretty", [False, True])
+@pytest.mark.parametrize(
+    "plugin, sample", [(OtpPlugin, NEW_SAMPLE), (OtpLegacyPlugin, OLD_SAMPLE)]
+)
+def test_output_matches_ofxwriter(plugin, sample, pretty):
+    statement = plugin(UI(), {}).get_parser(str(sample)).parse()
+
+    expected, streamed = _streamed(statement, pretty=pretty)
+    assert streamed == expected
+
+
+def test_output_matches_ofxwriter_with_balances_and_encoding():
+    statement = OtpPlugin(UI(), {}).get_parser(str(NEW_SAMPLE)).parse()
+    statement.start_balance = Decimal("1000")
+    statement.end_balance = Decimal("1000") + sum(
+        line.amount for line in statement.lines
+    )
+
+    expected, streamed = _streamed(statement, pretty=True, encoding="cp1250")
+    assert streamed == expected
+    assert "<BALAMT>" in streamed
+
+
+def test_empty_statement_has_no_transaction_list():
+    statement = Statement(bank_id="OTPVHUHB", account_id="1", currency="HUF")
+
+    expected, streamed = _streamed(statement)
+    assert streamed == expected
+    assert "BANKTRANLIST" not in streamed
+
+
+def test_lines_are_written_as_they_come():
+    statement = OtpPlugin(UI(), {}).get_parser(str(NEW_SAMPLE)).parse()
+    lines, statement.lines = statement.lines, []
+    out = io.StringIO()
+    writer = StreamingOfxWriter(statement, out)
+
+    writer.write_line(lines[0])
+    assert out.getvalue().count("<STMTTRN>") == 1
+    writer.write_line(lines[1])
+    assert out.getvalue().count("<STMTTRN>") == 2
+    assert "</OFX>" not in out.getvalue()
+    writer.close()
+    assert out.getvalue().endswith("</OFX>")
+
+
+def test_balances_are_checked_against_the_lines():
+    statement = OtpPlugin(UI(), {}).get_parser(str(NEW_SAMPLE)).parse()
+    lines, statement.lines = statement.lines, []
+    statement.start_balance = Decimal("0")
+    statement.end_balance = Decimal("1")
+
+    with pytest.raises(exceptions.ValidationError, match="end balance"):
+        write_streaming(statement, lines, io.StringIO())
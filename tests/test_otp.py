@@ -5,32 +5,21 @@ The fixture is the synthetic export produced by
 post-2021 OTP netbank export.
 """
 
-import importlib.util
+import io
+import mmap
 import re
-import sys
 import warnings
 import zipfile
 from datetime import datetime
 from decimal import Decimal
 from pathlib import Path
 
+import generate_sample
 import pytest
 
+from ofxstatement_otp import xlsx
 from ofxstatement_otp.otp import OtpXlsxParser
-
-REPO_ROOT = Path(__file__).resolve().parent.parent
-
-# Load manual_test/generate_sample.py (not a package) to reuse build_workbook.
-_spec = importlib.util.spec_from_file_location(
-    "generate_sample", REPO_ROOT / "manual_test" / "generate_sample.py"
-)
-assert _spec is not None and _spec.loader is not None
-generate_sample = importlib.util.module_from_spec(_spec)
-sys.modules["generate_sample"] = generate_sample
-_spec.loader.exec_module(generate_sample)
-
-CHECKING = generate_sample.ACCOUNT_CHECKING
-CREDIT = generate_sample.ACCOUNT_CREDIT
+from samples import CHECKING, CREDIT, quarter_export
 
 
 @pytest.fixture
@@ -185,3 +174,248 @@ def test_native_datetime_cell_is_parsed(sample_xlsx):
     mol = next(line for line in result.lines if line.payee == "MOL TOLTOALLOMAS")
     assert mol.date_user == datetime(2024, 1, 7, 18, 45, 0)
     assert mol.date == datetime(2024, 1, 7)
+
+
+def test_stale_sheet_dimension_does_not_truncate(sample_xlsx):
+    # The streaming reader must not trust the stored <dimension>; a stale one
+    # (here claiming a single cell) would otherwise hide every data row.
+    with zipfile.ZipFile(sample_xlsx) as zin:
+        items = {name: zin.read(name) for name in zin.namelist()}
+    items["xl/worksheets/sheet1.xml"] = re.sub(
+        rb'<dimension ref="[^"]*"',
+        b'<dimension ref="A1"',
+        items["xl/worksheets/sheet1.xml"],
+    )
+    with zipfile.ZipFile(sample_xlsx, "w") as zout:
+        for name, data in items.items():
+            zout.writestr(name, data)
+
+    _, result = parse(sample_xlsx)
+    assert len(result.lines) == 8
+
+
+def test_sheet_is_traversed_once(sample_xlsx, monkeypatch):
+    # Statement metadata and the transactions are served from one scan.
+    calls = []
+    original = OtpXlsxParser._iter_rows
+
+    def counting_iter_rows(self, *args, **kwargs):
+        calls.append(args)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(OtpXlsxParser, "_iter_rows", counting_iter_rows)
+    parser = OtpXlsxParser(sample_xlsx, {"account": CREDIT})
+    result = parser.parse()
+    assert len(calls) == 1
+    assert parser.statement.account_id == CREDIT
+    assert len(result.lines) == 2
+
+
+def test_scan_records_preamble_and_data_span(sample_xlsx):
+    parser = OtpXlsxParser(sample_xlsx)
+    parser.parse()
+    scan = parser.scan
+    assert scan.header_row == 9
+    assert scan.preamble["Lekérdezés kezdete"] == "2024-01-01"
+    # 8 rows, plus the hidden and the no-booking-date rows.
+    assert (scan.first_data_row, scan.last_data_row) == (10, 19)
+
+
+def test_parse_accounts_fans_out_per_account(sample_xlsx):
+    statements = OtpXlsxParser(sample_xlsx).parse_accounts()
+    assert sorted(statements) == [CHECKING, CREDIT]
+    checking, credit = statements[CHECKING], statements[CREDIT]
+    assert checking.account_id == CHECKING
+    assert len(checking.lines) == 6
+    assert credit.account_id == CREDIT
+    assert [line.payee for line in credit.lines] == ["MEDIA MARKT", "OTP Bank"]
+    assert credit.currency == "HUF"
+    # The query window from the preamble applies to every account.
+    assert credit.start_date == datetime(2024, 1, 1)
+    assert credit.end_date == datetime(2024, 1, 31)
+
+
+def test_parse_accounts_falls_back_to_booking_dates(tmp_path):
+    wb = generate_sample.build_workbook()
+    ws = wb[generate_sample.TRANSACTIONS_SHEET_NAME]
+    ws.delete_rows(5, 2)  # drop the query start/end labels
+    path = tmp_path / "no-window.xlsx"
+    wb.save(path)
+
+    credit = OtpXlsxParser(str(path)).parse_accounts()[CREDIT]
+    assert credit.start_date == datetime(2024, 1, 12)
+    assert credit.end_date == datetime(2024, 1, 18)
+
+
+def test_plugin_parse_accounts_sets_bank_id(sample_xlsx):
+    from ofxstatement_otp.otp import OtpPlugin
+
+    statements = OtpPlugin(None, {"BIC": "MYBANKXX"}).parse_accounts(sample_xlsx)
+    assert {s.bank_id for s in statements.values()} == {"MYBANKXX"}
+
+
+def _line_fields(statement):
+    return [vars(line) for line in statement.lines]
+
+
+@pytest.mark.parametrize(
+    "settings", [{}, {"account": CREDIT}, {"accounts": CHECKING, "end": "2024-01-10"}]
+)
+def test_xml_reader_matches_openpyxl(sample_xlsx, settings, monkeypatch):
+    # small chunks, so that rows come after the header is known: the rows of
+    # filtered-out accounts are then left unconverted by the XML reader
+    monkeypatch.setattr(xlsx, "CHUNK_SIZE", 256)
+    # The MOL row's native datetime cell, the hidden row, the row without a
+    # booking date and the blank rows of the preamble are read the same way.
+    default_statement, default_result = parse(sample_xlsx, settings)
+    xml_statement, xml_result = parse(sample_xlsx, dict(settings, reader="xml"))
+    assert _line_fields(xml_result) == _line_fields(default_result)
+    for name in ("account_id", "currency", "start_date", "end_date"):
+        assert getattr(xml_statement, name) == getattr(default_statement, name)
+
+
+def test_xml_reader_scan_span(sample_xlsx):
+    parser = OtpXlsxParser(sample_xlsx, {"reader": "xml"})
+    parser.parse()
+    assert parser.scan.header_row == 9
+    assert (parser.scan.first_data_row, parser.scan.last_data_row) == (10, 19)
+    assert parser.hidden == {18}
+
+
+@pytest.mark.parametrize("reader", ["openpyxl", "xml"])
+def test_hidden_blank_row_does_not_end_the_table(tmp_path, reader):
+    wb = generate_sample.build_workbook()
+    ws = wb[generate_sample.TRANSACTIONS_SHEET_NAME]
+    # an empty hidden row after the first two transactions (rows 10, 11)
+    ws.move_range("A12:K19", rows=1)
+    ws.row_dimensions[18].hidden = False
+    ws.row_dimensions[19].hidden = True
+    ws.row_dimensions[12].hidden = True
+    path = tmp_path / "hidden-blank.xlsx"
+    wb.save(path)
+
+    parser = OtpXlsxParser(str(path), {"reader": reader})
+    assert len(parser.parse().lines) == 8
+    assert parser.scan.last_data_row == 20
+
+
+def test_unknown_reader_is_rejected(sample_xlsx):
+    with pytest.raises(ValueError, match="reader"):
+        OtpXlsxParser(sample_xlsx, {"reader": "pandas"})
+
+
+def test_records_are_slotted_with_decimal_amounts(sample_xlsx):
+    records = list(OtpXlsxParser(sample_xlsx, {"account": CREDIT}).split_records())
+    assert [record.amount for record in records] == [
+        Decimal("-89990"),
+        Decimal("12.5"),
+    ]
+    assert not hasattr(records[0], "__dict__")
+
+
+def _dates(result):
+    return [line.date.strftime("%m-%d") for line in result.lines]
+
+
+def test_accounts_filter_is_exact(sample_xlsx):
+    statement, result = parse(sample_xlsx, {"accounts": f"{CHECKING}, {CREDIT}"})
+    assert len(result.lines) == 8
+    _, result = parse(sample_xlsx, {"accounts": CREDIT})
+    assert len(result.lines) == 2
+    # no substring matches
+    _, result = parse(sample_xlsx, {"accounts": "33333333"})
+    assert result.lines == []
+    # both filters apply
+    _, result = parse(sample_xlsx, {"accounts": CREDIT, "account": "1111"})
+    assert result.lines == []
+
+
+def test_date_range_filter(sample_xlsx):
+    settings = {"start": "2024-01-05", "end": "2024-01-12"}
+    statement, result = parse(sample_xlsx, settings)
+    assert _dates(result) == ["01-05", "01-07", "01-10", "01-12"]
+    # the statement covers the range, within the query window
+    assert statement.start_date == datetime(2024, 1, 5)
+    assert statement.end_date == datetime(2024, 1, 12)
+
+    statement, _ = parse(sample_xlsx, {"start": "2023-06-01"})
+    assert statement.start_date == datetime(2024, 1, 1)
+
+
+def test_sorted_export_stops_past_the_date_range(sample_xlsx):
+    # the checking account's rows come first, in booking date order
+    settings = {
+        "accounts": CHECKING,
+        "end": "2024-01-05",
+        "date_order": "ascending",
+        "profile": "yes",
+    }
+    parser = OtpXlsxParser(sample_xlsx, settings)
+    assert _dates(parser.parse()) == ["01-02", "01-03", "01-05"]
+    # stopped at the 01-07 row
+    assert parser.scan.last_data_row == 13
+    assert parser.profiler is not None
+    assert parser.profiler.rows["scanned"] == 4
+
+
+def test_unsorted_export_reads_past_the_date_range(sample_xlsx):
+    parser = OtpXlsxParser(sample_xlsx, {"end": "2024-01-05", "profile": "yes"})
+    assert _dates(parser.parse()) == ["01-02", "01-03", "01-05"]
+    assert parser.scan.last_data_row == 19
+    assert parser.profiler is not None
+    assert parser.profiler.rows["outside_dates"] == 5
+
+
+@pytest.mark.parametrize(
+    "order, dates",
+    [
+        ("ascending", ["2024-01-15", "2024-01-10", "2024-01-20"]),
+        ("descending", ["2024-01-15", "2024-01-20", "2024-01-10"]),
+    ],
+)
+def test_unsorted_rows_in_sorted_mode_are_an_error(tmp_path, order, dates):
+    export = quarter_export(tmp_path / "export.xlsx", dates)
+    parser = OtpXlsxParser(export, {"end": "2024-01-31", "date_order": order})
+    with pytest.raises(ValueError, match=f"not in {order} order"):
+        parser.parse()
+
+
+@pytest.mark.parametrize(
+    "settings, message",
+    [
+        ({"start": "01/05/2024"}, "start"),
+        ({"end": "2024-13-01"}, "end"),
+        ({"date_order": "newest"}, "date_order"),
+    ],
+)
+def test_invalid_filter_settings(sample_xlsx, settings, message):
+    with pytest.raises(ValueError, match=message):
+        OtpXlsxParser(sample_xlsx, settings)
+
+
+def test_export_is_read_from_memory(sample_xlsx):
+    _, expected = parse(sample_xlsx)
+    data = Path(sample_xlsx).read_bytes()
+
+    with open(sample_xlsx, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mapped:
+        for source in (data, io.BytesIO(data), mapped):
+            _, statement = parse(source, {"reader": "xml"})
+            assert [line.id for line in statement.lines] == [
+                line.id for line in expected.lines
+            ]
+        _, statement = parse(io.BytesIO(data))
+        assert len(statement.lines) == len(expected.lines)
+
+
+def test_plugin_reads_uploads_in_memory(sample_xlsx):
+    from ofxstatement.ui import UI
+
+    from ofxstatement_otp.otp import OtpPlugin
+
+    data = Path(sample_xlsx).read_bytes()
+    parser = OtpPlugin(UI(), {"account": CREDIT}).get_parser(data)
+
+    assert parser.filename == "<bytes>"
+    assert parser.parse().account_id == CREDIT
@@ -7,14 +7,12 @@ fixture is the committed, anonymized ``sample-old-format-pre-2026-06.xlsx``.
 
 from datetime import datetime
 from decimal import Decimal
-from pathlib import Path
 
 import pytest
+from ofxstatement.statement import StatementLine, generate_transaction_id
 
 from ofxstatement_otp.otp_legacy import OtpLegacyXlsxParser
-
-REPO_ROOT = Path(__file__).resolve().parent.parent
-OLD_SAMPLE = REPO_ROOT / "manual_test" / "sample-old-format-pre-2026-06.xlsx"
+from samples import OLD_SAMPLE
 
 
 @pytest.fixture
@@ -63,3 +61,56 @@ def test_default_bank_id_is_otp_bic():
 
     parser = OtpLegacyPlugin(None, {}).get_parser(str(OLD_SAMPLE))
     assert parser.statement.bank_id == "OTPVHUHB"
+
+
+def test_workbook_is_loaded_and_streamed_once(monkeypatch):
+    from ofxstatement_otp import otp_legacy
+
+    loads = []
+    streams = []
+    original_load = otp_legacy.load_workbook
+    original_iter_rows = OtpLegacyXlsxParser._iter_rows
+
+    def counting_load(filename):
+        loads.append(filename)
+        return original_load(filename)
+
+    def counting_iter_rows(self):
+        streams.append(self)
+        return original_iter_rows(self)
+
+    monkeypatch.setattr(otp_legacy, "load_workbook", counting_load)
+    monkeypatch.setattr(OtpLegacyXlsxParser, "_iter_rows", counting_iter_rows)
+    result = OtpLegacyXlsxParser(str(OLD_SAMPLE)).parse()
+    assert len(result.lines) == 8
+    assert len(loads) == 1
+    assert len(streams) == 1
+
+
+def test_records_are_slotted_with_decimal_amounts():
+    records = list(OtpLegacyXlsxParser(str(OLD_SAMPLE)).split_records())
+    assert records[3].amount == Decimal("-15500.5")
+    assert not hasattr(records[0], "__dict__")
+
+
+def test_export_is_read_from_memory(statement):
+    from_memory = OtpLegacyXlsxParser(OLD_SAMPLE.read_bytes()).parse()
+
+    assert [line.id for line in from_memory.lines] == [
+        line.id for line in statement.lines
+    ]
+
+
+def test_inexact_amounts_keep_their_ids(tmp_path):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(OLD_SAMPLE)
+    wb.active["K2"] = 22560.98
+    wb.save(tmp_path / "legacy.xlsx")
+
+    line = OtpLegacyXlsxParser(str(tmp_path / "legacy.xlsx")).parse().lines[0]
+
+    assert line.amount == Decimal("22560.98")
+    # hashed as earlier versions read the amount: the float's expansion
+    expected = StatementLine(None, line.date, line.memo, Decimal(22560.98))
+    assert line.id == generate_transaction_id(expected)
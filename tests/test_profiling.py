@@ -0,0 +1,129 @@
+"""Tests for the per-phase profiling of conversions."""
+
+import json
+import pstats
+
+import pytest
+
+from ofxstatement_otp import profiling
+from ofxstatement_otp.cache import ParseCache
+from ofxstatement_otp.otp import OtpXlsxParser
+from ofxstatement_otp.otp_legacy import OtpLegacyXlsxParser
+from ofxstatement_otp.profiling import Profiler
+from samples import NEW_SAMPLE, OLD_SAMPLE
+
+
+def _reports(path):
+    return [json.loads(line) for line in path.read_text("utf-8").splitlines()]
+
+
+def test_off_by_default(monkeypatch):
+    monkeypatch.delenv(profiling.PROFILE_ENV, raising=False)
+    monkeypatch.delenv(profiling.CPROFILE_ENV, raising=False)
+    assert Profiler.from_settings({}, "x.xlsx", "P") is None
+    assert Profiler.from_settings({"profile": "no"}, "x.xlsx", "P") is None
+    assert OtpXlsxParser(str(NEW_SAMPLE)).profiler is None
+
+
+def test_enabled_by_environment(monkeypatch, tmp_path):
+    monkeypatch.setenv(profiling.PROFILE_ENV, str(tmp_path / "p.jsonl"))
+    profiler = Profiler.from_settings({}, "x.xlsx", "P")
+    assert profiler is not None and profiler.output == str(tmp_path / "p.jsonl")
+    # the setting wins
+    assert Profiler.from_settings({"profile": "yes"}, "x.xlsx", "P").output is None
+
+
+@pytest.mark.parametrize(
+    "parser_class, sample, settings, phases",
+    [
+        (
+            OtpXlsxParser,
+            NEW_SAMPLE,
+            {},
+            ["load", "header", "metadata", "records", "lines"],
+        ),
+        (
+            OtpXlsxParser,
+            NEW_SAMPLE,
+            {"reader": "xml", "profile_memory": "yes"},
+            ["header", "metadata", "records", "lines"],
+        ),
+        (
+            OtpLegacyXlsxParser,
+            OLD_SAMPLE,
+            {},
+            ["load", "header", "metadata", "records", "lines"],
+        ),
+    ],
+)
+def test_parse_reports_phases_and_rows(
+    tmp_path, parser_class, sample, settings, phases
+):
+    output = tmp_path / "profile.jsonl"
+    settings = dict(settings, profile=str(output))
+    parser_class(str(sample), settings).parse()
+
+    [report] = _reports(output)
+    assert report["parser"] == parser_class.__name__
+    assert list(report["phases"]) == phases
+    for phase in report["phases"].values():
+        assert phase["seconds"] >= 0
+        assert ("peak_traced_mb" in phase) == ("profile_memory" in settings)
+    # 10 table rows: one hidden, one pending, 8 transactions
+    assert report["rows"]["scanned"] == 10
+    assert report["rows"]["hidden"] == 1
+    assert report["rows"]["incomplete"] == 1
+    assert report["rows"]["emitted"] == 8
+
+
+def test_filtered_rows_are_counted(tmp_path):
+    output = tmp_path / "profile.jsonl"
+    OtpXlsxParser(str(NEW_SAMPLE), {"profile": str(output), "account": "3333"}).parse()
+    [report] = _reports(output)
+    assert report["rows"]["emitted"] == 2
+    # the pending row of the other account included: accounts come first
+    assert report["rows"]["filtered"] == 7
+
+
+def test_report_is_logged(caplog):
+    caplog.set_level("INFO", logger="OTP")
+    OtpXlsxParser(str(NEW_SAMPLE), {"profile": "yes"}).parse()
+    [message] = [r.message for r in caplog.records if r.message.startswith("profile")]
+    assert json.loads(message.split(": ", 1)[1])["rows"]["emitted"] == 8
+
+
+def test_cprofile_dump(tmp_path):
+    OtpLegacyXlsxParser(str(OLD_SAMPLE), {"profile_cprofile": str(tmp_path)}).parse()
+    stats = pstats.Stats(str(tmp_path / "sample-old-format-pre-2026-06.prof"))
+    assert any(func[2] == "_get_transactions" for func in stats.stats)
+
+
+def test_phases_do_not_overlap(monkeypatch):
+    clock = iter(range(100))
+    monkeypatch.setattr(profiling.time, "perf_counter", lambda: next(clock))
+    profiler = Profiler("x.xlsx", "P")
+    with profiler.phase("lines"):  # 1
+        assert list(profiler.records([1, 2])) == [1, 2]  # 2..7
+    # lines: 1->2, 3->4, 5->6, 7->8; records: 2->3, 4->5, 6->7
+    assert profiler.phases["lines"]["seconds"] == 4
+    assert profiler.phases["records"]["seconds"] == 3
+    assert profiler.rows["emitted"] == 2
+
+
+def test_deferred_reports_once(tmp_path):
+    output = tmp_path / "profile.jsonl"
+    parser = OtpXlsxParser(str(NEW_SAMPLE), {"profile": str(output)})
+    with profiling.deferred(parser.profiler):
+        parser.parse()
+        assert not output.exists()
+        with profiling.profiled(parser.profiler, "ofx"):
+            pass
+    [report] = _reports(output)
+    assert list(report["phases"])[-1] == "ofx"
+
+
+def test_profile_settings_do_not_change_cache_keys(tmp_path):
+    cache = ParseCache(str(tmp_path))
+    key = cache.key(str(NEW_SAMPLE), "OtpXlsxParser", {"account": "1111"})
+    profiled = {"account": "1111", "profile": "yes", "profile_cprofile": "/tmp"}
+    assert cache.key(str(NEW_SAMPLE), "OtpXlsxParser", profiled) == key
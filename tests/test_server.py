@@ -0,0 +1,221 @@
+"""Tests for the ``ofxstatement-otp serve`` conversion server."""
+
+import http.client
+import json
+import threading
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import pytest
+
+from ofxstatement_otp.server import Busy, ConversionService, make_server
+from samples import NEW_SAMPLE, OLD_SAMPLE
+
+
+@pytest.fixture(scope="module")
+def service():
+    with ConversionService(jobs=1, queue_size=1, timeout=60) as service:
+        yield service
+
+
+def _serve(service, **kwargs):
+    server = make_server(service, port=0, **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+@pytest.fixture(scope="module")
+def server(service):
+    server = _serve(service)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _request(server, method, path, body=None, headers=None):
+    host, port = server.server_address[:2]
+    connection = http.client.HTTPConnection(host, port, timeout=60)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response, response.read()
+    finally:
+        connection.close()
+
+
+def test_upload_is_converted_to_ofx(server):
+    response, body = _request(server, "POST", "/convert", NEW_SAMPLE.read_bytes())
+
+    assert response.status == 200
+    assert response.getheader("Content-Type") == "application/x-ofx; charset=utf-8"
+    assert response.getheader("X-Plugin") == "otp"
+    assert response.getheader("X-Lines") == "8"
+    assert float(response.getheader("X-Convert-Seconds")) > 0
+    assert float(response.getheader("X-Queue-Seconds")) >= 0
+    assert body.decode("utf-8").count("<STMTTRN>") == 8
+
+
+def test_legacy_upload_is_detected(server):
+    response, _ = _request(server, "POST", "/convert", OLD_SAMPLE.read_bytes())
+
+    assert response.status == 200
+    assert response.getheader("X-Plugin") == "otp_legacy"
+
+
+def test_query_parameters_set_the_conversion_settings(server):
+    response, body = _request(
+        server, "POST", "/convert?account=3333&pretty=1", NEW_SAMPLE.read_bytes()
+    )
+
+    assert response.status == 200
+    text = body.decode("utf-8")
+    assert "<ACCTID>33333333-44444444</ACCTID>" in text
+    assert text.count("<STMTTRN>") == 2
+    assert "\n  " in text
+
+
+def test_other_settings_are_refused(server):
+    response, _ = _request(
+        server, "POST", "/convert?cache=/tmp/elsewhere", NEW_SAMPLE.read_bytes()
+    )
+
+    assert response.status == 400
+
+
+@pytest.mark.parametrize("length", ["many", "-5"])
+def test_invalid_content_length_is_refused(server, length):
+    response, body = _request(
+        server, "POST", "/convert", None, {"Content-Length": length}
+    )
+
+    assert response.status == 400
+    assert body == b"Invalid Content-Length\n"
+
+
+def test_unknown_encoding_is_refused(server):
+    response, body = _request(
+        server, "POST", "/convert?encoding=nope", NEW_SAMPLE.read_bytes()
+    )
+
+    assert response.status == 400
+    assert body == b"Unknown encoding 'nope'\n"
+
+
+def test_unencodable_ofx_is_refused(server):
+    # the payees and memos have accented letters
+    response, body = _request(
+        server, "POST", "/convert?encoding=ascii", NEW_SAMPLE.read_bytes()
+    )
+
+    assert response.status == 400
+    assert body.startswith(b"Cannot encode the OFX in ascii")
+
+
+def test_bad_export_is_unprocessable(server):
+    response, body = _request(server, "POST", "/convert", b"not a workbook")
+
+    assert response.status == 422
+    assert body
+
+
+def test_paths_are_refused_unless_allowed(service, server):
+    path = "/convert?path=%s" % NEW_SAMPLE
+    response, _ = _request(server, "POST", path)
+    assert response.status == 403
+
+    allowing = _serve(service, allow_paths=True)
+    try:
+        response, body = _request(allowing, "POST", path)
+    finally:
+        allowing.shutdown()
+        allowing.server_close()
+    assert response.status == 200
+    assert body.decode("utf-8").count("<STMTTRN>") == 8
+
+
+def test_full_queue_is_turned_away(service, server):
+    # occupy the worker and the queue slot
+    for _ in range(service.jobs + service.queue_size):
+        assert service._slots.acquire(blocking=False)
+    try:
+        response, _ = _request(server, "POST", "/convert", NEW_SAMPLE.read_bytes())
+    finally:
+        for _ in range(service.jobs + service.queue_size):
+            service._slots.release()
+
+    assert response.status == 503
+    assert response.getheader("Retry-After") == "5"
+
+
+def test_timed_out_conversion_keeps_its_slot():
+    with ConversionService(jobs=1, queue_size=0, timeout=0.2) as service:
+        # occupy the worker, so that the conversion waits past its timeout
+        service.pool.submit(time.sleep, 2)
+        with pytest.raises(FutureTimeoutError):
+            service.convert(NEW_SAMPLE.read_bytes(), {})
+
+        # still queued for the worker: no room for another one
+        assert service.status()["pending"] == 1
+        with pytest.raises(Busy):
+            service.convert(NEW_SAMPLE.read_bytes(), {})
+
+        deadline = time.monotonic() + 30
+        while service.status()["pending"] and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert service.status()["pending"] == 0
+        service.timeout = 60
+        assert service.convert(NEW_SAMPLE.read_bytes(), {})[0].lines == 8
+
+
+def test_status_reports_the_pool(server):
+    _request(server, "POST", "/convert", NEW_SAMPLE.read_bytes())
+    response, body = _request(server, "GET", "/status")
+
+    assert response.status == 200
+    status = json.loads(body)
+    assert status["jobs"] == 1
+    assert status["queue_size"] == 1
+    assert status["pending"] == 0
+    assert status["served"] >= 1
+    assert status["mean_convert_seconds"] > 0
+
+
+def test_unix_socket(service, tmp_path):
+    socket_path = str(tmp_path / "otp.sock")
+    server = _serve(service, socket_path=socket_path)
+    try:
+        import socket
+
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(socket_path)
+        client.sendall(b"GET /status HTTP/1.0\r\n\r\n")
+        reply = b""
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            reply += chunk
+        client.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert reply.startswith(b"HTTP/1.0 200")
+    assert b'"jobs": 1' in reply
+
+
+def test_unix_socket_is_removed_on_close(service, tmp_path):
+    socket_path = tmp_path / "otp.sock"
+    server = make_server(service, socket_path=str(socket_path))
+    assert socket_path.exists()
+    server.server_close()
+    assert not socket_path.exists()
+
+
+def test_unix_socket_path_must_not_be_a_file(service, tmp_path):
+    path = tmp_path / "precious.txt"
+    path.write_text("keep me")
+    with pytest.raises(ValueError, match="not a socket"):
+        make_server(service, socket_path=str(path))
+    assert path.read_text() == "keep me"
@@ -0,0 +1,158 @@
+"""Tests for splitting exports into per-account, per-period OFX shards."""
+
+import os
+from datetime import datetime
+
+import pytest
+
+from ofxstatement_otp.otp import OtpXlsxParser
+from ofxstatement_otp.shards import period_of, shard_filename, write_shards
+from samples import CHECKING, CREDIT, quarter_export
+
+DATES = [
+    "2024-01-15",
+    "2024-01-20",
+    "2024-01-25",
+    "2024-02-10",
+    "2024-02-11",
+    "2024-03-05",
+    "2024-03-18",
+]
+
+
+@pytest.mark.parametrize(
+    "date, period, expected",
+    [
+        ("2024-02-29", "month", ("2024-02", "2024-02-01", "2024-02-29")),
+        ("2024-12-31", "month", ("2024-12", "2024-12-01", "2024-12-31")),
+        ("2024-05-15", "quarter", ("2024-Q2", "2024-04-01", "2024-06-30")),
+        ("2024-11-01", "quarter", ("2024-Q4", "2024-10-01", "2024-12-31")),
+    ],
+)
+def test_period_of(date, period, expected):
+    label, first, last = period_of(datetime.fromisoformat(date), period)
+    assert (label, first, last) == (
+        expected[0],
+        datetime.fromisoformat(expected[1]),
+        datetime.fromisoformat(expected[2]),
+    )
+
+
+def test_unknown_period_is_rejected():
+    with pytest.raises(ValueError, match="Unknown period 'week'"):
+        period_of(datetime(2024, 1, 1), "week")
+
+
+def test_monthly_shards_per_account(tmp_path):
+    export = quarter_export(tmp_path / "export.xlsx", DATES)
+    out = tmp_path / "out"
+    out.mkdir()
+
+    shards = write_shards(OtpXlsxParser(export), str(out), export, "month")
+
+    summary = {
+        (s.account_id, s.period): (s.lines, s.start_date, s.end_date) for s in shards
+    }
+    assert summary == {
+        (CHECKING, "2024-01"): (2, datetime(2024, 1, 10), datetime(2024, 1, 31)),
+        (CREDIT, "2024-01"): (1, datetime(2024, 1, 10), datetime(2024, 1, 31)),
+        (CREDIT, "2024-02"): (1, datetime(2024, 2, 1), datetime(2024, 2, 29)),
+        (CHECKING, "2024-02"): (1, datetime(2024, 2, 1), datetime(2024, 2, 29)),
+        (CREDIT, "2024-03"): (1, datetime(2024, 3, 1), datetime(2024, 3, 20)),
+        (CHECKING, "2024-03"): (1, datetime(2024, 3, 1), datetime(2024, 3, 20)),
+    }
+    assert sorted(p.name for p in out.iterdir()) == sorted(
+        f"export-{account}-{period}.ofx" for account, period in summary
+    )
+    text = (out / f"export-{CHECKING}-2024-01.ofx").read_text(encoding="utf-8")
+    assert text.count("<STMTTRN>") == 2
+    assert f"<ACCTID>{CHECKING}</ACCTID>" in text
+    assert "<DTSTART>20240110</DTSTART><DTEND>20240131</DTEND>" in text
+
+
+def test_quarterly_shards(tmp_path):
+    export = quarter_export(tmp_path / "export.xlsx", DATES)
+
+    shards = write_shards(OtpXlsxParser(export), str(tmp_path), export, "quarter")
+
+    assert sorted((s.account_id, s.period, s.lines) for s in shards) == [
+        (CHECKING, "2024-Q1", 4),
+        (CREDIT, "2024-Q1", 3),
+    ]
+    assert {(s.start_date, s.end_date) for s in shards} == {
+        (datetime(2024, 1, 10), datetime(2024, 3, 20))
+    }
+
+
+@pytest.mark.parametrize("date_order, most_open", [("ascending", 2), (None, 6)])
+def test_sorted_exports_finish_shards_early(
+    tmp_path, monkeypatch, date_order, most_open
+):
+    from ofxstatement_otp import shards as shards_module
+
+    export = quarter_export(tmp_path / "export.xlsx", DATES)
+    out = tmp_path / "out"
+    out.mkdir()
+    open_files = []
+    finish = shards_module._OpenShard.finish
+
+    def counting_finish(self):
+        open_files.append(sum(p.name.endswith(".part") for p in out.iterdir()))
+        finish(self)
+
+    monkeypatch.setattr(shards_module._OpenShard, "finish", counting_finish)
+    settings = {"date_order": date_order} if date_order else {}
+    write_shards(OtpXlsxParser(export, settings), str(out), export, "month")
+
+    # sorted: only the accounts of one month are open at a time
+    assert max(open_files) == most_open
+
+
+def test_open_files_are_bounded(tmp_path, monkeypatch):
+    from ofxstatement_otp import shards as shards_module
+
+    export = quarter_export(tmp_path / "export.xlsx", DATES)
+    expected = tmp_path / "expected"
+    expected.mkdir()
+    write_shards(OtpXlsxParser(export), str(expected), export, "month")
+    out = tmp_path / "out"
+    out.mkdir()
+    started, open_files = [], []
+    init, resume = shards_module._OpenShard.__init__, shards_module._OpenShard.resume
+
+    def counting_init(self, *args):
+        init(self, *args)
+        started.append(self)
+
+    def counting_resume(self):
+        resume(self)
+        open_files.append(sum(s.file is not None for s in started))
+
+    monkeypatch.setattr(shards_module._OpenShard, "__init__", counting_init)
+    monkeypatch.setattr(shards_module._OpenShard, "resume", counting_resume)
+
+    shards = write_shards(OtpXlsxParser(export), str(out), export, "month", max_open=2)
+
+    assert len(shards) == 6
+    assert max(open_files) == 2
+    for shard in shards:
+        name = os.path.basename(shard.path)
+        assert (out / name).read_bytes() == (expected / name).read_bytes()
+
+
+def test_shard_filename_is_safe():
+    assert shard_filename("in/x.xlsx", "1111/../2222", "2024-Q1") == (
+        "x-1111_2222-2024-Q1.ofx"
+    )
+
+
+def test_unsorted_rows_in_sorted_mode_are_an_error(tmp_path):
+    dates = ["2024-01-15", "2024-02-10", "2024-01-20"]
+    export = quarter_export(tmp_path / "export.xlsx", dates)
+    out = tmp_path / "out"
+    out.mkdir()
+    parser = OtpXlsxParser(export, {"date_order": "ascending"})
+
+    with pytest.raises(ValueError, match="not in ascending order"):
+        write_shards(parser, str(out), export, "month")
+    assert not any(p.name.endswith(".part") for p in out.iterdir())
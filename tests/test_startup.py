@@ -0,0 +1,72 @@
+"""Import cost of the plugin modules.
+
+``ofxstatement`` imports every installed plugin on each run (``convert``,
+``list-plugins``), so the plugin modules must stay cheap to import: heavy
+dependencies are imported when a parser needs them. Measured with
+``python -X importtime`` in a fresh interpreter.
+"""
+
+import subprocess
+import sys
+from typing import Dict
+
+# Imported by ofxstatement itself on every run, before any plugin.
+FRAMEWORK = (
+    "ofxstatement.configuration",
+    "ofxstatement.parser",
+    "ofxstatement.plugin",
+    "ofxstatement.statement",
+    "dataclasses",
+)
+
+# Only imported when a conversion needs them.
+LAZY_MODULES = (
+    "openpyxl",
+    "sqlite3",
+    "pyarrow",
+    "cProfile",
+    "concurrent.futures.process",
+)
+
+# Both plugins import in about a third of the time ofxstatement's own modules
+# take, in the same interpreter; openpyxl alone takes longer than those.
+PLUGIN_IMPORT_RATIO = 1.0
+
+
+def import_times(statement: str) -> Dict[str, int]:
+    """Cumulative import time (us) of every module ``statement`` imports."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:") :].split("|")
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+def test_plugins_defer_heavy_imports():
+    times = import_times("import ofxstatement_otp.otp, ofxstatement_otp.otp_legacy")
+    assert "ofxstatement_otp.otp" in times
+    assert [module for module in LAZY_MODULES if module in times] == []
+
+
+def test_cli_defers_heavy_imports():
+    times = import_times("import ofxstatement_otp.cli")
+    assert [module for module in LAZY_MODULES if module in times] == []
+
+
+def test_plugin_import_time():
+    # relative to the framework's, so that a slow machine does not fail it
+    times = import_times(
+        "import %s; import ofxstatement_otp.otp, ofxstatement_otp.otp_legacy"
+        % ", ".join(FRAMEWORK)
+    )
+    framework = sum(times.get(module, 0) for module in FRAMEWORK)
+    spent = times["ofxstatement_otp.otp"] + times["ofxstatement_otp.otp_legacy"]
+    assert spent < framework * PLUGIN_IMPORT_RATIO
@@ -0,0 +1,199 @@
+"""Tests for incremental conversion (per-account watermark state)."""
+
+import json
+import logging
+import threading
+from datetime import date, datetime, timedelta
+from typing import List
+
+import pytest
+
+from ofxstatement_otp import cli, otp
+from ofxstatement_otp.otp import OtpXlsxParser
+from ofxstatement_otp.state import AccountState, IncrementalState, committing
+from samples import CHECKING, CREDIT, export, row
+
+
+def _payees(settings, path):
+    """Convert ``path``, committing the state once the lines are read."""
+    parser = OtpXlsxParser(path, settings)
+    with committing(parser.state):
+        return [line.payee for line in cli.read_statement(parser).lines]
+
+
+@pytest.fixture
+def settings(tmp_path):
+    return {"incremental": str(tmp_path / "state")}
+
+
+def test_second_run_emits_nothing_new(tmp_path, settings):
+    path = export(tmp_path / "day1.xlsx")
+    assert len(_payees(settings, path)) == 8
+    state = json.loads((tmp_path / "state" / f"{CREDIT}.json").read_text())
+    assert state["watermark"] == "2024-01-18"
+    assert sorted(state["ids"]) == ["2024011214200012001", "2024011811300012002"]
+
+    assert _payees(settings, path) == []
+
+
+def test_overlapping_export_emits_only_new_lines(tmp_path, settings):
+    _payees(settings, export(tmp_path / "day1.xlsx"))
+
+    day2 = export(
+        tmp_path / "day2.xlsx",
+        [
+            row("2024020100000011200", "2024-02-01", "NEW"),
+            # Booked late, inside the overlap window, with a new identifier.
+            row("2024011300000011201", "2024-01-13", "LATE"),
+            # Before the overlap window: treated as converted already.
+            row("2024010100000011202", "2024-01-01", "OLD"),
+        ],
+    )
+    assert _payees(settings, day2) == ["NEW", "LATE"]
+    assert _payees(settings, day2) == []
+
+
+def test_rows_behind_the_window_are_not_converted(tmp_path, settings, monkeypatch):
+    path = export(tmp_path / "day1.xlsx")
+    # Both accounts converted up to March: the whole export is behind.
+    store = IncrementalState(settings["incremental"])
+    store.accounts = {
+        account: AccountState(date(2024, 3, 1)) for account in (CHECKING, CREDIT)
+    }
+    for state in store.accounts.values():
+        state.changed = True
+    store.save()
+
+    parser = OtpXlsxParser(path, settings)
+    conversions = []
+    for name in ("parse_date", "parse_datetime"):
+        original = getattr(otp, name)
+
+        def counting(value, original=original):
+            conversions.append(value)
+            return original(value)
+
+        monkeypatch.setattr(otp, name, counting)
+    assert parser.parse().lines == []
+    assert conversions == []
+
+
+def test_unreadable_state_is_ignored(tmp_path, settings, caplog):
+    state_dir = tmp_path / "state"
+    state_dir.mkdir()
+    (state_dir / f"{CREDIT}.json").write_text("{not json")
+    with caplog.at_level(logging.WARNING, logger="OTP"):
+        payees = _payees(settings, export(tmp_path / "day1.xlsx"))
+    assert len(payees) == 8
+    assert "Ignoring unreadable state file" in caplog.text
+
+
+def test_cached_records_respect_the_watermark(tmp_path, settings):
+    settings = dict(settings, cache=str(tmp_path / "cache"))
+    path = export(tmp_path / "day1.xlsx")
+    assert len(_payees(settings, path)) == 8
+    assert _payees(settings, path) == []
+
+    # Forgetting the state converts everything again, cache or not.
+    for state_file in (tmp_path / "state").iterdir():
+        state_file.unlink()
+    assert len(_payees(settings, path)) == 8
+
+
+def test_account_state_skips_on_raw_cells():
+    state = AccountState(date(2024, 1, 18), overlap=timedelta(days=7))
+    assert state.is_behind("2024-01-10")
+    assert not state.is_behind("2024-01-11")
+    assert state.is_behind(datetime(2024, 1, 10, 23, 59))
+    assert not AccountState().is_behind("1900-01-01")
+
+
+def test_state_keeps_only_identifiers_inside_the_window():
+    state = AccountState(overlap=timedelta(days=2))
+    state.emitted(date(2024, 1, 1), "a")
+    state.emitted(date(2024, 1, 5), "b")
+    state.emitted(date(2024, 1, 4), None)
+    assert state.to_json(CHECKING) == {
+        "format": 1,
+        "account": CHECKING,
+        "watermark": "2024-01-05",
+        "ids": {"b": "2024-01-05"},
+    }
+
+
+def test_incremental_is_off_by_default():
+    assert IncrementalState.from_settings({}) is None
+    assert IncrementalState.from_settings({"incremental": "no"}) is None
+    assert IncrementalState.from_settings({"incremental": "yes"}) is not None
+
+
+def test_conversions_sharing_the_state_take_turns(tmp_path, settings):
+    path = export(tmp_path / "day1.xlsx")
+    parser = OtpXlsxParser(path, settings)
+    first = parser.split_records()
+    next(first)  # the state is read: the directory is locked
+    second_payees: List[str] = []
+    second = threading.Thread(
+        target=lambda: second_payees.extend(_payees(settings, path))
+    )
+    second.start()
+
+    second.join(0.3)
+    assert second.is_alive()
+    assert len(list(first)) == 7
+    # still locked: the output is not written yet
+    second.join(0.3)
+    assert second.is_alive()
+    parser.state.commit()
+    second.join(10)
+    # the second conversion saw the state saved by the first
+    assert second_payees == []
+
+
+def test_abandoned_conversion_releases_the_lock(tmp_path, settings):
+    path = export(tmp_path / "day1.xlsx")
+    records = OtpXlsxParser(path, settings).split_records()
+    next(records)
+    records.close()
+
+    # nothing was saved: everything is still new
+    assert len(_payees(settings, path)) == 8
+
+
+def test_state_is_only_saved_once_the_output_is_written(tmp_path, settings):
+    path = export(tmp_path / "day1.xlsx")
+    unwritable = str(tmp_path / "no-such-dir" / "day1.ofx")
+    result = cli.convert_export(path, unwritable, settings)
+    assert result.error is not None and "FileNotFoundError" in result.error
+    assert not (tmp_path / "state" / f"{CREDIT}.json").exists()
+
+    output = tmp_path / "day1.ofx"
+    assert cli.convert_export(path, str(output), settings).lines == 8
+    assert output.exists()
+    assert cli.convert_export(path, str(output), settings).lines == 0
+
+
+def test_parse_only_reads_the_state(tmp_path, settings, caplog):
+    # ofxstatement convert writes the OFX after parse() returns
+    path = export(tmp_path / "day1.xlsx")
+    with caplog.at_level(logging.WARNING, logger="OTP"):
+        assert len(OtpXlsxParser(path, settings).parse().lines) == 8
+    assert "Not saving the incremental state" in caplog.text
+    assert not (tmp_path / "state" / f"{CREDIT}.json").exists()
+    # and the directory is not left locked
+    assert len(_payees(settings, path)) == 8
+    assert OtpXlsxParser(path, settings).parse().lines == []
+
+
+def test_a_shared_state_keeps_the_exports_read_before_a_failed_one(tmp_path, settings):
+    day1 = export(tmp_path / "day1.xlsx")
+    day2 = export(tmp_path / "day2.xlsx", [row("2024020100000011200", "2024-02-01")])
+    state = IncrementalState(settings["incremental"])
+    assert len(list(OtpXlsxParser(day1, settings, state).split_records())) == 8
+    failing = OtpXlsxParser(day2, settings, state).split_records()
+    next(failing)
+    failing.close()
+    state.commit()
+
+    # day1 was recorded, the unfinished day2 was not
+    assert _payees(settings, day2) == ["SPAR MAGYARORSZAG KFT"]
@@ -5,7 +5,21 @@ for the current and legacy exports, so it lives in one module-level table rather
 than being rebuilt on every lookup inside each plugin.
 """
 
-from ofxstatement_otp.transaction_types import TRANS_MAP, transaction_type
+import os
+
+import pytest
+
+from ofxstatement_otp.transaction_types import (
+    DEFAULT_CLASSIFIER,
+    TRANS_MAP,
+    Classifier,
+    classifier_for,
+    load_classifier,
+    normalize,
+    read_rules,
+    transaction_type,
+)
+from samples import NEW_SAMPLE, OLD_SAMPLE
 
 
 def test_known_descriptions_map_to_their_codes():
@@ -26,6 +40,166 @@ def test_both_plugins_delegate_to_the_shared_helper():
     # Guard against re-introducing a per-plugin copy of the table.
     from ofxstatement_otp import otp, otp_legacy
 
-    assert otp.transaction_type is transaction_type
-    assert otp_legacy.transaction_type is transaction_type
+    assert otp.classifier_for is classifier_for
+    assert otp_legacy.classifier_for is classifier_for
+    assert classifier_for({}) is DEFAULT_CLASSIFIER
     assert isinstance(TRANS_MAP, dict)
+
+
+def test_normalize_folds_case_accents_and_whitespace():
+    assert normalize("  Vásárlás   KÁRTYÁVAL\t") == "vasarlas kartyaval"
+    assert normalize("Minimum fizetendő összeg") == "minimum fizetendo osszeg"
+
+
+@pytest.mark.parametrize(
+    "description, code",
+    [
+        ("vásárlás kártyával", "POS"),
+        ("VASARLAS  KARTYAVAL", "POS"),
+        # Suffixed and completed variants of table entries.
+        ("VÁSÁRLÁS KÁRTYÁVAL - ONLINE", "POS"),
+        ("ZÁRLATI DÍJ 2024", "SRVCHG"),
+        # The longest matching entry wins.
+        ("AZONNALI ÁTUTALÁS BANKON BELÜL 2", "XFER"),
+        ("HITELTÖRLESZTÉS BESZEDÉSE 03/2024", "SRVCHG"),
+        (None, "PAYMENT"),
+        ("", "PAYMENT"),
+    ],
+)
+def test_fuzzy_matches(description, code):
+    assert transaction_type(description) == code
+
+
+def test_longest_prefix_wins_over_shorter_entry():
+    classifier = Classifier({"ABC": "XFER", "ABC DEF": "POS"})
+    assert classifier.classify("abc def ghi") == "POS"
+    assert classifier.classify("abc xyz") == "XFER"
+    assert classifier.classify("ab") == "PAYMENT"
+
+
+def test_prefix_matches_whole_words_only():
+    classifier = Classifier({"ATM": "ATM", "ATM DIJ": "SRVCHG"})
+    assert classifier.classify("ATM 1234") == "ATM"
+    assert classifier.classify("ATMOSPHERE KFT") == "PAYMENT"
+    # the longest entry ending at a word boundary wins
+    assert classifier.classify("ATM DIJAK") == "ATM"
+    assert transaction_type("ZÁRLATI DÍJAK") == "PAYMENT"
+
+
+def test_patterns_apply_in_order_after_the_table():
+    classifier = Classifier(
+        {"DÍJ": "SRVCHG"},
+        [(r"kartya", "POS"), (r"^vasarlas", "DEBIT"), (r"\d{4}$", "ATM")],
+    )
+    assert classifier.classify("Díj vásárlás kártyával") == "SRVCHG"
+    # Both patterns match; the first rule wins even though the second one
+    # matches earlier in the text.
+    assert classifier.classify("Vásárlás kártyával") == "POS"
+    assert classifier.classify("Vásárlás bolt") == "DEBIT"
+    assert classifier.classify("KP felvétel 1234") == "ATM"
+    assert classifier.classify("Egyéb") == "PAYMENT"
+
+
+@pytest.mark.parametrize(
+    "rule, description",
+    [
+        # a global flag, no longer at the start once combined
+        (r"(?i)^kp", "KP befizetés"),
+        # a backreference, whose group number would shift once combined
+        (r"(\d)\1", "kód 1224"),
+    ],
+)
+def test_rules_that_cannot_be_combined_are_searched_one_by_one(rule, description):
+    classifier = Classifier({}, [(r"^zzz", "FEE"), (rule, "CASH"), (r"kod", "ATM")])
+    assert classifier.pattern is None
+    assert classifier.classify(description) == "CASH"
+    assert classifier.classify("kód 1234") == "ATM"
+    assert classifier.classify("zzz 11") == "FEE"
+    assert classifier.classify("egyéb") == "PAYMENT"
+
+
+def test_results_are_memoized_in_a_bounded_cache():
+    classifier = Classifier(TRANS_MAP, cache_size=2)
+    for _ in range(3):
+        classifier.classify("VÁSÁRLÁS KÁRTYÁVAL")
+    info = classifier.classify.cache_info()
+    assert (info.hits, info.misses) == (2, 1)
+    classifier.classify("A")
+    classifier.classify("B")
+    assert classifier.classify.cache_info().currsize == 2
+
+
+RULES = """\
+[descriptions]
+KÉSZPÉNZFELVÉTEL ATM-BŐL = atm
+zárlati díj = FEE
+
+[patterns]
+^kp\\b = CASH
+"""
+
+
+@pytest.fixture
+def rules_file(tmp_path):
+    path = tmp_path / "rules.ini"
+    path.write_text(RULES, encoding="utf-8")
+    return path
+
+
+def test_rule_file_is_merged_with_the_built_in_table(rules_file):
+    classifier = classifier_for({"trntype_rules": str(rules_file)})
+    assert classifier.classify("Készpénzfelvétel ATM-ből") == "ATM"
+    # User entries override built-in ones.
+    assert classifier.classify("ZÁRLATI DÍJ") == "FEE"
+    assert classifier.classify("KP befizetés") == "CASH"
+    # The rest of the built-in rules still apply.
+    assert classifier.classify("VÁSÁRLÁS KÁRTYÁVAL") == "POS"
+
+
+def test_rule_file_is_compiled_once_until_it_changes(rules_file):
+    first = load_classifier(str(rules_file))
+    assert load_classifier(str(rules_file)) is first
+
+    rules_file.write_text(RULES.replace("FEE", "SRVCHG"), encoding="utf-8")
+    stat = rules_file.stat()
+    os.utime(rules_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    second = load_classifier(str(rules_file))
+    assert second is not first
+    assert second.classify("ZÁRLATI DÍJ") == "SRVCHG"
+
+
+@pytest.mark.parametrize(
+    "text, error",
+    [
+        ("[descriptions]\nFOO = NOPE\n", "unknown trntype"),
+        ("[patterns]\n(unclosed = POS\n", "invalid pattern"),
+        ("[rules]\nFOO = POS\n", "unknown section"),
+    ],
+)
+def test_invalid_rule_files_are_rejected(tmp_path, text, error):
+    path = tmp_path / "bad.ini"
+    path.write_text(text, encoding="utf-8")
+    with pytest.raises(ValueError, match=error):
+        read_rules(str(path))
+
+
+def test_rule_file_with_flags_and_backreferences(tmp_path):
+    path = tmp_path / "rules.ini"
+    path.write_text("[patterns]\n(?i)^kp = CASH\n(\\d)\\1 = ATM\n", "utf-8")
+    classifier = load_classifier(str(path))
+    assert classifier.classify("KP befizetés") == "CASH"
+    assert classifier.classify("felvétel 1224") == "ATM"
+    assert classifier.classify("felvétel 1234") == "PAYMENT"
+
+
+def test_plugins_classify_with_the_rule_file(tmp_path):
+    from ofxstatement_otp.otp import OtpPlugin
+    from ofxstatement_otp.otp_legacy import OtpLegacyPlugin
+
+    path = tmp_path / "rules.ini"
+    path.write_text("[descriptions]\nVÁSÁRLÁS KÁRTYÁVAL = DEBIT\n", "utf-8")
+    settings = {"trntype_rules": str(path)}
+    for plugin, sample in ((OtpPlugin, NEW_SAMPLE), (OtpLegacyPlugin, OLD_SAMPLE)):
+        statement = plugin(None, settings).get_parser(str(sample)).parse()
+        spar = next(line for line in statement.lines if line.payee.startswith("SPAR"))
+        assert spar.trntype == "DEBIT"
@@ -0,0 +1,236 @@
+"""Tests for the low-level XLSX helpers shared by both plugins.
+
+The fixtures are the committed, anonymized sample exports in ``manual_test/``;
+each has exactly one hidden row.
+"""
+
+import io
+import mmap
+import re
+import zipfile
+
+import pytest
+
+from ofxstatement_otp import xlsx
+from ofxstatement_otp.xlsx import (
+    BufferReader,
+    SharedStrings,
+    column_index,
+    hidden_rows,
+    iter_rows,
+    load_workbook,
+    open_source,
+    sheet_path,
+    source_name,
+)
+from samples import NEW_SAMPLE, OLD_SAMPLE
+
+SHEET = "Tranzakciók"
+
+
+def test_hidden_rows_are_read_from_the_sheet_xml():
+    assert hidden_rows(str(NEW_SAMPLE), SHEET) == {18}
+    assert hidden_rows(str(OLD_SAMPLE), SHEET) == {10}
+
+
+def test_sheet_path_resolves_absolute_targets():
+    with zipfile.ZipFile(NEW_SAMPLE) as archive:
+        assert sheet_path(archive, SHEET) == "xl/worksheets/sheet1.xml"
+
+
+def test_sheet_path_resolves_relative_targets(tmp_path):
+    path = tmp_path / "relative.xlsx"
+    with zipfile.ZipFile(NEW_SAMPLE) as zin, zipfile.ZipFile(path, "w") as zout:
+        for name in zin.namelist():
+            data = zin.read(name)
+            if name == "xl/_rels/workbook.xml.rels":
+                data = data.replace(
+                    b'Target="/xl/worksheets/sheet1.xml"',
+                    b'Target="worksheets/sheet1.xml"',
+                )
+            zout.writestr(name, data)
+    with zipfile.ZipFile(path) as archive:
+        assert sheet_path(archive, SHEET) == "xl/worksheets/sheet1.xml"
+
+
+def test_sheet_path_unknown_sheet():
+    with zipfile.ZipFile(NEW_SAMPLE) as archive:
+        with pytest.raises(KeyError):
+            sheet_path(archive, "Nincs ilyen")
+
+
+def test_load_workbook_is_read_only():
+    workbook = load_workbook(str(NEW_SAMPLE))
+    try:
+        assert workbook.read_only
+    finally:
+        workbook.close()
+
+
+def _to_shared_strings(src, dst):
+    """Copy an xlsx, moving its inline strings into a shared string table
+    (as Excel itself writes them) and giving one string rich-text runs."""
+    with zipfile.ZipFile(src) as zin:
+        items = {name: zin.read(name) for name in zin.namelist()}
+    strings: list = []
+
+    def share(match):
+        strings.append(match.group(2))
+        return b'<c r="%s" t="s"><v>%d</v></c>' % (match.group(1), len(strings) - 1)
+
+    sheet = "xl/worksheets/sheet1.xml"
+    items[sheet] = re.sub(
+        rb'<c r="([A-Z]+[0-9]+)" t="inlineStr"><is><t>(.*?)</t></is></c>',
+        share,
+        items[sheet],
+    )
+    sis = [b"<si><t>%s</t></si>" % text for text in strings]
+    # The first string ("Számlatörténet") as two rich-text runs.
+    sis[0] = "<si><r><t>Számla</t></r><r><t>történet</t></r></si>".encode()
+    items["xl/sharedStrings.xml"] = (
+        b'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+        b' count="%d" uniqueCount="%d">' % (len(sis), len(sis))
+        + b"".join(sis)
+        + b"</sst>"
+    )
+    items["[Content_Types].xml"] = items["[Content_Types].xml"].replace(
+        b"</Types>",
+        b'<Override PartName="/xl/sharedStrings.xml" ContentType="application/'
+        b'vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+        b"</Types>",
+    )
+    items["xl/_rels/workbook.xml.rels"] = items["xl/_rels/workbook.xml.rels"].replace(
+        b"</Relationships>",
+        b'<Relationship Type="http://schemas.openxmlformats.org/officeDocument/'
+        b'2006/relationships/sharedStrings" Target="sharedStrings.xml" Id="rId9"/>'
+        b"</Relationships>",
+    )
+    with zipfile.ZipFile(dst, "w") as zout:
+        for name, data in items.items():
+            zout.writestr(name, data)
+
+
+def test_iter_rows_reads_inline_strings_numbers_and_hidden_flags():
+    rows = {
+        row: (values, hidden)
+        for row, values, hidden in iter_rows(NEW_SAMPLE, SHEET, 11)
+    }
+    values, hidden = rows[10]
+    assert values[:3] == ["11111111-22222222", None, "SPAR MAGYARORSZAG KFT"]
+    assert values[9] == -4990 and isinstance(values[9], int)
+    assert rows[17][0][9] == 12.5
+    assert rows[18][1] is True
+    assert not hidden
+    # Blank rows are padded to max_col.
+    assert rows[2] == ([None] * 11, False)
+
+
+def test_iter_rows_skips_converting_rejected_rows(tmp_path):
+    shared = tmp_path / "shared.xlsx"
+    _to_shared_strings(NEW_SAMPLE, shared)
+    seen = []
+
+    def skip_row(row, value):
+        seen.append(row)
+        return row > 9 and value.startswith("3333")
+
+    rows = {row: values for row, values, _ in iter_rows(shared, SHEET, 11, skip_row)}
+    assert rows[16] == ["33333333-44444444"] + [None] * 10
+    assert rows[15][2] == "Valami Bolt"
+    # called once per row with a column A cell
+    assert seen == sorted(set(seen)) and 16 in seen and 2 not in seen
+
+
+def test_iter_rows_resolves_shared_strings(tmp_path):
+    shared = tmp_path / "shared.xlsx"
+    _to_shared_strings(NEW_SAMPLE, shared)
+    # Identical to the inline-string original, rich-text cell included.
+    expected = list(iter_rows(NEW_SAMPLE, SHEET, 11))
+    assert list(iter_rows(shared, SHEET, 11)) == expected
+
+
+def test_shared_strings_are_read_on_demand(tmp_path, monkeypatch):
+    shared = tmp_path / "shared.xlsx"
+    _to_shared_strings(NEW_SAMPLE, shared)
+    # The table is fed to the parser chunk by chunk; make chunks tiny so the
+    # sample's table spans many of them.
+    monkeypatch.setattr(xlsx, "CHUNK_SIZE", 64)
+    with zipfile.ZipFile(shared) as archive:
+        strings = SharedStrings(archive)
+        assert strings[1] == "Számlaszám"
+        assert 2 <= len(strings._strings) < 10
+        assert strings[20]
+        strings.close()
+
+
+@pytest.mark.parametrize(
+    "ref, index", [("A1", 0), ("K12", 10), ("Z3", 25), ("AA3", 26), ("AB1", 27)]
+)
+def test_column_index(ref, index):
+    assert column_index(ref) == index
+
+
+def test_buffer_reader_reads_and_seeks():
+    reader = BufferReader(bytearray(b"0123456789"))
+    assert reader.read(3) == b"012"
+    assert reader.seek(-2, io.SEEK_END) == 8
+    assert reader.read() == b"89"
+    assert reader.read(5) == b""
+    reader.seek(4)
+    target = bytearray(3)
+    assert reader.readinto(target) == 3
+    assert target == b"456"
+    assert reader.tell() == 7
+
+
+def test_open_source():
+    assert open_source("statement.xlsx") == "statement.xlsx"
+    assert open_source(NEW_SAMPLE) == NEW_SAMPLE
+    with open(NEW_SAMPLE, "rb") as f:
+        assert open_source(f) is f
+    assert isinstance(open_source(b"PK"), BufferReader)
+    assert isinstance(open_source(memoryview(b"PK")), BufferReader)
+    with open(NEW_SAMPLE, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mapped:
+        reader = open_source(mapped)
+        # read in place, not copied out through mmap.read
+        assert isinstance(reader, BufferReader)
+        assert reader.read(2) == b"PK"
+    with pytest.raises(TypeError, match="got int"):
+        open_source(42)
+
+
+def test_open_source_reads_streams_that_cannot_seek():
+    class Pipe(io.RawIOBase):
+        name = "upload"
+
+        def __init__(self, data):
+            self.data = data
+
+        def readable(self):
+            return True
+
+        def read(self, size=-1):
+            data, self.data = self.data, b""
+            return data
+
+    source = open_source(Pipe(NEW_SAMPLE.read_bytes()))
+    assert isinstance(source, BufferReader)
+    assert source_name(source) == "upload"
+    assert hidden_rows(source, SHEET) == {18}
+
+
+def test_source_name():
+    assert source_name(NEW_SAMPLE) == str(NEW_SAMPLE)
+    assert source_name(b"PK") == "<bytes>"
+    assert source_name(io.BytesIO(b"PK")) == "<stream>"
+
+
+def test_sheets_are_read_from_memory():
+    data = NEW_SAMPLE.read_bytes()
+    source = open_source(data)
+
+    assert hidden_rows(source, SHEET) == {18}
+    from_memory = list(iter_rows(source, SHEET))
+    assert from_memory == list(iter_rows(str(NEW_SAMPLE), SHEET))